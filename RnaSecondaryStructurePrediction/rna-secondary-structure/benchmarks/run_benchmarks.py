@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#pylint: disable=
+"""
+File            : run_benchmarks.py
+Author          : Aurimas Repecka <aurimas.repecka AT gmail dot com>
+Description     : Throughput benchmarks of candidate enumeration, scoring, folding, rendering and sequence generation.
+                  Deterministic fake CoFold from bin/ is used unless --real-cofold is given, report is written as JSON.
+Packages        :   https://www.tbi.univie.ac.at/RNA/#download (optional, vienna backend and rendering only)
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import itertools
+import subprocess
+
+BENCHMARKS_PATH = os.path.dirname(os.path.abspath(__file__))
+FAKE_COFOLD_PATH = os.path.join(BENCHMARKS_PATH, 'bin')
+DATA_PATH = os.path.join(BENCHMARKS_PATH, '..', '_data')
+REPORTS_PATH = os.path.join(BENCHMARKS_PATH, 'reports')
+
+# benchmark folds never go to experiment cache, environment must be set before folding module is imported
+os.environ.setdefault('FOLD_CACHE_PATH', os.path.join(tempfile.mkdtemp(prefix='benchmarks-'), 'folds.sqlite'))
+
+sys.path.append(os.path.join(BENCHMARKS_PATH, '..', 'utils'))
+sys.path.append(os.path.join(BENCHMARKS_PATH, '..', 'sequence-generation'))
+import numpy as np
+
+import folding
+import results
+import scoring
+import metrics
+import cofold_pool
+
+BENCHMARKS = ['enumeration', 'scoring', 'fold', 'render', 'end_to_end']
+FOLD_LENGTHS = [132, 140, 200, 555]
+PARAMETERS_PATH = os.path.join(DATA_PATH, 'parameters', 'rna_turner2004.par')
+NUCLEOTIDES_DICT = ['A', 'T', 'G', 'C']
+
+ALPHA = 0.5
+TAU = 640
+REPEATS = 5
+SEED = 0
+ENUMERATION_LENGTH = 8
+SCORING_COUNT = 5000
+# all-vs-all compares every pair, so it uses fewer structures
+ALL_VS_ALL_COUNT = 1000
+FOLD_COUNT = 64
+RENDER_COUNT = 20
+END_TO_END_NZONE = [119, 123]
+# relative drop of throughput against baseline which is reported as regression
+REGRESSION_THRESHOLD = 0.2
+
+
+def read_construct(structure_length):
+    '''
+    Reads wild type sequence and structure of given length
+    param structure_length: length of construct
+    returns: tuple (sequence string, dot-bracket structure)
+    '''
+
+    with open(os.path.join(DATA_PATH, 'sequences', 'wt_p%d.fasta' % structure_length)) as fin:
+        sequence = fin.read().split('\n')[1].strip()
+    with open(os.path.join(DATA_PATH, 'secondary-structures', 'wt_p%d.dat' % structure_length)) as fin:
+        structure = fin.read().strip()
+    return sequence, structure
+
+
+def point_mutants(sequence, count, rng):
+    '''
+    Random single substitution mutants, different mutants keep folds away from any cache
+    param sequence: sequence string
+    param count: count of mutants
+    param rng: random.Random object
+    returns: list of sequence strings
+    '''
+
+    res = []
+    for _ in range(count):
+        idx = rng.randrange(len(sequence))
+        nucleotide = rng.choice([elem for elem in NUCLEOTIDES_DICT if elem != sequence[idx]])
+        res.append(sequence[:idx] + nucleotide + sequence[idx + 1:])
+    return res
+
+
+def measure(func, items, repeats=REPEATS, setup=None):
+    '''
+    Runs function several times and summarizes wall time
+    param func: function without arguments
+    param items: count of items processed by single call
+    param repeats: count of calls
+    param setup: function without arguments called before every call, its time is not measured
+    returns: dictionary of benchmark result
+    '''
+
+    timings = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {'status' : 'ok', 'repeats' : repeats, 'items' : items,
+            'seconds' : {'min' : min(timings), 'median' : float(np.median(timings)), 'mean' : float(np.mean(timings))},
+            'items_per_second' : items / min(timings) if min(timings) > 0 else None}
+
+
+def skipped(reason):
+    "Result of benchmark which could not run"
+    return {'status' : 'skipped', 'reason' : reason}
+
+
+def random_structures(reference, count, rng):
+    '''
+    Random balanced structures of the same length and count of base pairs as reference
+    param reference: dot-bracket structure
+    param count: count of structures
+    param rng: random.Random object
+    returns: list of dot-bracket structures
+    '''
+
+    pairs = reference.count('(')
+    res = []
+    for _ in range(count):
+        brackets, opened, depth = [], 0, 0
+        while opened < pairs or depth:
+            if opened < pairs and (not depth or rng.random() < 0.5):
+                brackets.append('(')
+                opened, depth = opened + 1, depth + 1
+            else:
+                brackets.append(')')
+                depth = depth - 1
+        structure = ['.'] * len(reference)
+        for position, bracket in zip(sorted(rng.sample(range(len(reference)), 2 * pairs)), brackets):
+            structure[position] = bracket
+        res.append(''.join(structure))
+    return res
+
+
+def bench_enumeration(repeats):
+    '''
+    Candidate enumeration - fragment strings from itertools.product against decoding of base-4 codes
+    param repeats: count of calls
+    returns: dictionary of benchmark name to result
+    '''
+
+    count = len(NUCLEOTIDES_DICT) ** ENUMERATION_LENGTH
+    codes = np.arange(count)
+    return {
+        'enumeration.product' : measure(lambda: [''.join(fragment) for fragment in itertools.product(NUCLEOTIDES_DICT,
+                                                 repeat=ENUMERATION_LENGTH)], count, repeats),
+        'enumeration.decode' : measure(lambda: results.decode_fragments(codes, ENUMERATION_LENGTH, NUCLEOTIDES_DICT),
+                                       count, repeats),
+    }
+
+
+def bench_scoring(repeats):
+    '''
+    Scoring of structures and fragments - check_diff and check_diff_mut loops against batch scoring, pair table metrics
+    param repeats: count of calls
+    returns: dictionary of benchmark name to result
+    '''
+
+    rng = random.Random(SEED)
+    _, reference = read_construct(140)
+    structures = random_structures(reference, SCORING_COUNT, rng)
+    fragments = [''.join(rng.choice(NUCLEOTIDES_DICT) for _ in range(ENUMERATION_LENGTH)) for _ in range(SCORING_COUNT)]
+    fragment = fragments[0]
+    return {
+        'scoring.check_diff' : measure(lambda: [scoring.check_diff(reference, structure) for structure in structures],
+                                       SCORING_COUNT, repeats),
+        'scoring.accuracy_batch' : measure(lambda: scoring.accuracy_batch(structures, [reference]), SCORING_COUNT, repeats),
+        'scoring.check_diff_mut' : measure(lambda: [scoring.check_diff_mut(fragment, elem) for elem in fragments],
+                                           SCORING_COUNT, repeats),
+        'scoring.mutations_batch' : measure(lambda: scoring.mutations_batch(fragments, fragment), SCORING_COUNT, repeats),
+        'metrics.bp_distance' : measure(lambda: metrics.bp_distance(structures, reference), SCORING_COUNT, repeats),
+        'metrics.all_vs_all' : measure(lambda: metrics.all_vs_all(structures[:ALL_VS_ALL_COUNT]),
+                                       ALL_VS_ALL_COUNT * (ALL_VS_ALL_COUNT - 1) // 2, repeats),
+    }
+
+
+def bench_fold(repeats, backends):
+    '''
+    Fold throughput of every backend at every structure length, cache is not used
+    param repeats: count of calls
+    param backends: list of backend names
+    returns: dictionary of benchmark name to result
+    '''
+
+    rng = random.Random(SEED)
+    res = {}
+    for backend in backends:
+        try:
+            folder = folding.get_folder(ALPHA, TAU, PARAMETERS_PATH, backend, cache_path=None)
+        except ImportError as err:
+            res.update(('fold.%s.%d' % (backend, length), skipped(str(err))) for length in FOLD_LENGTHS)
+            continue
+        for length in FOLD_LENGTHS:
+            sequence, _ = read_construct(length)
+            batches = [point_mutants(sequence, FOLD_COUNT, rng) for _ in range(repeats + 1)]
+            # first batch starts worker processes and is not measured
+            folder.fold_many(batches.pop())
+            res['fold.%s.%d' % (backend, length)] = measure(lambda: folder.fold_many(batches.pop()), FOLD_COUNT, repeats)
+    cofold_pool.close_pools()
+    return res
+
+
+def bench_render(repeats):
+    '''
+    SVG rendering of structures with ViennaRNA
+    param repeats: count of calls
+    returns: dictionary of benchmark name to result
+    '''
+
+    try:
+        import RNA
+        import rendering
+    except ImportError as err:
+        return {'render.svg' : skipped(str(err))}
+
+    sequence, structure = read_construct(140)
+    output_path = tempfile.mkdtemp(prefix='benchmarks-svg-')
+    tasks = [(sequence, structure, os.path.join(output_path, '%d.svg' % idx)) for idx in range(RENDER_COUNT)]
+    return {'render.svg' : measure(lambda: [rendering.render_svg(task) for task in tasks], RENDER_COUNT, repeats)}
+
+
+def bench_end_to_end(repeats, backend):
+    '''
+    End-to-end generate_sequences_fold over short NZONE range, fold cache is emptied before every call
+    param repeats: count of calls
+    param backend: name of folding backend
+    returns: dictionary of benchmark name to result
+    '''
+
+    try:
+        import sequence_generation
+    except ImportError as err:
+        return {'end_to_end.generate_sequences_fold' : skipped(str(err))}
+
+    fragments_count = len(NUCLEOTIDES_DICT) ** (END_TO_END_NZONE[1] - END_TO_END_NZONE[0])
+    sequence_path = os.path.join(DATA_PATH, 'sequences', 'wt_p140.fasta')
+    structure_path = os.path.join(DATA_PATH, 'secondary-structures', 'wt_p140.dat')
+    cache = folding.get_folder(ALPHA, TAU, PARAMETERS_PATH, backend).cache
+
+    def run():
+        sequence_generation.generate_sequences_fold(sequence_path, structure_path, PARAMETERS_PATH, ALPHA, TAU,
+                                                    END_TO_END_NZONE, 1, backend, 'none')
+
+    return {'end_to_end.generate_sequences_fold' : measure(run, fragments_count, repeats, cache.clear)}
+
+
+def environment_info():
+    "Describes machine and code version of report"
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=BENCHMARKS_PATH, stderr=subprocess.DEVNULL,
+                                         universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'created' : time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit' : commit, 'python' : platform.python_version(),
+            'platform' : platform.platform(), 'cpu_count' : os.cpu_count(), 'numpy' : np.__version__,
+            'cofold' : cofold_pool.cofold_version()}
+
+
+def compare_reports(report, baseline, threshold=REGRESSION_THRESHOLD):
+    '''
+    Compares throughput of every benchmark with baseline report
+    param report: current report dictionary
+    param baseline: baseline report dictionary
+    param threshold: relative drop of throughput which is regression
+    returns: list of tuples (benchmark name, baseline items per second, current items per second)
+    '''
+
+    res = []
+    for name, result in sorted(report['benchmarks'].items()):
+        base = baseline.get('benchmarks', {}).get(name, {})
+        if result.get('status') != 'ok' or base.get('status') != 'ok':
+            continue
+        if base['items_per_second'] and result['items_per_second'] < base['items_per_second'] * (1.0 - threshold):
+            res.append((name, base['items_per_second'], result['items_per_second']))
+    return res
+
+
+def parse_arguments():
+    '''Parsing given arguments'''
+
+    parser = argparse.ArgumentParser(description='Throughput benchmarks with JSON report')
+    parser.add_argument('--only', type=str, nargs='+', default=BENCHMARKS, choices=BENCHMARKS, help='Benchmark groups to run')
+    parser.add_argument('--backends', type=str, nargs='+', default=folding.BACKENDS, choices=folding.BACKENDS,
+                        help='Folding backends of fold benchmarks')
+    parser.add_argument('--repeats', type=int, default=REPEATS, help='Count of calls of every benchmark')
+    parser.add_argument('--real-cofold', action='store_true', help='Use CoFold from PATH instead of deterministic fake')
+    parser.add_argument('--output', type=str, default=None, help='JSON report file, defaults to reports/<time>.json')
+    parser.add_argument('--compare', type=str, default=None, help='Baseline JSON report, regressions fail the run')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD, help='Relative throughput drop of regression')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    if not args.real_cofold:
+        os.environ['PATH'] = FAKE_COFOLD_PATH + os.pathsep + os.environ.get('PATH', '')
+
+    report = {'environment' : environment_info(), 'benchmarks' : {}}
+    for group in args.only:
+        print("Running %s benchmarks" % group)
+        if group == 'enumeration':
+            report['benchmarks'].update(bench_enumeration(args.repeats))
+        elif group == 'scoring':
+            report['benchmarks'].update(bench_scoring(args.repeats))
+        elif group == 'fold':
+            report['benchmarks'].update(bench_fold(args.repeats, args.backends))
+        elif group == 'render':
+            report['benchmarks'].update(bench_render(args.repeats))
+        elif group == 'end_to_end':
+            report['benchmarks'].update(bench_end_to_end(args.repeats, args.backends[0]))
+
+    for name, result in sorted(report['benchmarks'].items()):
+        if result['status'] == 'ok':
+            print("%-40s %12.1f items/s  median %.4f s" % (name, result['items_per_second'], result['seconds']['median']))
+        else:
+            print("%-40s skipped: %s" % (name, result['reason']))
+
+    output_path = args.output or os.path.join(REPORTS_PATH, time.strftime('%Y%m%d-%H%M%S') + '.json')
+    if os.path.dirname(output_path) and not os.path.exists(os.path.dirname(output_path)):
+        os.makedirs(os.path.dirname(output_path))
+    with open(output_path, 'w') as fout:
+        json.dump(report, fout, indent=2, sort_keys=True)
+    print("Report: %s" % output_path)
+
+    if args.compare:
+        with open(args.compare) as fin:
+            regressions = compare_reports(report, json.load(fin), args.threshold)
+        for name, base, current in regressions:
+            print("Regression %s: %.1f -> %.1f items/s" % (name, base, current))
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -10,20 +10,40 @@ Packages        :   https://www.tbi.univie.ac.at/RNA/#download
 """
 
 import os
+import sys
 import RNA
+import argparse
 import numpy as np
 from IPython import embed
 
 import plotly.plotly as py
 import plotly.graph_objs as go
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+import folding
+import parallel
+import results
+import sharding
+import journal as journal_lib
+from scoring import check_diff
+
 APLHA_RANGE = 100
 TAU_RANGE = 100
+BACKEND = 'cofold'
+
+ALPHA_LIMITS = (0.0, 1.0)
+TAU_LIMITS = (0.0, 1000.0)
+COARSE_POINTS = 11
+REFINE_DEPTH = 4
+REFINE_KEEP = 5
 
 SEQUENCE_FILE = '../_data/output/sequence-generation/step-wise-accuracies/p132/wt_p132.fasta'
 STRUCTURE_PATH = '../_data/output/sequence-generation/step-wise-accuracies/p132/wt_p132.dat'
 PARAMETERS_PATH = '../_data/parameters/rna_andronescu2007.par'
 
+REFERENCES = [('../_data/sequences/%s.fasta' % name, '../_data/secondary-structures/%s.dat' % name)
+              for name in ['wt_p132', 'wt_p140', 'pMM1_p140', 'pMM4_p140', 'pMM7_p140', 'pEW2705_p140']]
+
 
 
 def read_file(file_path):
@@ -38,23 +58,48 @@ def read_file(file_path):
         fstr = fin.read()
     return fstr
 
-def check_diff(struc_1, struc_2):
+def point_accuracy(task):
+    '''
+    Folds sequence with alpha and tau of grid point
+    param task: dictionary with alpha, tau, sequence, header, base_structure, parameters_path and backend
+    returns: accuracy of folded structure
+    '''
+
+    sec_struc = folding.get_folder(task['alpha'], task['tau'], task['parameters_path'], task['backend'], workers=1).fold(
+        task['sequence'], task['header'])[0]
+    return check_diff(task['base_structure'], sec_struc)
+
+
+def point_key(alpha, tau):
+    '''
+    Journal key of grid point
+    param alpha: alpha parameter
+    param tau: tau parameter
+    returns: string
+    '''
+
+    return '%r|%r' % (float(alpha), float(tau))
+
+
+def journal_config(mode, backend = BACKEND):
     '''
-    Check position-wise accuracy of two structures
-    param struc_1: dot-bracket structure of sequence 1
-    param struc_2: dot-bracket structure of sequence 2
-    returns: similarity between two structures percentage
+    Configuration of grid or search kept in journal, points of other configuration are not resumed
+    param mode: grid or search
+    param backend: name of folding backend - cofold or vienna
+    returns: dictionary
     '''
 
-    corr = 0
-    for idx, val in enumerate(struc_2):
-        if val == struc_1[idx]:
-            corr = corr + 1
-    return corr/len(struc_1)
+    config = {'mode' : mode, 'parameters_path' : os.path.abspath(PARAMETERS_PATH), 'backend' : backend}
+    if mode == 'grid':
+        config.update(sequence_file=SEQUENCE_FILE, structure_path=STRUCTURE_PATH, alpha_range=APLHA_RANGE, tau_range=TAU_RANGE)
+    else:
+        config.update(references=REFERENCES, coarse_points=COARSE_POINTS, depth=REFINE_DEPTH, keep=REFINE_KEEP)
+    return config
 
 
 def check_param_accuracy(alpha_range = APLHA_RANGE, tau_range = TAU_RANGE, 
-                        sequence_file = SEQUENCE_FILE, structure_path = STRUCTURE_PATH, parameters_path = PARAMETERS_PATH):
+                        sequence_file = SEQUENCE_FILE, structure_path = STRUCTURE_PATH, parameters_path = PARAMETERS_PATH,
+                        backend = BACKEND, jobs = 1, journal = None, shard = None):
     '''
     Loops between two parameters alpha and tau and checks cofold accuracy
     param alpha_range: number how many points between range 0 and 1 should be analysed as alpha
@@ -62,30 +107,161 @@ def check_param_accuracy(alpha_range = APLHA_RANGE, tau_range = TAU_RANGE,
     param sequence_file: file path of analysed sequence
     param structure_path: path of correct dot-bracket structure of given sequence
     param parameters_path: path of parameters used by CoFold
-    returns: arrays of alpha, tau and accuracy
+    param backend: name of folding backend - cofold or vienna
+    param jobs: count of processes
+    param journal: Journal object of finished grid points, resumed grid folds only points missing in journal
+    param shard: tuple (index, count), only points of shard are folded
+    returns: arrays of alpha, tau and accuracy, quarantined points and points of other shards have NaN accuracy
     '''
 
     base_structure = read_file(structure_path)
+    sequence_data = read_file(sequence_file).split("\n")
     x = np.linspace(0,1,alpha_range)
     y = np.linspace(0,1000, tau_range)
-    z, z_ = [], []
+    task = {'sequence' : sequence_data[1], 'header' : sequence_data[0], 'base_structure' : base_structure,
+            'parameters_path' : parameters_path, 'backend' : backend}
+    tasks = [(point_key(alpha, tau), dict(task, alpha=alpha, tau=tau)) for tau in y for alpha in x]
+
+    accuracies = dict((key, journal.get(key)) for key, _ in tasks if journal is not None and journal.get(key) is not None)
+    for key, corr_perc in journal_lib.run_journaled(point_accuracy, sharding.shard_items(tasks, shard), jobs, journal):
+        print("%sx%s" % tuple(key.split('|')))
+        accuracies[key] = corr_perc
+    missing = sum(1 for key, _ in sharding.shard_items(tasks, shard) if key not in accuracies)
+    if missing:
+        print("%d grid points failed to fold%s" % (missing, ', resume --journal to retry them' if journal is not None else ''))
+    z = np.asarray([accuracies.get(key, np.nan) for key, _ in tasks]).reshape(len(y), len(x))
+
+    return x, y, z
+
+
+def grid_table(x, y, z, shard = None):
+    '''
+    Converts grid to typed table with one row for every point in order of check_param_accuracy
+    param x: array of alpha
+    param y: array of tau
+    param z: array of accuracy of shape (tau, alpha)
+    param shard: tuple (index, count), keeps only points of shard
+    returns: structured array with alpha, tau and accuracy columns
+    '''
+
+    alphas, taus = np.meshgrid(x, y)
+    table = np.empty(alphas.size, dtype=[('alpha', np.float64), ('tau', np.float64), ('accuracy', np.float32)])
+    table['alpha'], table['tau'], table['accuracy'] = alphas.ravel(), taus.ravel(), np.asarray(z).ravel()
+    return sharding.shard_items(table, shard)
+
+
+def read_references(references = REFERENCES):
+    """
+    Reads reference sequences and their correct structures
+    :param references: list of tuples (sequence file path, structure file path)
+    :raises: file not found error
+    :returns: list of tuples (header, sequence, dot-bracket structure)
+    """
+
+    res = []
+    for sequence_file, structure_path in references:
+        sequence_data = read_file(sequence_file).split("\n")
+        res.append((sequence_data[0].strip(), sequence_data[1].strip(), read_file(structure_path).strip()))
+    return res
 
-    for tau in y:
-        for alpha in x:
 
-            cmd_out = os.popen('CoFold -d1 --noPS --distAlpha %.5f --distTau %.5f --paramFile=%s < %s' % (alpha, tau, parameters_path, sequence_file)).read()
-            sec_struc = (cmd_out.split('\n')[2]).split(' ')[0]
-            corr_perc = check_diff(base_structure, sec_struc)
-            print("%sx%s" % (str(alpha), str(tau)))
-            z_.append(corr_perc)
+def mean_accuracy(task):
+    '''
+    Folds every reference with given parameters and averages accuracy
+    param task: dictionary with alpha, tau, references, parameters_path, backend and workers
+    returns: tuple (alpha, tau, mean accuracy)
+    '''
 
-        z.append(z_)
-        z_ = []
-    z = np.asarray(z)
+    folder = folding.get_folder(task['alpha'], task['tau'], task['parameters_path'], task['backend'], workers=task['workers'])
+    folds = folder.fold_many([sequence for _, sequence, _ in task['references']])
+    accuracies = [check_diff(structure, fold[0]) for (_, _, structure), fold in zip(task['references'], folds)]
+    return task['alpha'], task['tau'], sum(accuracies) / len(accuracies)
+
+
+def refine_points(best, alpha_step, tau_step, sampled):
+    '''
+    Builds grid of not yet sampled points around best points with half of previous step
+    param best: list of tuples (alpha, tau) around which grid is refined
+    param alpha_step: previous alpha step
+    param tau_step: previous tau step
+    param sampled: dictionary of already sampled points
+    returns: list of tuples (alpha, tau)
+    '''
+
+    res = []
+    for alpha, tau in best:
+        for d_alpha in (-alpha_step / 2, 0, alpha_step / 2):
+            for d_tau in (-tau_step / 2, 0, tau_step / 2):
+                point = (round(alpha + d_alpha, 6), round(tau + d_tau, 6))
+                if ALPHA_LIMITS[0] <= point[0] <= ALPHA_LIMITS[1] and TAU_LIMITS[0] <= point[1] <= TAU_LIMITS[1] \
+                   and point not in sampled and point not in res:
+                    res.append(point)
+    return res
+
+
+def samples_to_grid(sampled):
+    '''
+    Spreads scattered samples over rectangular grid, every grid node gets accuracy of nearest sampled point
+    param sampled: dictionary of (alpha, tau) to accuracy
+    returns: arrays of alpha, tau and accuracy in the same layout as check_param_accuracy
+    '''
 
+    points = np.array(list(sampled.keys()))
+    values = np.array(list(sampled.values()))
+    x = np.unique(points[:, 0])
+    y = np.unique(points[:, 1])
+    alphas, taus = np.meshgrid(x, y)
+    # distances are measured in units of parameter ranges so both axes weigh the same
+    d_alpha = (alphas.ravel()[:, np.newaxis] - points[:, 0]) / (ALPHA_LIMITS[1] - ALPHA_LIMITS[0])
+    d_tau = (taus.ravel()[:, np.newaxis] - points[:, 1]) / (TAU_LIMITS[1] - TAU_LIMITS[0])
+    nearest = np.argmin(d_alpha ** 2 + d_tau ** 2, axis=1)
+    z = values[nearest].reshape(alphas.shape)
     return x, y, z
 
 
+def search_param_accuracy(references = REFERENCES, parameters_path = PARAMETERS_PATH, backend = BACKEND,
+                          coarse_points = COARSE_POINTS, depth = REFINE_DEPTH, keep = REFINE_KEEP, jobs = 1, journal = None):
+    '''
+    Searches alpha and tau with best mean accuracy over references: coarse grid first,
+    then grid is repeatedly refined around the best points
+    param references: list of tuples (sequence file path, structure file path)
+    param parameters_path: path of parameters used by CoFold
+    param backend: name of folding backend - cofold or vienna
+    param coarse_points: number of points of coarse grid on every axis
+    param depth: number of refinement rounds
+    param keep: number of best points refined in every round
+    param jobs: count of processes
+    param journal: Journal object of finished points, resumed search folds only points missing in journal
+    returns: arrays of alpha, tau and accuracy
+    '''
+
+    references = read_references(references)
+    task = {'references' : references, 'parameters_path' : parameters_path, 'backend' : backend,
+            'workers' : parallel.workers_per_job(jobs)}
+    alpha_step = (ALPHA_LIMITS[1] - ALPHA_LIMITS[0]) / (coarse_points - 1)
+    tau_step = (TAU_LIMITS[1] - TAU_LIMITS[0]) / (coarse_points - 1)
+    points = [(round(alpha, 6), round(tau, 6)) for tau in np.linspace(TAU_LIMITS[0], TAU_LIMITS[1], coarse_points)
+              for alpha in np.linspace(ALPHA_LIMITS[0], ALPHA_LIMITS[1], coarse_points)]
+    sampled = {}
+
+    for level in range(depth + 1):
+        tasks = [(point_key(alpha, tau), dict(task, alpha=alpha, tau=tau)) for alpha, tau in points]
+        for alpha, tau in points:
+            if journal is not None and journal.get(point_key(alpha, tau)) is not None:
+                sampled[(alpha, tau)] = journal.get(point_key(alpha, tau))
+        for _, (alpha, tau, accuracy) in journal_lib.run_journaled(mean_accuracy, tasks, jobs, journal,
+                                                                   lambda res: res[2]):
+            sampled[(alpha, tau)] = accuracy
+        best = sorted(sampled, key=lambda point: sampled[point], reverse=True)[:keep]
+        print("Level %d: %d points sampled, best %sx%s (%.5f)" % (level, len(sampled), best[0][0], best[0][1], sampled[best[0]]))
+        points = refine_points(best, alpha_step, tau_step, sampled)
+        alpha_step, tau_step = alpha_step / 2, tau_step / 2
+        if not points:
+            break
+
+    return samples_to_grid(sampled)
+
+
 def plot_surface_chart(title, x, y, z, xaxis, yaxis, zaxis, filename):
     '''
     Plots surface 3D chart in polt.ly servers
@@ -114,7 +290,8 @@ def plot_surface_chart(title, x, y, z, xaxis, yaxis, zaxis, filename):
     py.iplot(fig, filename=filename)
 
 
-def check_structure_accuracy(alpha, tau, sequence_file = SEQUENCE_FILE, structure_path = STRUCTURE_PATH, parameters_path = PARAMETERS_PATH):
+def check_structure_accuracy(alpha, tau, sequence_file = SEQUENCE_FILE, structure_path = STRUCTURE_PATH, parameters_path = PARAMETERS_PATH,
+                             backend = BACKEND):
     '''
     Checks sequence secondary structure accuracy and plots it in svg
     param alpha: alpha parameter of CoFold execution
@@ -122,27 +299,57 @@ def check_structure_accuracy(alpha, tau, sequence_file = SEQUENCE_FILE, structur
     param sequence_file: file path of analysed sequence
     param structure_path: path of correct dot-bracket structure of given sequence
     param parameters_path: path of parameters used by CoFold
+    param backend: name of folding backend - cofold or vienna
     '''
 
     base_structure = read_file(structure_path)
-    cmd_out = os.popen('CoFold -d1 --noPS --distAlpha %.5f --distTau %.5f --paramFile=%s < %s' % (alpha, tau, parameters_path, sequence_file)).read()
-    #cmd_out = os.popen('RNAfold -d1 --noPS < %s' % (sequence_file)).read()
-    print(cmd_out)
+    sequence_data = read_file(sequence_file).split("\n")
+    filename = sequence_data[0].strip()[1:]
+    sequence = sequence_data[1].strip()
+    sec_struc, mfe = folding.get_folder(alpha, tau, parameters_path, backend).fold(sequence, sequence_data[0])
+    print("%s\n%s\n%s (%6.2f)" % (sequence_data[0].strip(), sequence, sec_struc, mfe))
 
-    filename = cmd_out.split('\n')[0][1:]
-    sequence = cmd_out.split('\n')[1]
-    sec_struc = (cmd_out.split('\n')[2]).split(' ')[0]
     corr_perc = check_diff(base_structure, sec_struc)
 
     RNA.svg_rna_plot(sequence, sec_struc, "%s_%.5f.svg" % (filename, corr_perc))
 
 
-def main():
+def parse_arguments():
+    '''Parsing given arguments'''
 
-    #x, y, z = check_param_accuracy(APLHA_RANGE, TAU_RANGE, SEQUENCE_FILE, STRUCTURE_PATH)
-    #plot_surface_chart("CoFold Parameters analysis", x, y, z, 'Alpha', 'Tau', 'Accuracy(%)', 'CoFold Parameters analysis (Turner 1999)')
+    parser = argparse.ArgumentParser(description='Analysing CoFold parameters')
+    parser.add_argument('--mode', type=str, default='structure', choices=['structure', 'grid', 'search'],
+                        help='Single structure, full alpha x tau grid or refined search of parameters')
+    parser.add_argument('--jobs', type=int, default=1, help='Count of processes used for folding')
+    parser.add_argument('--journal', type=str, default=None, help='Journal file of finished grid points')
+    parser.add_argument('--resume', action='store_true', help='Skip grid points which are finished in --journal, failed points are retried')
+    parser.add_argument('--shard', type=sharding.parse_shard, default=None, metavar='i/N',
+                        help='Fold shard i of N of grid points, --output gets .shard-i-of-N suffix')
+    parser.add_argument('--output', type=str, default=None, help='File of grid table (.npy or .parquet)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    if args.mode == 'structure':
+        check_structure_accuracy(0.5, 640, sequence_file = SEQUENCE_FILE, structure_path = STRUCTURE_PATH, parameters_path = PARAMETERS_PATH)
+        return
 
-    check_structure_accuracy(0.5, 640, sequence_file = SEQUENCE_FILE, structure_path = STRUCTURE_PATH, parameters_path = PARAMETERS_PATH)
+    journal = journal_lib.Journal(args.journal, args.resume, journal_config(args.mode)) if args.journal else None
+    try:
+        if args.mode == 'grid':
+            x, y, z = check_param_accuracy(APLHA_RANGE, TAU_RANGE, SEQUENCE_FILE, STRUCTURE_PATH, jobs=args.jobs, journal=journal,
+                                           shard=args.shard)
+            if args.output:
+                results.save_table(grid_table(x, y, z, args.shard), sharding.shard_path(args.output, args.shard))
+            if args.shard is not None:
+                return
+        else:
+            x, y, z = search_param_accuracy(REFERENCES, PARAMETERS_PATH, jobs=args.jobs, journal=journal)
+    finally:
+        if journal is not None:
+            journal.close()
+    plot_surface_chart("CoFold Parameters analysis", x, y, z, 'Alpha', 'Tau', 'Accuracy(%)', 'CoFold Parameters analysis (Turner 1999)')
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -9,13 +9,20 @@ Packages        : https://www.tbi.univie.ac.at/RNA/#download
 """
 
 import os
+import sys
 import argparse
+import itertools
 from datetime import datetime
 
-from IPython import embed
-
 import RNA
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+import parallel
+import outputs
+
+RESULTS_FILE = "results.tsv"
+RESULTS_HEADER = "window\tfixation\titeration\tstart\tend\tmfe\tstructure\n"
+
 class OptionParser():
     def __init__(self):
         "User based option parser"
@@ -24,10 +31,14 @@ class OptionParser():
             dest="sequence", default="", help="Destination of sequence file")
         self.parser.add_argument("--output", action="store", required=True,
             dest="output", default="", help="Directory where output will be stored")
-        self.parser.add_argument("--window", action="store", type=int, required=True,
-            dest="window", default=20, help="How much of sequence is shown in one iteration")
-        self.parser.add_argument("--fixation", action="store", type=int, required=True,
-            dest="fixation", default=10, help="Count of nucleotides that should be fixed after iteration")
+        self.parser.add_argument("--window", action="store", type=int, nargs="+", required=True,
+            dest="window", default=[20], help="How much of sequence is shown in one iteration, several values may be given")
+        self.parser.add_argument("--fixation", action="store", type=int, nargs="+", required=True,
+            dest="fixation", default=[10], help="Count of nucleotides that should be fixed after iteration, several values may be given")
+        self.parser.add_argument("--jobs", action="store", type=int,
+            dest="jobs", default=1, help="Count of processes folding window/fixation settings in parallel")
+        self.parser.add_argument("--svg", action="store_true",
+            dest="svg", default=False, help="Plot final structure of every window/fixation setting")
 
 def file_exists(file_path):
     """
@@ -81,31 +92,107 @@ def init(ouput_dir, opts):
     """
 
     now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    working_dir = ouput_dir + "/" + now
-    # Creates execution directory
-    os.mkdir(working_dir)
+    # Creates execution directory, runs started in the same second get numbered directories
+    working_dir = outputs.unique_dir(ouput_dir, now)
     os.chdir(working_dir)
 
     # Writes parameters of execution to file
     write_file("parameters.txt", str(vars(opts)))
 
-def write_iteration_results(seq, seq_count, rna_fold, final=False):
+def read_sequence(file_path):
     """
-    Writes iteration results: dot-bracket form, mfe and svg picture
-    :param seq: string of sequence that was folded
-    :param seq_count: integer that defines iteration count
-    :param rna_fold: rna_fold objects
+    Reads sequence from plain or FASTA file
+    :param file_path: path to sequence file
+    :returns: sequence string
     """
-    
-    # Creates iteration directory
-    os.mkdir(str(seq_count))
 
-    # Creates dot-bracket and svg files
-    output_files = "%d/%6.2f." % (seq_count, rna_fold[1])
-    if(final):
-        output_files = "%6.2f." % rna_fold[1]
-    write_file(output_files + "dat", rna_fold[0])
-    RNA.svg_rna_plot(seq, rna_fold[0], output_files + "svg")
+    lines = [line.strip() for line in read_file(file_path).split("\n")]
+    return "".join(line for line in lines if line and not line.startswith(">"))
+
+def fixed_structure(structure, fixed_end):
+    """
+    Freezes nucleotides before given position - pairs closed before it are enforced, unpaired nucleotides
+    stay unpaired, nucleotides paired with later part of sequence are left free
+    :param structure: dot-bracket structure
+    :param fixed_end: position before which nucleotides are fixed
+    :returns: dot-bracket hard constraint
+    """
+
+    stack = []
+    constraint = ["x" if idx < fixed_end else "." for idx in range(len(structure))]
+    for idx, val in enumerate(structure):
+        if val == "(":
+            stack.append(idx)
+        elif val == ")":
+            pair_idx = stack.pop()
+            if idx < fixed_end:
+                constraint[pair_idx] = "("
+                constraint[idx] = ")"
+            elif pair_idx < fixed_end:
+                constraint[pair_idx] = "."
+    return "".join(constraint)
+
+def fold_cotranscriptional(seq, window, fixation):
+    """
+    Folds growing sequence, nucleotides fixed in earlier iterations are frozen with hard constraints
+    and base pair span is limited to window, so every iteration only explores pairs of new nucleotides
+    :param seq: string of sequence
+    :param window: how much of sequence is shown in one iteration
+    :param fixation: count of nucleotides that are fixed after iteration
+    :returns: list of iterations (iteration, start, end, mfe, structure)
+    """
+
+    if window < 1 or fixation < 1:
+        raise Exception("Window and fixation should be positive, got %d and %d" % (window, fixation))
+
+    res = []
+    seq_len = len(seq)
+    seq_start = 0
+    seq_end = min(window, seq_len)
+    constraint = ""
+    iteration = 0
+    # pairs of every window span at most window nucleotides, fixed pairs fit the limit as well
+    md = RNA.md()
+    md.max_bp_span = window
+
+    while True:
+        fc = RNA.fold_compound(seq[0:seq_end], md)
+        if constraint:
+            fc.hc_add_from_db(constraint + "." * (seq_end - len(constraint)),
+                RNA.CONSTRAINT_DB_DEFAULT | RNA.CONSTRAINT_DB_ENFORCE_BP)
+        structure, mfe = fc.mfe()
+        res.append((iteration, seq_start, seq_end, mfe, structure))
+
+        if seq_end >= seq_len:
+            break
+        iteration = iteration + 1
+        seq_start = seq_start + fixation
+        seq_end = min(seq_start + window, seq_len)
+        constraint = fixed_structure(structure, seq_start)
+
+    return res
+
+def fold_setting(task):
+    """
+    Folds sequence with one window/fixation setting, runs in separate process when several jobs are used
+    :param task: dictionary with sequence, window and fixation
+    :returns: tuple of (window, fixation, iterations)
+    """
+
+    return task["window"], task["fixation"], fold_cotranscriptional(task["sequence"], task["window"], task["fixation"])
+
+def write_iteration_results(fout, window, fixation, iterations):
+    """
+    Appends iteration results of one setting to results file
+    :param fout: opened results file
+    :param window: window of setting
+    :param fixation: fixation of setting
+    :param iterations: list of iterations (iteration, start, end, mfe, structure)
+    """
+
+    for iteration, seq_start, seq_end, mfe, structure in iterations:
+        fout.write("%d\t%d\t%d\t%d\t%d\t%6.2f\t%s\n" % (window, fixation, iteration, seq_start, seq_end, mfe, structure))
+    fout.flush()
 
 def plot_results(range_, values):
     """
@@ -130,32 +217,23 @@ def main():
     directory_exists(opts.output)
 
     print("Sequence reading...")
-    seq = read_file(opts.sequence)
+    seq = read_sequence(opts.sequence)
 
     print("Initialization...")
     init(opts.output, opts)
 
     print("Starting iteration process...")
-    seq_len = len(seq)
-    seq_start = 0
-    seq_end = opts.window
-
-    embed()
-
-    '''
-    while(seq_start < seq_len):
-        seq_part = seq[0:seq_end]
-        fc = RNA.fold_compound(seq_part)
-        rna_fold = fc.mfe()
-
-        write_iteration_results(seq_part, seq_start, rna_fold)
-        print("-->%d:%d - %6.2f" % (seq_start, seq_end, rna_fold[1]))
+    tasks = [{"sequence" : seq, "window" : window, "fixation" : fixation}
+        for window, fixation in itertools.product(opts.window, opts.fixation)]
 
-        seq_start = seq_start + opts.fixation
-        seq_end = min(seq_start + opts.window, seq_len-1)
+    with open(RESULTS_FILE, "w") as fout:
+        fout.write(RESULTS_HEADER)
+        for window, fixation, iterations in parallel.imap_unordered(fold_setting, tasks, opts.jobs):
+            write_iteration_results(fout, window, fixation, iterations)
+            print("-->window %d fixation %d - %6.2f" % (window, fixation, iterations[-1][3]))
 
-    write_iteration_results(seq_part, seq_end, rna_fold, final=True)
-    '''
+            if opts.svg:
+                RNA.svg_rna_plot(seq, iterations[-1][4], "%d_%d_%6.2f.svg" % (window, fixation, iterations[-1][3]))
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
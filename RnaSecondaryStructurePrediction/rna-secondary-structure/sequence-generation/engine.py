@@ -0,0 +1,397 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#pylint: disable=
+"""
+File            : engine.py
+Author          : Aurimas Repecka <aurimas.repecka AT gmail dot com>
+Description     : Runs several sequence generation experiments of JSON spec in one process. Candidates of every
+                  experiment are folded together by one shared folder, sequences proposed by several experiments
+                  are folded once.
+Packages        :   http://www.e-rna.org/cofold/
+"""
+
+import os
+import sys
+import json
+import argparse
+import itertools
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+import folding
+import scoring
+import parallel
+import results
+import outputs
+import sharding
+import instrumentation
+import priority_groups
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '_data')
+OUTPUT_PATH = os.path.join(DATA_PATH, 'output', 'engine')
+PARAMETERS_PATH = os.path.join(DATA_PATH, 'parameters', 'rna_andronescu2007.par')
+
+ALPHA = 0.5
+TAU = 640
+BACKEND = 'cofold'
+FOLD_BATCH = 1024
+
+NUCLEOTIDES_DICT = ['A', 'T', 'G', 'C']
+NUCLEOTIDES_SUBSTITUTION_DICT = {'A' : 'U', 'C' : 'G', 'G' : 'C', 'U' : 'A', 'T' : 'A'}
+NUMBERS_ARRAY = [0, 1, 2, 3, 4, 5, 6]
+NZONE_RANGE = [119,125]
+STRUCTURE_LENGTHS = [140]
+STRUCTURES_DIR = 'secondary-structures'
+DELETION_COMPLEMENTARY_OFFSET = 34
+
+PRIORITY_GROUP_1 = [('G', 1), ('A', 2), ('A', 3), ('C', 4), ('G', 5), ('C', 6)]
+PRIORITY_GROUP_2 = [('C', 1), ('C', 2), ('C', 3), ('G', 4), ('A', 5), ('G', 6)]
+PRIORITY_GROUP_3 = [('T', 1), ('G', 2), ('G', 3), ('T', 4), ('C', 5), ('T', 6)]
+PRIORITY_GROUP_4 = [('A', 1), ('T', 2), ('T', 3), ('A', 4), ('T', 5), ('A', 6)]
+PRIORITY_GROUPS = [PRIORITY_GROUP_1, PRIORITY_GROUP_2, PRIORITY_GROUP_3, PRIORITY_GROUP_4]
+
+MUTATIONS_LIST = ['TGTAGC', 'TGaAGC', 'TGgAGC', 'TGcAGC', 'TGTgGC', 'TGTAGt', 'TGagGC', 'TGggGC',
+                  'TGcgGC', 'TGagGt', 'TGggGt', 'TGcgGt', 'TGTgGt', 'TGaAGt', 'TGgAGt', 'TGcAGt']
+
+EXPERIMENT_TYPES = ['exhaustive', 'priority', 'mutations', 'deletion', 'point']
+
+CONSTRUCTS = {}
+
+
+def read_file(file_path):
+    """
+    Reads given file into string
+    :param file_path: path to file
+    :raises: file not found error
+    :returns: file content string
+    """
+
+    with open(file_path) as fin:
+        fstr = fin.read()
+    return fstr
+
+
+def load_construct(structure_length, structures_dir=STRUCTURES_DIR):
+    '''
+    Reads wild type sequence and structure once for all experiments
+    param structure_length: length of construct
+    param structures_dir: directory of structures in _data
+    returns: tuple (sequence string, dot-bracket structure)
+    '''
+
+    key = (structure_length, structures_dir)
+    if key not in CONSTRUCTS:
+        sequence = read_file(os.path.join(DATA_PATH, 'sequences', 'wt_p%d.fasta' % structure_length)).split('\n')[1].strip()
+        structure = read_file(os.path.join(DATA_PATH, structures_dir, 'wt_p%d.dat' % structure_length)).strip()
+        CONSTRUCTS[key] = (sequence, structure)
+    return CONSTRUCTS[key]
+
+
+def normalize(sequence):
+    '''
+    Upper case RNA form of sequence, folding does not distinguish T and U so such sequences are folded once
+    param sequence: sequence string
+    returns: sequence string
+    '''
+
+    return sequence.upper().replace('T', 'U')
+
+
+def complement(fragment):
+    '''
+    Reverse complement of fragment
+    param fragment: fragment string
+    returns: RNA fragment string
+    '''
+
+    return ''.join(NUCLEOTIDES_SUBSTITUTION_DICT[nucleotide] for nucleotide in normalize(fragment))[::-1]
+
+
+class Experiment(object):
+    "Candidates of single experiment and their scoring, sequences are listed for every structure length"
+
+    def __init__(self, spec):
+        self.name = spec['name']
+        self.type = spec['type']
+        self.lengths = spec.get('lengths', STRUCTURE_LENGTHS)
+        self.constructs = [load_construct(length, spec.get('structures', STRUCTURES_DIR)) for length in self.lengths]
+        self.nzone_range = spec.get('nzone', NZONE_RANGE)
+        self.alphabet = spec.get('alphabet', NUCLEOTIDES_DICT)
+        self.labels = []
+        self.codes = None
+        self.sequences = []
+        self.shard = None
+
+    def select(self, shard):
+        '''
+        Keeps candidates of shard only, candidates of every shard of the same spec are disjoint
+        param shard: tuple (index, count) of sharding.parse_shard
+        '''
+
+        start, stop = sharding.shard_range(len(self.labels), shard)
+        self.labels = self.labels[start:stop]
+        self.codes = self.codes[start:stop] if self.codes is not None else None
+        self.sequences = [sequences[start:stop] for sequences in self.sequences]
+        self.shard = shard
+
+    def fragment_sequences(self, fragments, complementary_range=None):
+        '''
+        Builds sequences with fragments in nzone range of every construct
+        param fragments: list of fragment strings
+        param complementary_range: range which receives reverse complement of fragment end, None keeps it
+        returns: list of lists of sequences, one list for every structure length
+        '''
+
+        res = []
+        for sequence, _ in self.constructs:
+            sequences = []
+            for fragment in fragments:
+                sequence_ = sequence[:self.nzone_range[0]] + fragment + sequence[self.nzone_range[1]:]
+                if complementary_range is not None:
+                    size = complementary_range[1] - complementary_range[0]
+                    sequence_ = (sequence_[:complementary_range[0]] + complement(fragment[len(fragment) - size:]) +
+                                 sequence_[complementary_range[1]:])
+                sequences.append(normalize(sequence_))
+            res.append(sequences)
+        return res
+
+    def output(self, structures, set_names, output_path):
+        '''
+        Scores folded candidates and writes result file, several parameter sets are written side by side
+        param structures: list of lists of dot-bracket structures in order of sequences, one list for every parameter set
+        param set_names: list of names of parameter sets
+        param output_path: directory of results
+        returns: path of written file
+        '''
+
+        accuracies = [np.column_stack([scoring.accuracy_batch(structures__, [structure])[:,0]
+                                       for structures__, (_, structure) in zip(structures_, self.constructs)])
+                      for structures_ in structures]
+        mutations = None
+        if self.codes is not None:
+            fragment_length = self.nzone_range[1] - self.nzone_range[0]
+            reference = self.constructs[0][0][self.nzone_range[0]:self.nzone_range[1]]
+            mutations = scoring.mutations_batch([normalize(label) for label in self.labels], normalize(reference))
+            if len(set_names) == 1:
+                file_path = sharding.shard_path(os.path.join(output_path, '%s.npy' % self.name), self.shard)
+                results.save_table(results.make_table(self.codes, mutations, accuracies[0], fragment_length, self.lengths),
+                                   file_path)
+                return file_path
+
+        fields = [results.ACCURACY_FIELD % length for length in self.lengths]
+        if len(set_names) > 1:
+            fields = ['%s_%s' % (field, set_name) for set_name in set_names for field in fields]
+        accuracies = np.hstack(accuracies)
+        file_path = sharding.shard_path(os.path.join(output_path, '%s.tsv' % self.name), self.shard)
+        with open(file_path, 'w') as fout:
+            fout.write('\t'.join(['label'] + ([results.MUTATIONS_FIELD] if mutations is not None else []) + fields) + '\n')
+            for idx, (label, accuracy) in enumerate(zip(self.labels, accuracies)):
+                fout.write('\t'.join([label] + (['%d' % mutations[idx]] if mutations is not None else []) +
+                                      ['%.5f' % value for value in accuracy]) + '\n')
+        return file_path
+
+
+def exhaustive_experiment(spec):
+    '''
+    Every fragment of nzone range, complementary_range also places reverse complement of fragment end (-35 region)
+    param spec: dictionary of experiment
+    returns: Experiment object
+    '''
+
+    experiment = Experiment(spec)
+    fragment_length = experiment.nzone_range[1] - experiment.nzone_range[0]
+    experiment.codes = np.arange(len(experiment.alphabet) ** fragment_length)
+    experiment.labels = results.decode_fragments(experiment.codes, fragment_length, experiment.alphabet).tolist()
+    experiment.sequences = experiment.fragment_sequences(experiment.labels, spec.get('complementary_range'))
+    return experiment
+
+
+def priority_experiment(spec):
+    '''
+    Unique fragments of priority groups with proportions up to given sum
+    param spec: dictionary of experiment
+    returns: Experiment object
+    '''
+
+    experiment = Experiment(spec)
+    groups = [[tuple(item) for item in group] for group in spec.get('groups', PRIORITY_GROUPS)]
+    max_proportion = spec.get('max_proportion', len(NUMBERS_ARRAY) - 1)
+    proportions = [proportion for proportion in itertools.product(NUMBERS_ARRAY, repeat=len(groups) - 1)
+                   if sum(proportion) <= max_proportion]
+    _, experiment.codes = priority_groups.enumerate_proportions(groups, proportions, experiment.alphabet)
+    fragment_length = experiment.nzone_range[1] - experiment.nzone_range[0]
+    experiment.labels = results.decode_fragments(experiment.codes, fragment_length, experiment.alphabet).tolist()
+    experiment.sequences = experiment.fragment_sequences(experiment.labels, spec.get('complementary_range'))
+    return experiment
+
+
+def mutations_experiment(spec):
+    '''
+    Given list of nzone fragments, by default 16 mutations of G:U pairs
+    param spec: dictionary of experiment
+    returns: Experiment object
+    '''
+
+    experiment = Experiment(spec)
+    experiment.labels = [fragment.upper() for fragment in spec.get('fragments', MUTATIONS_LIST)]
+    experiment.codes = results.encode_fragments(experiment.labels, experiment.alphabet)
+    experiment.sequences = experiment.fragment_sequences(experiment.labels, spec.get('complementary_range'))
+    return experiment
+
+
+def deletion_experiment(spec):
+    '''
+    Single deletions of nzone range, complementary_offset also deletes nucleotide that much positions before
+    param spec: dictionary of experiment
+    returns: Experiment object
+    '''
+
+    experiment = Experiment(spec)
+    offset = spec.get('complementary_offset', DELETION_COMPLEMENTARY_OFFSET)
+    positions = spec.get('positions', list(range(*experiment.nzone_range)))
+    experiment.labels = [str(position) for position in positions]
+    for sequence, _ in experiment.constructs:
+        sequences = []
+        for position in positions:
+            seq_list = list(sequence)
+            seq_list.pop(position)
+            if offset is not None:
+                seq_list.pop(position - offset)
+            sequences.append(normalize(''.join(seq_list)))
+        experiment.sequences.append(sequences)
+    return experiment
+
+
+def point_experiment(spec):
+    '''
+    Fixed mutations in format index1:mutation1_index2:mutation2 like fold_sequences.py
+    param spec: dictionary of experiment
+    returns: Experiment object
+    '''
+
+    experiment = Experiment(spec)
+    experiment.labels = list(spec['mutations'])
+    for sequence, _ in experiment.constructs:
+        sequences = []
+        for mutations_str in experiment.labels:
+            seq_list = list(sequence)
+            for mutation in mutations_str.split('_'):
+                idx, mutation_seq = mutation.split(':')
+                idx = int(idx)
+                if idx > len(seq_list):
+                    continue
+                seq_list[idx:idx + len(mutation_seq)] = list(mutation_seq[:len(seq_list) - idx])
+            sequences.append(normalize(''.join(seq_list)))
+        experiment.sequences.append(sequences)
+    return experiment
+
+
+def build_experiment(spec):
+    '''
+    Builds experiment by its type
+    param spec: dictionary of experiment
+    raises: value error if type is unknown
+    returns: Experiment object
+    '''
+
+    builders = {'exhaustive' : exhaustive_experiment, 'priority' : priority_experiment, 'mutations' : mutations_experiment,
+                'deletion' : deletion_experiment, 'point' : point_experiment}
+    if spec.get('type') not in builders:
+        raise ValueError("Unknown experiment type %s, expected one of %s" % (spec.get('type'), EXPERIMENT_TYPES))
+    return builders[spec['type']](spec)
+
+
+def fold_batch(task):
+    '''
+    Folds batch of unique sequences with every parameter set, runs in separate process when several jobs are used
+    param task: dictionary with sequences and folder parameters
+    returns: tuple (index of first sequence, list of lists of dot-bracket structures, one list for every parameter set)
+    '''
+
+    folder = folding.get_parameter_sets_folder(task['alpha'], task['tau'], task['parameters'], task['backend'],
+                                               task['workers'])
+    return task['start'], [[fold[0] for fold in folds] for folds in folder.fold_many(task['sequences'])]
+
+
+def run_experiments(spec, jobs=1, output_path=OUTPUT_PATH, shard=None):
+    '''
+    Builds every experiment of spec, folds union of their candidates and writes results of every experiment
+    param spec: dictionary with alpha, tau, parameters (file, list of files or 'all'), backend and list of experiments
+    param jobs: count of processes which fold batches
+    param output_path: directory in which run directory is created, shards write straight into it
+    param shard: tuple (index, count), only candidates of shard are folded and written to NAME.shard-i-of-N files
+    returns: dictionary of experiment name to result file path
+    '''
+
+    alpha = spec.get('alpha', ALPHA)
+    tau = spec.get('tau', TAU)
+    parameters = folding.parameter_sets(spec.get('parameters', PARAMETERS_PATH))
+    set_names = [folding.parameter_set_name(parameters_path) for parameters_path in parameters]
+    backend = spec.get('backend', BACKEND)
+    experiments = [build_experiment(experiment) for experiment in spec['experiments']]
+    if shard is not None:
+        for experiment in experiments:
+            experiment.select(shard)
+
+    # union of candidates, sequence proposed by several experiments or lengths is folded once
+    unique = {}
+    for experiment in experiments:
+        for sequences in experiment.sequences:
+            for sequence in sequences:
+                unique.setdefault(sequence, len(unique))
+    total = sum(len(sequences) for experiment in experiments for sequences in experiment.sequences)
+    print("Candidates: %d, unique sequences: %d, parameter sets: %s" % (total, len(unique), ', '.join(set_names)))
+
+    sequences = list(unique.keys())
+    tasks = [dict(start=start, sequences=sequences[start:start + FOLD_BATCH], alpha=alpha, tau=tau,
+                  parameters=parameters, backend=backend, workers=parallel.workers_per_job(jobs))
+             for start in range(0, len(sequences), FOLD_BATCH)]
+    structures = [[None] * len(sequences) for _ in parameters]
+    progress = instrumentation.Progress('sequences', len(sequences))
+    for start, structures_ in parallel.imap_unordered(fold_batch, tasks, jobs):
+        for set_structures, batch_structures in zip(structures, structures_):
+            set_structures[start:start + len(batch_structures)] = batch_structures
+        progress.update(len(structures_[0]))
+
+    if shard is not None:
+        # shards of one run share directory, their file names differ by shard
+        run_path = output_path
+        if not os.path.exists(run_path):
+            os.makedirs(run_path, exist_ok=True)
+    else:
+        run_path = outputs.run_dir(output_path)
+    res = {}
+    for experiment in experiments:
+        experiment_structures = [[[set_structures[unique[sequence]] for sequence in sequences_]
+                                  for sequences_ in experiment.sequences] for set_structures in structures]
+        res[experiment.name] = experiment.output(experiment_structures, set_names, run_path)
+        print("%s: %s" % (experiment.name, res[experiment.name]))
+    with open(sharding.shard_path(os.path.join(run_path, 'spec.json'), shard), 'w') as fout:
+        json.dump(spec, fout, indent=2)
+    return res
+
+
+def parse_arguments():
+    '''Parsing given arguments'''
+
+    parser = argparse.ArgumentParser(description='Runs sequence generation experiments of spec in one process')
+    parser.add_argument('spec', type=str, help='JSON file with alpha, tau, parameters, backend and list of experiments')
+    parser.add_argument('--jobs', type=int, default=1, help='Count of processes used for folding')
+    parser.add_argument('--output', type=str, default=OUTPUT_PATH, help='Directory of run directories')
+    parser.add_argument('--shard', type=sharding.parse_shard, default=None, metavar='i/N',
+                        help='Run shard i of N of every experiment, merge shard files with utils/sharding.py')
+    parser.add_argument('--parameters', type=str, nargs='+',
+                        help="Energy parameters files instead of parameters of spec, 'all' evaluates every parameter set")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    spec = json.loads(read_file(args.spec))
+    if args.parameters:
+        spec['parameters'] = args.parameters[0] if args.parameters == [folding.ALL_PARAMETER_SETS] else args.parameters
+    run_experiments(spec, args.jobs, args.output, args.shard)
+
+if __name__ == '__main__':
+    main()
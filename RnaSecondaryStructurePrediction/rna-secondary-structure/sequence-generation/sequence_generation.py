@@ -10,26 +10,36 @@ Packages        :   https://www.tbi.univie.ac.at/RNA/#download
 """
 
 import os
-import RNA
-import itertools
+import sys
+import argparse
 import numpy as np
-import pandas as pd
-from IPython import embed
 
-import plotly.plotly as py
-import plotly.graph_objs as go
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+import folding
+import cofold_pool
+import scoring
+import parallel
+import results
+import pipeline
+import search
+import rendering
+import instrumentation
+import subopt
+import outputs
+import sharding
 
 APLHA = 0.5
 TAU = 640
+BACKEND = 'cofold'
 
 SEQUENCE_FILE = 'sequences/wt_p140.fasta'
-OUTFILE_PATH = 'output/temp.fasta'
 SVG_OUTFILE_PATH = 'output/'
 STRUCTURE_PATH = 'secondary-structures/wt_p140.dat'
 PARAMETERS_PATH = 'parameters/rna_andronescu2007.par'
 
 NUCLEOTIDES_DICT = ['A', 'T', 'G', 'C']
 NZONE_RANGE = [119,125]
+BATCH_SIZE = 1024
 
 
 def read_file(file_path):
@@ -56,99 +66,34 @@ def write_file(file_path, output):
         fout.write(output)
 
 
-def check_diff(struc_1, struc_2):
-    '''
-    Check position-wise accuracy of two structures
-    param struc_1: dot-bracket structure of sequence 1
-    param struc_2: dot-bracket structure of sequence 2
-    returns: similarity between two structures percentage
-    '''
-    corr = 0
-    for idx, val in enumerate(struc_2):
-        if val == struc_1[idx]:
-            corr = corr + 1
-    return corr/len(struc_1)
-
-def check_diff_mut(seq_1, seq_2):
-    '''
-    Check position-wise accuracy of two sequences
-    param struc_1: string of sequence 1
-    param struc_2: string of sequence 2
-    returns: mutations between two sequences
-    '''
-
-    mutations = 0
-    for idx, val in enumerate(seq_1):
-        if val != seq_2[idx]:
-            mutations = mutations + 1
-    return mutations
-
-
-def plot_scatter_chart(title, data, xaxis, yaxis, filename):
+def plot_scatter_chart(title, data, xaxis, yaxis, filename, fragment_length=NZONE_RANGE[1] - NZONE_RANGE[0]):
     '''
     Plots scatter chart in polt.ly servers
     param title: string title of chart name
-    param x: data array of x axis
-    param y: data array of y axis
+    param data: result table of generate_sequences_fold
     param xaxis: string name of x axis
     param yaxis: string name of y yaxis
     param filename: name of the file that will be saved in plot.ly
+    param fragment_length: count of nucleotides in generated fragment
     '''
-    sorted_data = data[data[:,1].argsort()[::-1]]
-    idxs = [i for i in range(len(sorted_data))]
-    indexed_data = np.insert(sorted_data, 0, idxs, axis=1)
-
-    trace0_data = indexed_data[indexed_data[:,3] == '0']
-    trace1_data = indexed_data[indexed_data[:,3] == '1']
-    trace2_data = indexed_data[indexed_data[:,3] == '2']
-    trace3_data = indexed_data[indexed_data[:,3] == '3']
-    trace4_data = indexed_data[indexed_data[:,3] == '4']
-    trace5_data = indexed_data[indexed_data[:,3] == '5']
-    trace6_data = indexed_data[indexed_data[:,3] == '6']
-
-    trace0 = go.Scatter(
-        x=trace0_data[:,0].astype(int),
-        y=trace0_data[:,2].astype(float),
-        mode='markers',
-        name='0 mutations',
-        text=trace0_data[:,1])
-    trace1 = go.Scatter(
-        x=trace1_data[:,0].astype(int),
-        y=trace1_data[:,2].astype(float),
-        mode='markers',
-        name='1 mutations',
-        text=trace1_data[:,1])
-    trace2 = go.Scatter(
-        x=trace2_data[:,0].astype(int),
-        y=trace2_data[:,2].astype(float),
-        mode='markers',
-        name='2 mutations',
-        text=trace2_data[:,1])
-    trace3 = go.Scatter(
-        x=trace3_data[:,0].astype(int),
-        y=trace3_data[:,2].astype(float),
-        mode='markers',
-        name='3 mutations',
-        text=trace3_data[:,1])
-    trace4 = go.Scatter(
-        x=trace4_data[:,0].astype(int),
-        y=trace4_data[:,2].astype(float),
-        mode='markers',
-        name='4 mutations',
-        text=trace4_data[:,1])
-    trace5 = go.Scatter(
-        x=trace5_data[:,0].astype(int),
-        y=trace5_data[:,2].astype(float),
-        mode='markers',
-        name='5 mutations',
-        text=trace5_data[:,1])
-    trace6 = go.Scatter(
-        x=trace6_data[:,0].astype(int),
-        y=trace6_data[:,2].astype(float),
-        mode='markers',
-        name='6 mutations',
-        text=trace6_data[:,1])
-    data = [trace0, trace1, trace2, trace3, trace4, trace5, trace6]
+    # plot.ly is only needed for charts, so folding runs and benchmarks work without it
+    import plotly.plotly as py
+    import plotly.graph_objs as go
+
+    accuracy_field = results.accuracy_fields(data)[0]
+    sorted_data = data[np.argsort(-data[accuracy_field], kind='stable')]
+    idxs = np.arange(len(sorted_data))
+
+    traces = []
+    for mutations_count in range(fragment_length + 1):
+        mask = sorted_data[results.MUTATIONS_FIELD] == mutations_count
+        trace_data = sorted_data[mask]
+        traces.append(go.Scatter(
+            x=idxs[mask],
+            y=trace_data[accuracy_field],
+            mode='markers',
+            name='%d mutations' % mutations_count,
+            text=results.decode_fragments(trace_data[results.FRAGMENT_FIELD], fragment_length, NUCLEOTIDES_DICT)))
 
     layout = go.Layout(  
         title = title,
@@ -158,60 +103,341 @@ def plot_scatter_chart(title, data, xaxis, yaxis, filename):
         )
     )
 
-    fig = go.Figure(data = data, layout = layout)
+    fig = go.Figure(data = traces, layout = layout)
     py.iplot(fig, filename=filename)
 
 
 
-def generate_sequences_fold(sequence_path, structure_path, parameters_path, alpha, tau, nzone_range) :
+def fold_fragments(task):
+    '''
+    Folds batch of generated fragments, runs in separate process when several jobs are used
+    param task: dictionary with start, stop codes of fragments and parameters of generate_sequences_fold
+    returns: tuple (task, list of dot-bracket structures, list of (probability, ensemble defect, sparse base pair
+             probabilities) in ensemble mode or None)
+    '''
+
+    nzone_range = task['nzone_range']
+    seq_list = list(task['seq_list'])
+
+    # fragments are generated in itertools.product order, so fragment code is its index
+    fragments = results.decode_fragments(np.arange(task['start'], task['stop']), nzone_range[1] - nzone_range[0], NUCLEOTIDES_DICT)
+    sequences = [fragment_sequence(seq_list, nzone_range, fragment) for fragment in fragments]
+    if task['ensemble']:
+        # partition function is computed in-process by ViennaRNA and is not cached
+        backend = folding.get_backend(task['alpha'], task['tau'], task['parameters_path'], 'vienna')
+        folds = backend.fold_ensemble_many(sequences, task['base_structure'].strip(), task['bpp_threshold'])
+        return task, [fold[0] for fold in folds], [fold[2:] for fold in folds]
+    pool = folding.get_folder(task['alpha'], task['tau'], task['parameters_path'], task['backend'], task['workers'])
+    structures = [fold[0] for fold in pool.fold_many(sequences)]
+    return task, structures, None
+
+
+def score_fragments(folded):
+    '''
+    Scores folded batch of fragments
+    param folded: tuple (task, list of dot-bracket structures, ensemble results) of fold_fragments
+    returns: tuple (result table of batch, list of dot-bracket structures, sparse base pair probabilities table or None)
+    '''
+
+    task, structures, ensemble = folded
+    nzone_range = task['nzone_range']
+    fragment_length = nzone_range[1] - nzone_range[0]
+    codes = np.arange(task['start'], task['stop'])
+    fragments = results.decode_fragments(codes, fragment_length, NUCLEOTIDES_DICT)
+    accuracies = scoring.accuracy_batch(structures, [task['base_structure']])
+    mutations = scoring.mutations_batch(fragments, task['reference'])
+    if ensemble is None:
+        return results.make_table(codes, mutations, accuracies, fragment_length, [len(task['seq_list'])]), structures, None
+    table = results.make_table(codes, mutations, accuracies, fragment_length, [len(task['seq_list'])],
+                               [fold[0] for fold in ensemble], [fold[1] for fold in ensemble])
+    return table, structures, results.make_pairs(codes, [fold[2] for fold in ensemble], fragment_length)
+
+
+def reference_fragment(seq_list, nzone_range):
+    '''
+    Original fragment of NZONE range written with NUCLEOTIDES_DICT, so U of wild type is not counted as mutation of T
+    param seq_list: list of nucleotides of analysed sequence
+    param nzone_range: range of nucleotides sequence that is generated
+    returns: fragment string
+    '''
+
+    return ''.join(seq_list[nzone_range[0]:nzone_range[1]]).upper().replace('U', 'T')
+
+
+def fragment_sequence(seq_list, nzone_range, fragment):
+    '''
+    Builds sequence with generated fragment in nzone range
+    param seq_list: list of nucleotides of analysed sequence
+    param nzone_range: range of nucleotides sequence that was generated
+    param fragment: generated fragment string
+    returns: sequence string
+    '''
+
+    return ''.join(seq_list[:nzone_range[0]]) + fragment + ''.join(seq_list[nzone_range[1]:])
+
+
+def render_results(table, seq_list, nzone_range, parameters_path, alpha, tau, backend=BACKEND, top_k=None,
+                   workers=rendering.RENDER_WORKERS):
     '''
-    Generates different sequences and checks accuracy of folded structure
+    Renders stored results of generate_sequences_fold on demand, structures are taken from fold cache
+    param table: result table of generate_sequences_fold
+    param seq_list: list of nucleotides of analysed sequence
+    param nzone_range: range of nucleotides sequence that was generated
+    param parameters_path: file path of parameters file for CoFold
+    param alpha: alpha parameter of CoFold execution
+    param tau: tau parameter of CoFold execution
+    param backend: name of folding backend - cofold or vienna
+    param top_k: count of best results rendered, None renders every result
+    param workers: count of rendering processes
+    returns: list of written file paths
+    '''
+
+    accuracy = table[results.accuracy_fields(table)[0]]
+    if top_k is not None:
+        table = table[np.argsort(-accuracy, kind='stable')[:top_k]]
+        accuracy = table[results.accuracy_fields(table)[0]]
+    fragments = results.decode_fragments(table[results.FRAGMENT_FIELD], nzone_range[1] - nzone_range[0], NUCLEOTIDES_DICT)
+    sequences = [fragment_sequence(seq_list, nzone_range, fragment) for fragment in fragments]
+    folds = folding.get_folder(alpha, tau, parameters_path, backend).fold_many(sequences)
+
+    svg_path = outputs.run_dir(SVG_OUTFILE_PATH)
+    records = [(float(corr_perc), new_seq, fold[0], os.path.join(svg_path, "%.5f_%s.svg" % (corr_perc, str(code))))
+               for corr_perc, new_seq, fold, code in zip(accuracy, sequences, folds, table[results.FRAGMENT_FIELD])]
+    return rendering.render_records(records, None, workers)
+
+
+def generate_sequences_fold(sequence_path, structure_path, parameters_path, alpha, tau, nzone_range, jobs=1, backend=BACKEND,
+                            render_mode=rendering.RENDER_MODE, top_k=rendering.TOP_K, output_path=None, batch_size=BATCH_SIZE,
+                            ensemble=False, bpp_path=None, bpp_threshold=results.PROBABILITY_THRESHOLD, shard=None) :
+    '''
+    Generates different sequences and checks accuracy of folded structure, candidates stream through
+    generate -> fold -> score -> sink stages so only few batches are held in memory
     param sequence_path: file path of analysed sequence
     param structure_path: file path of dot-bracket structure of analysed sequence
     param parameters_path: file path of parameters file for CoFold
     param alpha: alpha parameter of CoFold execution
     param tau: tau parameter of CoFold execution
     param nzone_range: range of nucleotides sequence that should be generated
-    returns: array of Vector3 - (generated_fragment, accuracy percent, mutations count)
+    param jobs: count of processes which fold batches of fragments
+    param backend: name of folding backend - cofold or vienna
+    param render_mode: top renders top_k best structures, all renders every structure, none renders nothing
+    param top_k: count of best structures rendered in top mode
+    param output_path: file which receives result table batch by batch (.npy or .parquet), None keeps table in memory
+    param batch_size: count of fragments folded together
+    param ensemble: adds probability and ensemble defect of target structure from ViennaRNA partition function
+    param bpp_path: .npy file which receives sparse base pair probabilities in ensemble mode, None drops them
+    param bpp_threshold: minimal stored base pair probability
+    param shard: tuple (index, count), only continuous range of fragment codes of shard is generated
+    raises: value error if ensemble mode is used without vienna backend
+    returns: result table - fragment code, mutations count and accuracy of sequence length (probability, defect)
     '''
 
-    results = []
+    if ensemble and backend != 'vienna':
+        raise ValueError("Ensemble scoring needs partition function of vienna backend, not %s" % backend)
+
     sequence_data = read_file(sequence_path).split("\n")
     base_structure = read_file(structure_path)
     seq_list = list(sequence_data[1])
-    sequence_header = sequence_data[0] + '\n'
-    nzone_fragment = seq_list[nzone_range[0]:nzone_range[1]]
-
-    gen_fragments = itertools.product(NUCLEOTIDES_DICT, repeat=6)
-
-    count = 0
-    for gen_fragment in gen_fragments:
-        seq_list[nzone_range[0]:nzone_range[1]] = gen_fragment
-        new_seq = ''.join(seq_list)
-        write_file(OUTFILE_PATH, sequence_header + new_seq)
-        cmd_out = os.popen('CoFold -d1 --noPS --distAlpha %.5f --distTau %.5f --paramFile=%s < %s' % (alpha, tau, parameters_path, OUTFILE_PATH)).read()
-
-        sec_struc = (cmd_out.split('\n')[2]).split(' ')[0]
-        corr_perc = check_diff(base_structure, sec_struc)
-        mutations = check_diff_mut(nzone_fragment, ''.join(gen_fragment))
-
-        RNA.svg_rna_plot(new_seq, sec_struc, "%s%.5f_%s.svg" % (SVG_OUTFILE_PATH, corr_perc, str(count)))
+    fragment_length = nzone_range[1] - nzone_range[0]
+    first_code, stop_code = sharding.shard_range(len(NUCLEOTIDES_DICT) ** fragment_length, shard)
+    dtype = results.table_dtype(fragment_length, [len(seq_list)], ensemble)
+    top_results = rendering.TopResults(top_k)
+    progress = instrumentation.Progress('fragments', stop_code - first_code)
+    svg_path = outputs.run_dir(SVG_OUTFILE_PATH) if render_mode != 'none' else None
+    tables = []
+
+    task = dict(seq_list=seq_list, base_structure=base_structure, parameters_path=parameters_path, alpha=alpha, tau=tau,
+                backend=backend, workers=parallel.workers_per_job(jobs), nzone_range=nzone_range, ensemble=ensemble,
+                bpp_threshold=bpp_threshold, reference=reference_fragment(seq_list, nzone_range))
+    source = (dict(task, start=start, stop=min(start + batch_size, stop_code))
+              for start in range(first_code, stop_code, batch_size))
+
+    with rendering.Renderer() as renderer:
+        writer = results.TableWriter(output_path, dtype) if output_path else None
+        bpp_writer = results.TableWriter(bpp_path, results.pairs_dtype(fragment_length)) if ensemble and bpp_path else None
+
+        def sink(scored):
+            table, structures, pairs = scored
+            progress.update(len(table))
+            if writer is not None:
+                writer.append(table)
+            else:
+                tables.append(table)
+            if bpp_writer is not None:
+                bpp_writer.append(pairs)
+            if render_mode == 'none':
+                return
+            accuracy = table[results.accuracy_fields(table)[0]]
+            fragments = results.decode_fragments(table[results.FRAGMENT_FIELD], fragment_length, NUCLEOTIDES_DICT)
+            for code, fragment, corr_perc, sec_struc in zip(table[results.FRAGMENT_FIELD], fragments, accuracy, structures):
+                file_path = os.path.join(svg_path, "%.5f_%s.svg" % (corr_perc, str(code)))
+                new_seq = fragment_sequence(seq_list, nzone_range, fragment)
+                if render_mode == 'all':
+                    renderer.submit(new_seq, sec_struc, file_path)
+                else:
+                    top_results.add(None, float(corr_perc), new_seq, sec_struc, file_path)
+
+        try:
+            pipeline.run_pipeline(source, [pipeline.Stage(fold_fragments, jobs), pipeline.Stage(score_fragments)], sink)
+        finally:
+            if writer is not None:
+                writer.close()
+            if bpp_writer is not None:
+                bpp_writer.close()
+        top_results.render(renderer)
+
+    if writer is not None:
+        return results.load_table(output_path)
+    return results.concatenate(tables) if tables else np.empty(0, dtype=dtype)
+
+
+def subopt_fragments(task):
+    '''
+    Streams suboptimal structures of batch of fragments into summaries, runs in separate process when several jobs are used
+    param task: dictionary with fragment codes and parameters of subopt_sequences_fold
+    returns: summary table of batch
+    '''
 
-        count = count + 1
-        print("Iteration: %d" % count)
-        results.append([''.join(gen_fragment), corr_perc, mutations])
+    nzone_range = task['nzone_range']
+    fragment_length = nzone_range[1] - nzone_range[0]
+    backend = folding.get_backend(task['alpha'], task['tau'], task['parameters_path'], 'vienna')
+    fragments = results.decode_fragments(task['codes'], fragment_length, NUCLEOTIDES_DICT)
+    table = np.empty(len(task['codes']), dtype=results.subopt_dtype(fragment_length, [len(task['seq_list'])]))
+    table[results.FRAGMENT_FIELD] = task['codes']
+    table[results.MUTATIONS_FIELD] = scoring.mutations_batch(fragments, task['reference'])
+    fields = [field % len(task['seq_list']) for field in results.SUBOPT_FIELDS]
+    for idx, fragment in enumerate(fragments):
+        sequence = fragment_sequence(task['seq_list'], nzone_range, fragment)
+        table[idx][fields[0]], table[idx][fields[1]], table[idx][fields[2]] = subopt.summarize(
+            backend, sequence, task['base_structure'], task['delta'])
+    return table
+
+
+def subopt_sequences_fold(table, sequence_path, structure_path, parameters_path, alpha, tau, nzone_range, delta=subopt.SUBOPT_DELTA,
+                          top_k=rendering.TOP_K, jobs=1):
+    '''
+    Checks if target structure is among near-optimal structures of best candidates, suboptimal structures are computed
+    by ViennaRNA and scored while they are streamed
+    param table: result table of generate_sequences_fold
+    param sequence_path: file path of analysed sequence
+    param structure_path: file path of dot-bracket structure of analysed sequence
+    param parameters_path: file path of parameters file
+    param alpha: alpha parameter of CoFold distance penalty
+    param tau: tau parameter of CoFold distance penalty
+    param nzone_range: range of nucleotides sequence that was generated
+    param delta: width of energy band above minimal free energy in kcal/mol
+    param top_k: count of candidates with best accuracy which are analysed
+    param jobs: count of processes
+    returns: summary table - fragment code, mutations count, count of structures in band, best accuracy and its energy gap
+    '''
 
-    return np.asarray(results)
+    seq_list = list(read_file(sequence_path).split("\n")[1])
+    base_structure = read_file(structure_path)
+    accuracy = table[results.accuracy_fields(table)[0]]
+    codes = np.asarray(table[results.FRAGMENT_FIELD])[np.argsort(-accuracy, kind='stable')[:top_k]]
+    chunks = max(1, min(len(codes), jobs * parallel.CHUNKS_PER_JOB))
+    tasks = [dict(codes=chunk, seq_list=seq_list, base_structure=base_structure, parameters_path=parameters_path, alpha=alpha,
+                  tau=tau, nzone_range=nzone_range, delta=delta, reference=reference_fragment(seq_list, nzone_range))
+             for chunk in np.array_split(codes, chunks)]
+    summary = results.concatenate(parallel.map_ordered(subopt_fragments, tasks, jobs))
+
+    fields = [field % len(seq_list) for field in results.SUBOPT_FIELDS]
+    fragments = results.decode_fragments(summary[results.FRAGMENT_FIELD], nzone_range[1] - nzone_range[0], NUCLEOTIDES_DICT)
+    for row, fragment in zip(summary, fragments):
+        print("%s structures: %d best accuracy: %.5f energy gap: %.2f" % (fragment, row[fields[0]], row[fields[1]], row[fields[2]]))
+    return summary
+
+
+def search_sequences_fold(sequence_paths, structure_paths, parameters_path, alpha, tau, nzone_range, strategy=search.DEFAULT_STRATEGY,
+                          backend=BACKEND, mutation_weight=search.MUTATION_WEIGHT, seed=search.SEED, jobs=1):
+    '''
+    Searches fragments with best mean accuracy over several sequence lengths instead of generating every fragment
+    param sequence_paths: list of file paths of analysed sequences
+    param structure_paths: list of file paths of dot-bracket structures of analysed sequences
+    param parameters_path: file path of parameters file for CoFold
+    param alpha: alpha parameter of CoFold execution
+    param tau: tau parameter of CoFold execution
+    param nzone_range: range of nucleotides sequence that should be designed
+    param strategy: name of search strategy - anneal, genetic or beam
+    param backend: name of folding backend - cofold or vienna
+    param mutation_weight: accuracy lost for every mutation against original fragment
+    param seed: seed of random generator
+    param jobs: count of CoFold workers, search folds in this process so 1 keeps default size of pool
+    returns: result table of every evaluated fragment - fragment code, mutations count and accuracy of every sequence length
+    '''
 
+    constructs = []
+    for sequence_path, structure_path in zip(sequence_paths, structure_paths):
+        constructs.append((read_file(sequence_path).split("\n")[1].strip(), read_file(structure_path)))
+    # search does not fork jobs, so all of them are CoFold workers of this process
+    pool = folding.get_folder(alpha, tau, parameters_path, backend, workers=jobs if jobs > 1 else cofold_pool.COFOLD_WORKERS)
+    objective = search.Objective(pool, constructs, nzone_range, NUCLEOTIDES_DICT, mutation_weight)
+
+    kwargs = {} if strategy == 'beam' else {'seed' : seed}
+    for fragment, score, mutations_count, accuracies in search.run_search(strategy, objective, **kwargs):
+        print("%s score: %.5f mutations: %d accuracies: %s" % (fragment, score, mutations_count,
+            ' '.join('%.5f' % accuracy for accuracy in accuracies)))
+    print("Folded fragments: %d of %d" % (len(objective.evaluated), len(NUCLEOTIDES_DICT) ** (nzone_range[1] - nzone_range[0])))
+
+    return objective.table([len(sequence) for sequence, _ in constructs])
+
+
+def parse_arguments():
+    '''Parsing given arguments'''
+
+    parser = argparse.ArgumentParser(description='Generating sequences of nzone range')
+    parser.add_argument('--jobs', type=int, default=1, help='Count of processes used for folding')
+    parser.add_argument('--backend', type=str, default=BACKEND, choices=folding.BACKENDS, help='Folding backend')
+    parser.add_argument('--render', type=str, default=rendering.RENDER_MODE, choices=rendering.RENDER_MODES,
+                        help='Which structures are plotted to SVG: best top-k, all or none')
+    parser.add_argument('--top-k', type=int, default=rendering.TOP_K, help='Count of best structures plotted in top mode')
+    parser.add_argument('--output', type=str, default=None,
+                        help='File of result table (.npy or .parquet), written batch by batch while sweep runs')
+    parser.add_argument('--nzone', type=int, nargs=2, default=NZONE_RANGE, metavar=('START', 'STOP'),
+                        help='Range of generated nucleotides, 8-10 nucleotides should be streamed to --output')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Count of fragments folded together')
+    parser.add_argument('--search', type=str, default='exhaustive', choices=['exhaustive'] + search.STRATEGIES,
+                        help='Generate every fragment or search fragments heuristically')
+    parser.add_argument('--sequences', type=str, nargs='+', default=[SEQUENCE_FILE],
+                        help='Sequence files of every length optimized by search')
+    parser.add_argument('--structures', type=str, nargs='+', default=[STRUCTURE_PATH],
+                        help='Structure files of every length optimized by search, in order of --sequences')
+    parser.add_argument('--mutation-weight', type=float, default=search.MUTATION_WEIGHT,
+                        help='Accuracy penalty of every mutation in search')
+    parser.add_argument('--ensemble', action='store_true',
+                        help='Also score probability and ensemble defect of target structure, needs vienna backend')
+    parser.add_argument('--bpp-output', type=str, default=None,
+                        help='.npy file of sparse base pair probabilities of every fragment in ensemble mode')
+    parser.add_argument('--bpp-threshold', type=float, default=results.PROBABILITY_THRESHOLD,
+                        help='Base pair probabilities below threshold are not stored')
+    parser.add_argument('--shard', type=sharding.parse_shard, default=None, metavar='i/N',
+                        help='Generate shard i of N of fragments, --output gets .shard-i-of-N suffix')
+    parser.add_argument('--subopt', type=float, default=None, metavar='DELTA',
+                        help='Summarize suboptimal structures within DELTA kcal/mol of best candidates with ViennaRNA')
+    parser.add_argument('--subopt-top', type=int, default=rendering.TOP_K, help='Count of best candidates analysed by --subopt')
+    parser.add_argument('--subopt-output', type=str, default=None, help='File of suboptimal structures summary table')
+    return parser.parse_args()
 
 
 def main():
-    
-    results = generate_sequences_fold(SEQUENCE_FILE, STRUCTURE_PATH, PARAMETERS_PATH, 0.5, 640, NZONE_RANGE)
-    #plot_scatter_chart("Generated sequences analysis (experiment target) -TGTAGC", results, "Iteration", "Accuracy", "140-sequence-analysis")
-
-    #results_df = pd.DataFrame(results)
-    #results_df.to_csv('output/svg/generated_seq_accuracies_exp.csv', header=False, index=False)
+    args = parse_arguments()
+    if args.search != 'exhaustive':
+        table = search_sequences_fold(args.sequences, args.structures, PARAMETERS_PATH, 0.5, 640, args.nzone, args.search,
+                                      args.backend, args.mutation_weight, jobs=args.jobs)
+        if args.output:
+            results.save_table(table, args.output)
+        return
+    table = generate_sequences_fold(SEQUENCE_FILE, STRUCTURE_PATH, PARAMETERS_PATH, 0.5, 640, args.nzone, args.jobs, args.backend,
+                                    args.render, args.top_k, sharding.shard_path(args.output, args.shard) if args.output else None,
+                                    args.batch_size, args.ensemble,
+                                    sharding.shard_path(args.bpp_output, args.shard) if args.bpp_output else None,
+                                    args.bpp_threshold, args.shard)
+    if args.subopt is not None:
+        summary = subopt_sequences_fold(table, SEQUENCE_FILE, STRUCTURE_PATH, PARAMETERS_PATH, 0.5, 640, args.nzone, args.subopt,
+                                        args.subopt_top, args.jobs)
+        if args.subopt_output:
+            results.save_table(summary, args.subopt_output)
+    #plot_scatter_chart("Generated sequences analysis (experiment target) -TGTAGC", table, "Iteration", "Accuracy", "140-sequence-analysis")
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
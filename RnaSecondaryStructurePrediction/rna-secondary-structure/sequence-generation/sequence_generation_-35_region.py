@@ -10,7 +10,9 @@ Packages        :   https://www.tbi.univie.ac.at/RNA/#download
 """
 
 import os
+import sys
 import RNA
+import argparse
 import itertools
 import numpy as np
 import pandas as pd
@@ -19,8 +21,18 @@ from IPython import embed
 import plotly.plotly as py
 import plotly.graph_objs as go
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+import folding
+import scoring
+import parallel
+import results
+import cascade
+import cofold_pool
+import journal as journal_lib
+import sharding
+import instrumentation
+
 SEQUENCE_FILE = '../_data/sequences/'
-TEMPFILE_PATH = '../_data/temp/temp.fasta'
 SVG_OUTFILE_PATH = 'NAN'
 STRUCTURE_PATH = '../_data/secondary-structures/'
 PARAMETERS_PATH = '../_data/parameters/rna_andronescu2007.par'
@@ -35,6 +47,8 @@ STRUCTURE_LENGTHS = [160,200,555]
 
 ALPHA = 0.5
 TAU = 640
+BACKEND = 'cofold'
+CASCADE_THRESHOLD = cascade.CASCADE_THRESHOLD
 IS_COMPLEMENTARY = False
 
 
@@ -62,34 +76,6 @@ def write_file(file_path, output):
         fout.write(output)
 
 
-def check_diff(struc_1, struc_2):
-    '''
-    Check position-wise accuracy of two structures
-    param struc_1: dot-bracket structure of sequence 1
-    param struc_2: dot-bracket structure of sequence 2
-    returns: similarity between two structures percentage
-    '''
-    corr = 0
-    for idx, val in enumerate(struc_2):
-        if val == struc_1[idx]:
-            corr = corr + 1
-    return corr/len(struc_1)
-
-def check_diff_mut(seq_1, seq_2):
-    '''
-    Check position-wise accuracy of two sequences
-    param struc_1: string of sequence 1
-    param struc_2: string of sequence 2
-    returns: mutations between two sequences
-    '''
-
-    mutations = 0
-    for idx, val in enumerate(seq_1):
-        if val != seq_2[idx]:
-            mutations = mutations + 1
-    return mutations
-
-
 def plot_scatter_chart(title, data, xaxis, yaxis, filename):
     '''
     Plots scatter chart in polt.ly servers
@@ -129,7 +115,100 @@ def read_sequences_list(sequence_path):
     return res
 
 
-def generate_sequences_fold(sequence_path, structure_path, parameters_path, alpha, tau, nzone_range, is_complementary) :
+def fold_fragments(task):
+    '''
+    Folds chunk of generated fragments, runs in separate process when several jobs are used
+    param task: dictionary with start, stop indexes of fragments and parameters of generate_sequences_fold
+    returns: tuple (result table of folded fragments of chunk - fragment code, mutations count and accuracy of every
+             structure length, list of codes of fragments which failed to fold after every retry)
+    '''
+
+    nzone_range = task['nzone_range']
+    is_complementary = task['is_complementary']
+    nzone_fragment = task['structures'][0][2][0][nzone_range[0]:nzone_range[1]]
+    pool = journal_lib.GuardedFolder(folding.get_folder(task['alpha'], task['tau'], task['parameters_path'], task['backend'],
+                                                        task['workers']))
+
+    gen_fragments = itertools.product(NUCLEOTIDES_DICT, repeat=nzone_range[1] - nzone_range[0])
+    fragments = [''.join(fragment) for fragment in itertools.islice(gen_fragments, task['start'], task['stop'])]
+    sequences_by_length = []
+
+    for structures_ in task['structures']:
+        seq_list, sequence_header = list(structures_[2][0]), structures_[2][1]
+
+        sequences = []
+        for fragment in fragments:
+            seq_list[nzone_range[0]:nzone_range[1]] = fragment
+
+            if(is_complementary):
+                seq_list[NZONE_COMP_RANGE[0]:NZONE_COMP_RANGE[1]] = [NUCLEOTIDES_SUBSTITUTION_DICT[elem] for elem in  seq_list[nzone_range[0] + 4:nzone_range[1]]][::-1]
+
+            sequences.append(''.join(seq_list))
+        sequences_by_length.append(sequences)
+
+    accuracies, _ = cascade.cascade_fold(pool, sequences_by_length, [structures_[1] for structures_ in task['structures']],
+                                         task['cascade_threshold'])
+    mutations = scoring.mutations_batch(fragments, nzone_fragment)
+
+    # fragments are generated in itertools.product order, so fragment code is its index
+    codes = np.arange(task['start'], task['stop'])
+    failed = np.array([any(sequences[idx] in pool.failed for sequences in sequences_by_length) for idx in range(len(fragments))],
+                      dtype=bool)
+    table = results.make_table(codes[~failed], mutations[~failed], accuracies.T[~failed], nzone_range[1] - nzone_range[0],
+                               [structures_[0] for structures_ in task['structures']])
+    return table, codes[failed].tolist()
+
+
+def fold_fragment(task):
+    '''
+    Folds again single fragment which failed in its chunk
+    param task: task of fold_fragments with stop = start + 1
+    raises: CoFold error if fragment fails again, so it stays quarantined in journal
+    returns: result of fold_fragments
+    '''
+
+    table, failed = fold_fragments(task)
+    if failed:
+        raise cofold_pool.CoFoldError("Fragment %d failed to fold" % task['start'])
+    return table, failed
+
+
+def encode_chunk(res):
+    '''
+    Converts result of fold_fragments to JSON value of journal
+    param res: tuple (result table, list of codes of failed fragments)
+    returns: dictionary with rows and failed codes
+    '''
+
+    table, failed = res
+    return {'rows' : journal_lib.table_to_json(table), 'failed' : failed}
+
+
+def journal_config(sequence_path, structure_path, parameters_path, alpha, tau, nzone_range, is_complementary, backend=BACKEND,
+                   cascade_threshold=CASCADE_THRESHOLD, shard=None):
+    '''
+    Configuration of sweep kept in journal, journal of other configuration is not resumed
+    param sequence_path: file path of analysed sequence
+    param structure_path: file path of dot-bracket structure of analysed sequence
+    param parameters_path: file path of parameters file for CoFold
+    param alpha: alpha parameter of CoFold execution
+    param tau: tau parameter of CoFold execution
+    param nzone_range: range of nucleotides sequence that should be generated
+    param is_complementary: parameter for complementary sequence adjustments
+    param backend: name of folding backend - cofold or vienna
+    param cascade_threshold: accuracy below which longer structure lengths are not folded
+    param shard: tuple (index, count) or None
+    returns: dictionary
+    '''
+
+    return {'mode' : '-35 region', 'sequence_path' : sequence_path, 'structure_path' : structure_path,
+            'parameters_path' : os.path.abspath(parameters_path), 'alpha' : alpha, 'tau' : tau, 'nzone_range' : list(nzone_range),
+            'is_complementary' : is_complementary, 'backend' : backend, 'cascade_threshold' : cascade_threshold,
+            'structure_lengths' : STRUCTURE_LENGTHS, 'chunk' : journal_lib.JOURNAL_CHUNK, 'shard' : list(shard) if shard else None}
+
+
+def generate_sequences_fold(sequence_path, structure_path, parameters_path, alpha, tau, nzone_range, is_complementary, jobs=1, backend=BACKEND,
+                            cascade_threshold=CASCADE_THRESHOLD, journal=None, output_path=None, shard=None) :
     '''
     Generates different sequences and checks accuracy of folded structure
     param sequence_path: file path of analysed sequence
@@ -139,111 +218,117 @@ def generate_sequences_fold(sequence_path, structure_path, parameters_path, alph
     param tau: tau parameter of CoFold execution
     param nzone_range: range of nucleotides sequence that should be generated
     param is_complementary: parameter for complementary sequence adjustments
+    param jobs: count of processes between which generated fragments are split
+    param backend: name of folding backend - cofold or vienna
+    param cascade_threshold: accuracy below which longer structure lengths are not folded, None folds every length
+    param journal: Journal object of finished chunks, resumed sweep folds only chunks and failed fragments missing in journal
+    param output_path: file path of result table (.npy or .parquet), None does not save table
+    param shard: tuple (index, count), only continuous range of fragment codes of shard is generated
     returns: array of traces for visualization
     '''
 
-    count = 0
-    res = []
     traces = []
     sequence_data = read_sequences_list(sequence_path)
     base_structures = [read_file(structure_path + "wt_p" + str(structure_length_) + ".dat") for structure_length_ in STRUCTURE_LENGTHS]
     structures__ = list(zip(STRUCTURE_LENGTHS, base_structures, sequence_data))
-    nzone_fragment = sequence_data[0][0][nzone_range[0]:nzone_range[1]]
-
-    gen_fragments = itertools.product(NUCLEOTIDES_DICT, repeat=6)
-
-    for fragment in gen_fragments:
-        mutations = check_diff_mut(nzone_fragment, ''.join(fragment))
-        structure_res = [''.join(fragment), mutations]
+    first_code, stop_code = sharding.shard_range(len(NUCLEOTIDES_DICT) ** (nzone_range[1] - nzone_range[0]), shard)
+    fragments_count = stop_code - first_code
+
+    fragment_length = nzone_range[1] - nzone_range[0]
+    dtype = results.table_dtype(fragment_length, STRUCTURE_LENGTHS)
+    chunks = parallel.split_range(fragments_count, -(-fragments_count // journal_lib.JOURNAL_CHUNK))
+    task = dict(structures=structures__, parameters_path=parameters_path, alpha=alpha, tau=tau, backend=backend,
+                workers=parallel.workers_per_job(jobs), nzone_range=nzone_range, is_complementary=is_complementary,
+                cascade_threshold=cascade_threshold)
+    tasks = [('%d-%d' % (first_code + start, first_code + stop), dict(task, start=first_code + start, stop=first_code + stop))
+             for start, stop in chunks]
+
+    progress = instrumentation.Progress('fragments', fragments_count)
+    tables, pending, retries = [], [], []
+    for key, task_ in tasks:
+        value = journal.get(key) if journal is not None else None
+        if value is None:
+            pending.append((key, task_))
+            continue
+        tables.append(journal_lib.table_from_json(value['rows'], dtype))
+        progress.update(len(tables[-1]))
+        # failed fragments of finished chunk are retried one by one until they are folded
+        for code in value['failed']:
+            key_ = '%d-%d' % (code, code + 1)
+            if journal.get(key_) is None:
+                retries.append((key_, dict(task, start=code, stop=code + 1)))
+            else:
+                tables.append(journal_lib.table_from_json(journal.get(key_)['rows'], dtype))
+                progress.update(len(tables[-1]))
+    for func, tasks_ in ((fold_fragments, pending), (fold_fragment, retries)):
+        for key, (chunk, _) in journal_lib.run_journaled(func, tasks_, jobs, journal, encode_chunk):
+            progress.update(len(chunk))
+            tables.append(chunk)
+    table = results.concatenate(tables) if tables else np.empty(0, dtype=dtype)
+    table = table[np.argsort(table[results.FRAGMENT_FIELD], kind='stable')]
+    if len(table) < fragments_count:
+        print("%d of %d fragments are missing from results%s" % (fragments_count - len(table), fragments_count,
+              ', resume --journal to retry them' if journal is not None else ''))
+    if output_path:
+        results.save_table(table, output_path)
+    x_field, y_field, z_field = results.accuracy_fields(table)
+    skipped = np.isnan(table[x_field]) | np.isnan(table[y_field]) | np.isnan(table[z_field])
+    print("Cascade skipped %d folds" % sum(cascade.skipped_count(table[field]) for field in (x_field, y_field, z_field)))
+
+    for mutations_count in range(nzone_range[1] - nzone_range[0] + 1):
+        trace_data = table[(table[results.MUTATIONS_FIELD] == mutations_count) & ~skipped]
+        traces.append(go.Scatter3d(
+            x=trace_data[x_field],
+            y=trace_data[y_field],
+            z=trace_data[z_field],
+            mode='markers',
+            name='%d mutations' % mutations_count,
+            text=results.decode_fragments(trace_data[results.FRAGMENT_FIELD], nzone_range[1] - nzone_range[0], NUCLEOTIDES_DICT)))
+
+    if skipped.any():
+        trace_data = table[skipped]
+        traces.append(go.Scatter3d(
+            x=cascade.plot_points(trace_data[x_field])[0],
+            y=cascade.plot_points(trace_data[y_field])[0],
+            z=cascade.plot_points(trace_data[z_field])[0],
+            mode='markers',
+            marker=dict(symbol=cascade.SKIPPED_SYMBOL),
+            name='skipped by cascade',
+            text=results.decode_fragments(trace_data[results.FRAGMENT_FIELD], nzone_range[1] - nzone_range[0], NUCLEOTIDES_DICT)))
 
-        for structures_ in structures__:
-            structure_length = structures_[0]
-            base_structure_ = structures_[1]
-            seq_list, sequence_header = structures_[2]
-
-            seq_list[nzone_range[0]:nzone_range[1]] = fragment
+    return traces
 
-            if(is_complementary):
-                seq_list[NZONE_COMP_RANGE[0]:NZONE_COMP_RANGE[1]] = [NUCLEOTIDES_SUBSTITUTION_DICT[elem] for elem in  seq_list[nzone_range[0] + 4:nzone_range[1]]][::-1]
 
-            new_seq = ''.join(seq_list)
-            write_file(TEMPFILE_PATH, sequence_header + new_seq)
-            cmd_out = os.popen('CoFold -d1 --noPS --distAlpha %.5f --distTau %.5f --paramFile=%s < %s' % (alpha, tau, parameters_path, TEMPFILE_PATH)).read()
-            sec_struc = (cmd_out.split('\n')[2]).split(' ')[0]
-            corr_perc = check_diff(base_structure_, sec_struc)
-
-            structure_res.append(corr_perc)
-
-        res.append(structure_res)
-        print("Iteration: %d Results: %s" % (count, str(structure_res)))
-        count = count + 1
-
-    data = np.asarray(res)
-    trace0_data = data[data[:,1] == '0']
-    trace1_data = data[data[:,1] == '1']
-    trace2_data = data[data[:,1] == '2']
-    trace3_data = data[data[:,1] == '3']
-    trace4_data = data[data[:,1] == '4']
-    trace5_data = data[data[:,1] == '5']
-    trace6_data = data[data[:,1] == '6']
-
-    trace0 = go.Scatter3d(
-        x=trace0_data[:,2].astype(float),
-        y=trace0_data[:,3].astype(float),
-        z=trace0_data[:,4].astype(float),
-        mode='markers',
-        name='0 mutations',
-        text=trace0_data[:,0])
-    trace1 = go.Scatter3d(
-        x=trace1_data[:,2].astype(float),
-        y=trace1_data[:,3].astype(float),
-        z=trace1_data[:,4].astype(float),
-        mode='markers',
-        name='1 mutations',
-        text=trace1_data[:,0])
-    trace2 = go.Scatter3d(
-        x=trace2_data[:,2].astype(float),
-        y=trace2_data[:,3].astype(float),
-        z=trace2_data[:,4].astype(float),
-        mode='markers',
-        name='2 mutations',
-        text=trace2_data[:,0])
-    trace3 = go.Scatter3d(
-        x=trace3_data[:,2].astype(float),
-        y=trace3_data[:,3].astype(float),
-        z=trace3_data[:,4].astype(float),
-        mode='markers',
-        name='3 mutations',
-        text=trace3_data[:,0])
-    trace4 = go.Scatter3d(
-        x=trace4_data[:,2].astype(float),
-        y=trace4_data[:,3].astype(float),
-        z=trace4_data[:,4].astype(float),
-        mode='markers',
-        name='4 mutations',
-        text=trace4_data[:,0])
-    trace5 = go.Scatter3d(
-        x=trace5_data[:,2].astype(float),
-        y=trace5_data[:,3].astype(float),
-        z=trace5_data[:,4].astype(float),
-        mode='markers',
-        name='5 mutations',
-        text=trace5_data[:,0])
-    trace6 = go.Scatter3d(
-        x=trace6_data[:,2].astype(float),
-        y=trace6_data[:,3].astype(float),
-        z=trace6_data[:,4].astype(float),
-        mode='markers',
-        name='6 mutations',
-        text=trace6_data[:,0])
-    traces = [trace0, trace1, trace2, trace3, trace4, trace5, trace6]
+def parse_arguments():
+    '''Parsing given arguments'''
 
-    return traces
+    parser = argparse.ArgumentParser(description='Generating sequences of -35 region')
+    parser.add_argument('--jobs', type=int, default=1, help='Count of processes used for folding')
+    parser.add_argument('--backend', type=str, default=BACKEND, choices=folding.BACKENDS, help='Folding backend')
+    parser.add_argument('--cascade-threshold', type=float, default=CASCADE_THRESHOLD,
+                        help='Accuracy below which candidate is not folded at longer structure lengths')
+    parser.add_argument('--journal', type=str, default=None, help='Journal file of finished chunks of fragments')
+    parser.add_argument('--resume', action='store_true', help='Skip chunks which are finished in --journal, failed fragments are retried')
+    parser.add_argument('--output', type=str, default=None, help='File of result table (.npy or .parquet)')
+    parser.add_argument('--shard', type=sharding.parse_shard, default=None, metavar='i/N',
+                        help='Generate shard i of N of fragments, --output gets .shard-i-of-N suffix')
+    return parser.parse_args()
 
 
 def main():
-    
-    traces = generate_sequences_fold(SEQUENCE_FILE, STRUCTURE_PATH, PARAMETERS_PATH, ALPHA, TAU, NZONE_RANGE, IS_COMPLEMENTARY)
+    args = parse_arguments()
+    config = journal_config(SEQUENCE_FILE, STRUCTURE_PATH, PARAMETERS_PATH, ALPHA, TAU, NZONE_RANGE, IS_COMPLEMENTARY, args.backend,
+                            args.cascade_threshold, args.shard)
+    journal = journal_lib.Journal(args.journal, args.resume, config) if args.journal else None
+    try:
+        traces = generate_sequences_fold(SEQUENCE_FILE, STRUCTURE_PATH, PARAMETERS_PATH, ALPHA, TAU, NZONE_RANGE, IS_COMPLEMENTARY, args.jobs,
+                                         args.backend, args.cascade_threshold, journal,
+                                         sharding.shard_path(args.output, args.shard) if args.output else None, args.shard)
+    finally:
+        if journal is not None:
+            journal.close()
+    if args.shard is not None:
+        return
     plot_scatter_chart("-35 region - one-sided -new", traces, "200 Accuracy", "555 Accuracy", "-35 region - one-sided -new")
 
     #results_df = pd.DataFrame(results)
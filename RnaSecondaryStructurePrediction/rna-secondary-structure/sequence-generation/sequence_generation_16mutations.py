@@ -10,6 +10,7 @@ Packages        :   https://www.tbi.univie.ac.at/RNA/#download
 """
 
 import os
+import sys
 import RNA
 import itertools
 import numpy as np
@@ -19,8 +20,12 @@ from IPython import embed
 import plotly.plotly as py
 import plotly.graph_objs as go
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+import folding
+import cascade
+import outputs
+
 SEQUENCE_FILE = '../_data/sequences/'
-TEMPFILE_PATH = '../_data/temp/temp.fasta'
 SVG_OUTFILE_PATH = '../_data/output/sequence-generation/16-mutations/'
 STRUCTURE_PATH = '../_data/secondary-structures/'
 PARAMETERS_PATH = '../_data/parameters/rna_andronescu2007.par'
@@ -59,6 +64,8 @@ STRUCTURE_LENGTHS = [132,140,200,555]
 
 ALPHA = 0.5
 TAU = 640
+BACKEND = 'cofold'
+CASCADE_THRESHOLD = cascade.CASCADE_THRESHOLD
 IS_COMPLEMENTARY = True
 IS_COMPARE = True
 
@@ -87,34 +94,6 @@ def write_file(file_path, output):
         fout.write(output)
 
 
-def check_diff(struc_1, struc_2):
-    '''
-    Check position-wise accuracy of two structures
-    param struc_1: dot-bracket structure of sequence 1
-    param struc_2: dot-bracket structure of sequence 2
-    returns: similarity between two structures percentage
-    '''
-    corr = 0
-    for idx, val in enumerate(struc_2):
-        if val == struc_1[idx]:
-            corr = corr + 1
-    return corr/len(struc_1)
-
-def check_diff_mut(seq_1, seq_2):
-    '''
-    Check position-wise accuracy of two sequences
-    param struc_1: string of sequence 1
-    param struc_2: string of sequence 2
-    returns: mutations between two sequences
-    '''
-
-    mutations = 0
-    for idx, val in enumerate(seq_1):
-        if val != seq_2[idx]:
-            mutations = mutations + 1
-    return mutations
-
-
 def plot_scatter_chart(title, data, xaxis, yaxis, filename):
     '''
     Plots scatter chart in polt.ly servers
@@ -170,39 +149,45 @@ def generate_sequences_fold(sequence_path, structure_path, parameters_path, alph
     returns: array of traces for visualization
     '''
 
+    pool = folding.get_folder(alpha, tau, parameters_path, BACKEND)
     traces = []
+    run_path = outputs.run_dir(SVG_OUTFILE_PATH)
     sequence_data = read_sequences_list(sequence_path)
     base_structures = [read_file(structure_path + "wt_p" + str(structure_length_) + ".dat") for structure_length_ in STRUCTURE_LENGTHS]
 
-    for mutation in mutations:
+    sequences_by_length = []
+    for seq_list_, sequence_header in sequence_data:
+        sequences = []
+        for mutation in mutations:
+            seq_list_[nzone_range[0]:nzone_range[1]] = [nucl.upper() for nucl in mutation]
+            sequences.append(''.join(seq_list_))
+        sequences_by_length.append(sequences)
+    accuracies, structures = cascade.cascade_fold(pool, sequences_by_length, base_structures, CASCADE_THRESHOLD)
+    print("Cascade skipped %d folds" % cascade.skipped_count(accuracies))
+
+    for mutation_idx, mutation in enumerate(mutations):
         structure_res = []
-        mutation_ = [nucl.upper() for nucl in mutation]
-        folder_path = SVG_OUTFILE_PATH + ''.join(mutation)
+        folder_path = os.path.join(run_path, ''.join(mutation))
         os.mkdir(folder_path)
 
-        for structures_ in zip(STRUCTURE_LENGTHS, base_structures, sequence_data):
-            structure_length = structures_[0]
-            base_structure_ = structures_[1]
-            seq_list_, sequence_header = structures_[2]
+        for length_idx, structure_length in enumerate(STRUCTURE_LENGTHS):
             print("%s_%d" % ("".join(mutation), structure_length))
+            corr_perc = accuracies[length_idx, mutation_idx]
+            sec_struc = structures[length_idx][mutation_idx]
 
-            seq_list_[nzone_range[0]:nzone_range[1]] = mutation_
-            new_seq = ''.join(seq_list_)
-            write_file(TEMPFILE_PATH, sequence_header + new_seq)
-            cmd_out = os.popen('CoFold -d1 --noPS --distAlpha %.5f --distTau %.5f --paramFile=%s < %s' % (alpha, tau, parameters_path, TEMPFILE_PATH)).read()
-            sec_struc = (cmd_out.split('\n')[2]).split(' ')[0]
-
-            corr_perc = check_diff(base_structure_, sec_struc)
-
-            RNA.svg_rna_plot(new_seq, sec_struc, "%s/%d_%.5f_%s.svg" % (folder_path, structure_length, corr_perc, ''.join(mutation)))
+            if sec_struc is not None:
+                new_seq = sequences_by_length[length_idx][mutation_idx]
+                RNA.svg_rna_plot(new_seq, sec_struc, "%s/%d_%.5f_%s.svg" % (folder_path, structure_length, corr_perc, ''.join(mutation)))
             structure_res.append([structure_length, corr_perc])
 
         data = np.asarray(structure_res)
         sorted_data = data[data[:,0].argsort()[::1]]
+        y, symbols = cascade.plot_points(sorted_data[:,1])
         trace = go.Scatter(
             x=sorted_data[:,0].astype(int),
-            y=sorted_data[:,1].astype(float),
+            y=y,
             mode='markers',
+            marker=dict(symbol=symbols),
             name=''.join(mutation))
         traces.append(trace)
 
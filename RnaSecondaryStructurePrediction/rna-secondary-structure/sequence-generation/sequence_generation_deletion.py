@@ -10,7 +10,9 @@ Packages        :   https://www.tbi.univie.ac.at/RNA/#download
 """
 
 import os
+import sys
 import RNA
+import argparse
 import itertools
 import numpy as np
 import pandas as pd
@@ -19,10 +21,16 @@ from IPython import embed
 import plotly.plotly as py
 import plotly.graph_objs as go
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+import folding
+import cascade
+import outputs
+import indels
+
 SEQUENCE_FILE = '../_data/sequences/'
-TEMPFILE_PATH = '../_data/temp/temp.fasta'
 SVG_OUTFILE_PATH = '../_data/output/sequence-generation/1-length-deletion/complementary/'
 STRUCTURE_PATH = '../_data/secondary-structures/'
+PROFILE_OUTFILE = '../_data/output/sequence-generation/indel-profile.npy'
 PARAMETERS_PATH = '../_data/parameters/rna_andronescu2007.par'
 
 NUCLEOTIDES_DICT = ['A', 'T', 'G', 'C']
@@ -43,8 +51,11 @@ STRUCTURE_LENGTHS = [132,140,200,555]
 
 ALPHA = 0.5
 TAU = 640
+BACKEND = 'cofold'
+CASCADE_THRESHOLD = cascade.CASCADE_THRESHOLD
 IS_COMPLEMENTARY = True
 IS_COMPARE = True
+WORST_POSITIONS = 10
 
 
 def read_file(file_path):
@@ -71,34 +82,6 @@ def write_file(file_path, output):
         fout.write(output)
 
 
-def check_diff(struc_1, struc_2):
-    '''
-    Check position-wise accuracy of two structures
-    param struc_1: dot-bracket structure of sequence 1
-    param struc_2: dot-bracket structure of sequence 2
-    returns: similarity between two structures percentage
-    '''
-    corr = 0
-    for idx, val in enumerate(struc_2):
-        if val == struc_1[idx]:
-            corr = corr + 1
-    return corr/len(struc_1)
-
-def check_diff_mut(seq_1, seq_2):
-    '''
-    Check position-wise accuracy of two sequences
-    param struc_1: string of sequence 1
-    param struc_2: string of sequence 2
-    returns: mutations between two sequences
-    '''
-
-    mutations = 0
-    for idx, val in enumerate(seq_1):
-        if val != seq_2[idx]:
-            mutations = mutations + 1
-    return mutations
-
-
 def plot_scatter_chart(title, data, xaxis, yaxis, filename):
     '''
     Plots scatter chart in polt.ly servers
@@ -154,49 +137,107 @@ def generate_sequences_fold(sequence_path, structure_path, parameters_path, alph
     returns: array of traces for visualization
     '''
 
+    pool = folding.get_folder(alpha, tau, parameters_path, BACKEND)
     traces = []
+    run_path = outputs.run_dir(SVG_OUTFILE_PATH)
     sequence_data = read_sequences_list(sequence_path)
     base_structures = [read_file(structure_path + "wt_p" + str(structure_length_) + ".dat") for structure_length_ in STRUCTURE_LENGTHS]
 
-    for i in range(NZONE_RANGE[0],NZONE_RANGE[1]):
-        structure_res = []
-        folder_path = SVG_OUTFILE_PATH + str(i)
-        os.mkdir(folder_path)
-
-        for structures_ in zip(STRUCTURE_LENGTHS, base_structures, sequence_data):
-            structure_length = structures_[0]
-            base_structure_ = structures_[1]
-            seq_list, sequence_header = structures_[2]
+    deletions = list(range(NZONE_RANGE[0],NZONE_RANGE[1]))
+    sequences_by_length = []
+    for seq_list, sequence_header in sequence_data:
+        sequences = []
+        for i in deletions:
             seq_list_ = list(seq_list)
-            print("%s_%d" % (str(i), structure_length))
-
             seq_list_.pop(i)
             if(is_complementary):
                 seq_list_.pop(i-34)
+            sequences.append(''.join(seq_list_))
+        sequences_by_length.append(sequences)
+    accuracies, structures = cascade.cascade_fold(pool, sequences_by_length, base_structures, CASCADE_THRESHOLD)
+    print("Cascade skipped %d folds" % cascade.skipped_count(accuracies))
 
-            new_seq = ''.join(seq_list_)
-            write_file(TEMPFILE_PATH, sequence_header + new_seq)
-            cmd_out = os.popen('CoFold -d1 --noPS --distAlpha %.5f --distTau %.5f --paramFile=%s < %s' % (alpha, tau, parameters_path, TEMPFILE_PATH)).read()
-            sec_struc = (cmd_out.split('\n')[2]).split(' ')[0]
+    for deletion_idx, i in enumerate(deletions):
+        structure_res = []
+        folder_path = os.path.join(run_path, str(i))
+        os.mkdir(folder_path)
 
-            corr_perc = check_diff(base_structure_, sec_struc)
+        for length_idx, structure_length in enumerate(STRUCTURE_LENGTHS):
+            print("%s_%d" % (str(i), structure_length))
+            corr_perc = accuracies[length_idx, deletion_idx]
+            sec_struc = structures[length_idx][deletion_idx]
 
-            RNA.svg_rna_plot(new_seq, sec_struc, "%s/%d_%.5f_%s.svg" % (folder_path, structure_length, corr_perc, str(i)))
+            if sec_struc is not None:
+                new_seq = sequences_by_length[length_idx][deletion_idx]
+                RNA.svg_rna_plot(new_seq, sec_struc, "%s/%d_%.5f_%s.svg" % (folder_path, structure_length, corr_perc, str(i)))
             structure_res.append([structure_length, corr_perc])
 
         data = np.asarray(structure_res)
         sorted_data = data[data[:,0].argsort()[::1]]
+        y, symbols = cascade.plot_points(sorted_data[:,1])
         trace = go.Scatter(
             x=sorted_data[:,0].astype(int),
-            y=sorted_data[:,1].astype(float),
+            y=y,
             mode='markers',
+            marker=dict(symbol=symbols),
             name=str(i))
         traces.append(trace)
 
     return traces
 
 
+def scan_sequences_fold(sequence_path, structure_path, parameters_path, alpha, tau, kinds, jobs=1, backend=BACKEND,
+                        output_path=PROFILE_OUTFILE):
+    '''
+    Scans every indel of whole sequence of every structure length and saves per-position accuracy impact profile
+    param sequence_path: file path of analysed sequence
+    param structure_path: file path of dot-bracket structure of analysed sequence
+    param parameters_path: file path of parameters file for CoFold
+    param alpha: alpha parameter of CoFold execution
+    param tau: tau parameter of CoFold execution
+    param kinds: list of indel kinds
+    param jobs: count of processes used for folding
+    param backend: name of folding backend
+    param output_path: .npy file of profile - shape (count of kinds, count of structure lengths, longest sequence + 1)
+    returns: profile array
+    '''
+
+    constructs = [(''.join(seq_list), read_file(structure_path + "wt_p" + str(structure_length) + ".dat"))
+                  for (seq_list, _), structure_length in zip(read_sequences_list(sequence_path), STRUCTURE_LENGTHS)]
+    profile, base_accuracies, folded = indels.scan_indels(constructs, kinds, NUCLEOTIDES_DICT, alpha, tau, parameters_path,
+                                                          backend, jobs)
+    print("Folded unique sequences: %d" % folded)
+
+    for kind_idx, kind in enumerate(kinds):
+        for length_idx, structure_length in enumerate(STRUCTURE_LENGTHS):
+            impacts = profile[kind_idx, length_idx]
+            worst = np.argsort(np.where(np.isnan(impacts), np.inf, impacts))[:WORST_POSITIONS]
+            print("%s_%d accuracy: %.5f worst positions: %s" % (kind, structure_length, base_accuracies[length_idx],
+                  ' '.join("%d:%.5f" % (position, impacts[position]) for position in worst)))
+
+    np.save(output_path, profile)
+    return profile
+
+
+def parse_arguments():
+    '''Parsing given arguments'''
+
+    parser = argparse.ArgumentParser(description='Deletions of nzone range or indel scan of whole sequence')
+    parser.add_argument('--scan', action='store_true', help='Scan indels of whole sequence instead of nzone deletions')
+    parser.add_argument('--kinds', type=str, nargs='+', default=indels.INDEL_KINDS, choices=indels.INDEL_KINDS,
+                        help='Indel kinds of scan')
+    parser.add_argument('--jobs', type=int, default=1, help='Count of processes used for folding')
+    parser.add_argument('--backend', type=str, default=BACKEND, choices=folding.BACKENDS, help='Folding backend')
+    parser.add_argument('--output', type=str, default=PROFILE_OUTFILE, help='.npy file of indel impact profile')
+    return parser.parse_args()
+
+
 def main():
+    args = parse_arguments()
+    if args.scan:
+        scan_sequences_fold(SEQUENCE_FILE, STRUCTURE_PATH, PARAMETERS_PATH, ALPHA, TAU, args.kinds, args.jobs, args.backend,
+                            args.output)
+        return
     traces = generate_sequences_fold(SEQUENCE_FILE, STRUCTURE_PATH, PARAMETERS_PATH, ALPHA, TAU, NZONE_RANGE, IS_COMPLEMENTARY)
     plot_scatter_chart("1 length complementary deletion", traces, "Length of structure", "Accuracy", "1 length complementary deletions ")
 
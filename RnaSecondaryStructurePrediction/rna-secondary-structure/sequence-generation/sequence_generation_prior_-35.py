@@ -10,6 +10,7 @@ Packages        :   https://www.tbi.univie.ac.at/RNA/#download
 """
 
 import os
+import sys
 import RNA
 import itertools
 import numpy as np
@@ -19,10 +20,15 @@ from IPython import embed
 import plotly.plotly as py
 import plotly.graph_objs as go
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+import folding
+import results
+import scoring
+import priority_groups
+
 SEQUENCE_FILE = '../_data/sequences/wt_p160.fasta'
 SEQUENCE_FILE_C = '../_data/sequences/wt_p200.fasta'
 SEQUENCE_FILE_C2 = '../_data/sequences/wt_p555.fasta'
-TEMPFILE_PATH = '../_data/temp/temp.fasta'
 SVG_OUTFILE_PATH = 'NAN'
 STRUCTURE_PATH = '../_data/secondary-structures-folded/wt_p160.dat'
 STRUCTURE_PATH_C = '../_data/secondary-structures-folded/wt_p200.dat'
@@ -38,12 +44,14 @@ PRIORITY_GROUP_1 = [('C', 1), ('C', 2), ('A', 3), ('C', 4), ('G', 5), ('C', 6)]
 PRIORITY_GROUP_2 = [('A', 1), ('G', 2), ('C', 3), ('T', 4), ('A', 5), ('G', 6)]
 PRIORITY_GROUP_3 = [('G', 1), ('A', 2), ('G', 3), ('G', 4), ('T', 5), ('T', 6)]
 PRIORITY_GROUP_4 = [('T', 1), ('T', 2), ('T', 3), ('A', 4), ('C', 5), ('A', 6)]
+PRIORITY_GROUPS = [PRIORITY_GROUP_1, PRIORITY_GROUP_2, PRIORITY_GROUP_3, PRIORITY_GROUP_4]
 
 CUGU_RANGE = [107,111]
 NZONE_RANGE = [141,147]
 
 ALPHA = 0.5
 TAU = 640
+BACKEND = 'cofold'
 
 
 def read_file(file_path):
@@ -70,34 +78,6 @@ def write_file(file_path, output):
         fout.write(output)
 
 
-def check_diff(struc_1, struc_2):
-    '''
-    Check position-wise accuracy of two structures
-    param struc_1: dot-bracket structure of sequence 1
-    param struc_2: dot-bracket structure of sequence 2
-    returns: similarity between two structures percentage
-    '''
-    corr = 0
-    for idx, val in enumerate(struc_2):
-        if val == struc_1[idx]:
-            corr = corr + 1
-    return corr/len(struc_1)
-
-def check_diff_mut(seq_1, seq_2):
-    '''
-    Check position-wise accuracy of two sequences
-    param struc_1: string of sequence 1
-    param struc_2: string of sequence 2
-    returns: mutations between two sequences
-    '''
-
-    mutations = 0
-    for idx, val in enumerate(seq_1):
-        if val != seq_2[idx]:
-            mutations = mutations + 1
-    return mutations
-
-
 def plot_scatter_chart(title, data, xaxis, yaxis, filename):
     '''
     Plots scatter chart in polt.ly servers
@@ -135,7 +115,7 @@ def generate_sequences_fold(sequence_path, structure_path, parameters_path, alph
     returns: array of traces for visualization
     '''
 
-    count = 0
+    pool = folding.get_folder(alpha, tau, parameters_path, BACKEND)
     traces = []
     sequence_data = read_file(sequence_path).split("\n")
     sequence_data_c = read_file(SEQUENCE_FILE_C).split("\n")
@@ -143,102 +123,39 @@ def generate_sequences_fold(sequence_path, structure_path, parameters_path, alph
     base_structure = read_file(structure_path)
     base_structure_c = read_file(STRUCTURE_PATH_C)
     base_structure_c2 = read_file(STRUCTURE_PATH_C2)
-    seq_list = list(sequence_data[1])
-    seq_list_c = list(sequence_data_c[1])
-    seq_list_c2 = list(sequence_data_c2[1])
-    sequence_header = sequence_data[0] + '\n'
-    nzone_fragment = seq_list[nzone_range[0]:nzone_range[1]]
-
-    gen_praportions = itertools.product(NUMBERS_ARRAY, repeat=3)
-
-    for praportion in gen_praportions:
-        if sum(praportion) <= 6:
-            data = []
-            priority_1_count = praportion[0]
-            priority_2_count = praportion[1]
-            priority_3_count = praportion[2]
-            gen_priority_1 = itertools.combinations(PRIORITY_GROUP_1, priority_1_count)
-
-            for priority_1_group in gen_priority_1:
-                priority_1_group = np.asarray(priority_1_group) if priority_1_group else np.empty(shape=(0, 2))
-                priority_2_groups = [priority_2_element for priority_2_element in PRIORITY_GROUP_2 if str(priority_2_element[1]) not in priority_1_group[:,1]]
-                gen_priority_2 = itertools.combinations(priority_2_groups, priority_2_count)
-
-                for priority_2_group in gen_priority_2:
-                    priority_2_group = np.asarray(priority_2_group) if priority_2_group else np.empty(shape=(0, 2))
-                    priority_1_2_group = np.concatenate((priority_1_group[:,1], priority_2_group[:,1]))
-                    priority_3_groups = [priority_3_element for priority_3_element in PRIORITY_GROUP_3 if str(priority_3_element[1]) not in priority_1_2_group]
-                    gen_priority_3 = itertools.combinations(priority_3_groups, priority_3_count)
-
-                    for priority_3_group in gen_priority_3:
-                        priority_3_group = np.asarray(priority_3_group) if priority_3_group else np.empty(shape=(0, 2))
-                        priority_1_2_3_group = np.concatenate((priority_1_group[:,1], priority_2_group[:,1], priority_3_group[:,1]))
-                        priority_4_groups = [priority_4_element for priority_4_element in PRIORITY_GROUP_4 if str(priority_4_element[1]) not in priority_1_2_3_group]
-                        gen_priority_4 = itertools.combinations(priority_4_groups, 6 - priority_3_count - priority_2_count - priority_1_count)
-
-                        for priority_4_group in gen_priority_4:
-                            priority_4_group = np.asarray(priority_4_group) if priority_4_group else np.empty(shape=(0, 2))
-
-                            gen_fragment = np.concatenate((priority_1_group, priority_2_group, priority_3_group, priority_4_group))
-                            sorted_fragment = gen_fragment[gen_fragment[:,1].argsort()[::1]][:,0]
-
-                            seq_list[nzone_range[0]:nzone_range[1]] = sorted_fragment
-                            seq_list_c[nzone_range[0]:nzone_range[1]] = sorted_fragment
-                            seq_list_c2[nzone_range[0]:nzone_range[1]] = sorted_fragment
-
-                            '''
-                            if(is_complementary):
-                                seq_list[NZONE_COMP_RANGE[0]:NZONE_COMP_RANGE[0] + 2] = [NUCLEOTIDES_SUBSTITUTION_DICT[elem] for elem in  seq_list[nzone_range[0] + 4:nzone_range[1]]][::-1]
-                                seq_list[NZONE_COMP_RANGE[0] + 2:NZONE_COMP_RANGE[1]] = [NUCLEOTIDES_SUBSTITUTION_DICT[elem] for elem in  seq_list[nzone_range[0]:nzone_range[0] +2]][::-1]
-                                seq_list_c2[NZONE_COMP_RANGE[0]:NZONE_COMP_RANGE[0] + 2] = [NUCLEOTIDES_SUBSTITUTION_DICT[elem] for elem in  seq_list[nzone_range[0] + 4:nzone_range[1]]][::-1]
-                                seq_list_c2[NZONE_COMP_RANGE[0] + 2:NZONE_COMP_RANGE[1]] = [NUCLEOTIDES_SUBSTITUTION_DICT[elem] for elem in  seq_list[nzone_range[0]:nzone_range[0] +2]][::-1]
-                                #seq_list[NZONE_COMP_RANGE_2[0]:NZONE_COMP_RANGE_2[1]] = [NUCLEOTIDES_SUBSTITUTION_DICT[elem] for elem in  seq_list[nzone_range[0]:nzone_range[1]]][::-1]
-                                #seq_list_c2[NZONE_COMP_RANGE_2[0]:NZONE_COMP_RANGE_2[1]] = [NUCLEOTIDES_SUBSTITUTION_DICT[elem] for elem in  seq_list[nzone_range[0]:nzone_range[1]]][::-1]
-                            '''
-
-                            new_seq = ''.join(seq_list)
-                            write_file(TEMPFILE_PATH, sequence_header + new_seq)
-                            cmd_out = os.popen('CoFold -d1 --noPS --distAlpha %.5f --distTau %.5f --paramFile=%s < %s' % (alpha, tau, parameters_path, TEMPFILE_PATH)).read()
-
-                            sec_struc = (cmd_out.split('\n')[2]).split(' ')[0]
-                            corr_perc = check_diff(base_structure, sec_struc)
-                            cugu_connected = not(sec_struc[CUGU_RANGE[0]:CUGU_RANGE[1]] == '....')
-
-                            count = count + 1
-                            print("Iteration: %d" % count)
-
-                            new_seq_c = ''.join(seq_list_c)
-                            write_file(TEMPFILE_PATH, sequence_header + new_seq_c)
-                            cmd_out = os.popen('CoFold -d1 --noPS --distAlpha %.5f --distTau %.5f --paramFile=%s < %s' % (alpha, tau, parameters_path, TEMPFILE_PATH)).read()
-
-                            sec_struc_c = (cmd_out.split('\n')[2]).split(' ')[0]
-                            corr_perc_c = check_diff(base_structure_c, sec_struc_c)
-                            cugu_connected = not(sec_struc_c[CUGU_RANGE[0]:CUGU_RANGE[1]] == '....')
-
-                            new_seq_c2 = ''.join(seq_list_c2)
-                            write_file(TEMPFILE_PATH, sequence_header + new_seq_c2)
-                            cmd_out = os.popen('CoFold -d1 --noPS --distAlpha %.5f --distTau %.5f --paramFile=%s < %s' % (alpha, tau, parameters_path, TEMPFILE_PATH)).read()
-
-                            sec_struc_c2 = (cmd_out.split('\n')[2]).split(' ')[0]
-                            corr_perc_c2 = check_diff(base_structure_c2, sec_struc_c2)
-                            cugu_connected = not(sec_struc_c2[CUGU_RANGE[0]:CUGU_RANGE[1]] == '....')
-                            data.append([corr_perc, ''.join(sorted_fragment) + "_" + str(int(cugu_connected)), corr_perc_c, corr_perc_c2])
-
-
-            data = np.asarray(data)
-            sort_index = 0
-            sorted_data = data[data[:,sort_index].argsort()[::-1]]
-            indexed_data = sorted_data
-
-            trace = go.Scatter3d(
-                x=indexed_data[:,0].astype(float),
-                y=indexed_data[:,2].astype(float),
-                z=indexed_data[:,3].astype(float),
-                mode='markers',
-                name="p" + str(praportion[0]) +  "-p" + str(praportion[1]) +  "-p" + str(praportion[2]),
-                text=indexed_data[:,1])
-
-            traces.append(trace)
+    fragment_length = nzone_range[1] - nzone_range[0]
+
+    praportions = [praportion for praportion in itertools.product(NUMBERS_ARRAY, repeat=3) if sum(praportion) <= 6]
+    enumerated, codes = priority_groups.enumerate_proportions(PRIORITY_GROUPS, praportions, NUCLEOTIDES_DICT)
+    fragments = results.decode_fragments(codes, fragment_length, NUCLEOTIDES_DICT)
+    print("Unique fragments: %d" % len(codes))
+
+    # every unique fragment is folded once for every sequence length
+    accuracies = []
+    for sequence_, base_structure_ in [(sequence_data, base_structure), (sequence_data_c, base_structure_c), (sequence_data_c2, base_structure_c2)]:
+        seq_ = sequence_[1].strip()
+        sequences = [seq_[:nzone_range[0]] + fragment + seq_[nzone_range[1]:] for fragment in fragments]
+        structures = [fold[0] for fold in pool.fold_many(sequences)]
+        accuracies.append(scoring.accuracy_batch(structures, [base_structure_])[:,0])
+        # CUGU connection of the last (longest) sequence is shown in chart
+        cugu_connected = np.array([structure[CUGU_RANGE[0]:CUGU_RANGE[1]] != '....' for structure in structures])
+
+    for praportion in praportions:
+        praportion_codes, _ = enumerated[praportion]
+        if not len(praportion_codes):
+            continue
+        idxs = np.searchsorted(codes, praportion_codes)
+        idxs = idxs[np.argsort(-accuracies[0][idxs], kind='stable')]
+
+        trace = go.Scatter3d(
+            x=accuracies[0][idxs],
+            y=accuracies[1][idxs],
+            z=accuracies[2][idxs],
+            mode='markers',
+            name="p" + str(praportion[0]) +  "-p" + str(praportion[1]) +  "-p" + str(praportion[2]),
+            text=["%s_%d" % (fragment, connected) for fragment, connected in zip(fragments[idxs], cugu_connected[idxs])])
+
+        traces.append(trace)
 
     return traces
 
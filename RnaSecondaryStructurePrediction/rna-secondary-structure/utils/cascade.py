@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#pylint: disable=
+"""
+File            : cascade.py
+Author          : Aurimas Repecka <aurimas.repecka AT gmail dot com>
+Description     : Cascade evaluation of candidates over structure lengths, shortest sequences are folded first
+                  and candidates below accuracy threshold are not folded at longer lengths.
+"""
+
+import numpy as np
+
+import scoring
+
+# None disables cascade, every candidate is folded at every length
+CASCADE_THRESHOLD = None
+SKIPPED_SYMBOL = 'x'
+FOLDED_SYMBOL = 'circle'
+
+
+def cascade_fold(folder, sequences_by_length, base_structures, threshold=CASCADE_THRESHOLD):
+    '''
+    Folds candidates from the shortest sequence to the longest, candidate is dropped once its accuracy is below threshold
+    param folder: folder object with fold_many method, None fold marks failed fold
+    param sequences_by_length: list of lists of candidate sequences, one list for every structure length
+    param base_structures: list of correct dot-bracket structures, one for every structure length
+    param threshold: minimal accuracy which candidate needs to be folded at longer lengths, None disables cascade
+    returns: tuple (float array of shape (count of lengths, count of candidates) with NaN for skipped folds,
+             list of lists of dot-bracket structures with None for skipped folds)
+    '''
+
+    candidates = len(sequences_by_length[0]) if sequences_by_length else 0
+    accuracies = np.full((len(sequences_by_length), candidates), np.nan)
+    structures = [[None] * candidates for _ in sequences_by_length]
+    order = sorted(range(len(sequences_by_length)), key=lambda idx: len(sequences_by_length[idx][0]) if candidates else 0)
+    active = np.arange(candidates)
+
+    for idx in order:
+        if not len(active):
+            break
+        folds = folder.fold_many([sequences_by_length[idx][candidate] for candidate in active])
+        # failed folds (None of journal.GuardedFolder) stay NaN and candidate is not folded at longer lengths
+        folded = np.array([fold is not None for fold in folds], dtype=bool)
+        folds = [fold for fold in folds if fold is not None]
+        active = active[folded]
+        for candidate, fold in zip(active, folds):
+            structures[idx][candidate] = fold[0]
+        if folds:
+            accuracies[idx, active] = scoring.accuracy_batch([fold[0] for fold in folds], [base_structures[idx]])[:,0]
+        if threshold is not None:
+            active = active[accuracies[idx, active] >= threshold]
+
+    return accuracies, structures
+
+
+def skipped_count(accuracies):
+    '''
+    Counts folds skipped by cascade
+    param accuracies: array of accuracies with NaN for skipped folds
+    returns: count of skipped folds
+    '''
+
+    return int(np.isnan(accuracies).sum())
+
+
+def plot_points(values):
+    '''
+    Prepares values for chart, skipped folds are drawn at zero with different marker
+    param values: array of accuracies with NaN for skipped folds
+    returns: tuple (array of values, list of marker symbols)
+    '''
+
+    values = np.asarray(values, dtype=float)
+    skipped = np.isnan(values)
+    return np.where(skipped, 0.0, values), np.where(skipped, SKIPPED_SYMBOL, FOLDED_SYMBOL).tolist()
@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#pylint: disable=
+"""
+File            : cofold_pool.py
+Author          : Aurimas Repecka <aurimas.repecka AT gmail dot com>
+Description     : Pool of long-lived CoFold processes which are fed with FASTA records
+                  through stdin instead of starting CoFold for every sequence.
+Packages        :   http://www.e-rna.org/cofold/
+"""
+
+import os
+import queue
+import atexit
+import threading
+import subprocess
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import outputs
+import instrumentation
+
+COFOLD_BINARY = 'CoFold'
+COFOLD_WORKERS = os.cpu_count() or 1
+MAX_POOLS = 8
+
+DEFAULT_HEADER = '>sequence'
+
+
+class CoFoldError(Exception):
+    "Raised when CoFold process dies or returns unexpected output"
+    pass
+
+
+def cofold_command(alpha, tau, parameters_path, binary=COFOLD_BINARY):
+    '''
+    Builds CoFold command line
+    param alpha: alpha parameter of CoFold execution
+    param tau: tau parameter of CoFold execution
+    param parameters_path: file path of parameters file for CoFold
+    param binary: name or path of CoFold executable
+    returns: list of command arguments
+    '''
+
+    return [binary, '-d1', '--noPS', '--distAlpha', '%.5f' % alpha, '--distTau', '%.5f' % tau,
+            '--paramFile=%s' % os.path.abspath(parameters_path)]
+
+
+def parse_structure_line(line, length=None):
+    '''
+    Parses CoFold structure line
+    param line: string in form of "dot-bracket ( energy)"
+    param length: length of folded sequence, None skips length check
+    raises: CoFold error if line is not dot-bracket structure of given length followed by energy
+    returns: tuple of (dot-bracket structure, minimal free energy)
+    '''
+
+    line = line.strip()
+    structure, _, energy = line.partition(' ')
+    if not structure or not energy or structure.strip('.()'):
+        raise CoFoldError("Unexpected CoFold output line: %r" % line)
+    if length is not None and len(structure) != length:
+        raise CoFoldError("CoFold structure of length %d for sequence of length %d: %r" % (len(structure), length, line))
+    try:
+        mfe = float(energy.strip().strip('()'))
+    except ValueError:
+        raise CoFoldError("Unexpected CoFold energy: %r" % line)
+    return structure, mfe
+
+
+class CoFoldWorker(object):
+    "Single CoFold process which folds one FASTA record at a time"
+
+    def __init__(self, command):
+        self.command = command
+        self.process = None
+        self.start()
+
+    def start(self):
+        "Starts CoFold process"
+        with instrumentation.timer('cofold.spawn'):
+            # CoFold runs in scratch of its process, files it may leave never collide with other runs
+            self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                universal_newlines=True, bufsize=1, cwd=outputs.scratch_dir())
+
+    def restart(self):
+        "Kills current CoFold process and starts new one"
+        self.close()
+        self.start()
+
+    def fold(self, sequence, header=DEFAULT_HEADER):
+        '''
+        Folds single sequence
+        param sequence: string of sequence
+        param header: FASTA header of sequence
+        returns: tuple of (dot-bracket structure, minimal free energy)
+        '''
+
+        header = header.strip() if header else DEFAULT_HEADER
+        if not header.startswith('>'):
+            header = '>' + header
+        if self.process is None:
+            raise CoFoldError("CoFold process is closed")
+        try:
+            # round trip to CoFold process, mostly folding time of CoFold itself
+            with instrumentation.timer('cofold.fold'):
+                self.process.stdin.write('%s\n%s\n' % (header, sequence.strip()))
+                self.process.stdin.flush()
+                lines = [self.process.stdout.readline() for _ in range(3)]
+        except (IOError, OSError) as err:
+            raise CoFoldError("CoFold process failed: %s" % err)
+
+        if not lines[2]:
+            raise CoFoldError("CoFold process exited with code %s" % self.process.poll())
+        if not lines[0].startswith('>'):
+            raise CoFoldError("Unexpected CoFold header: %r" % lines[0])
+        with instrumentation.timer('cofold.parse'):
+            return parse_structure_line(lines[2], len(sequence.strip()))
+
+    def close(self):
+        "Closes stdin of CoFold process and waits for it to finish"
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except (IOError, OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        finally:
+            self.process.stdout.close()
+            self.process = None
+
+
+def cofold_version(binary=COFOLD_BINARY):
+    '''
+    Returns version string of CoFold executable
+    param binary: name or path of CoFold executable
+    returns: first line of CoFold --version output
+    '''
+
+    try:
+        out = subprocess.check_output([binary, '--version'], stdin=subprocess.DEVNULL, stderr=subprocess.STDOUT,
+            universal_newlines=True)
+    except (OSError, subprocess.CalledProcessError):
+        return 'cofold-unknown'
+    return 'cofold-%s' % (out.strip().split('\n')[0] if out.strip() else 'unknown')
+
+
+class CoFoldPool(object):
+    "Pool of CoFold workers sharing the same alpha, tau and parameters file"
+
+    name = 'cofold'
+
+    def __init__(self, alpha, tau, parameters_path, workers=COFOLD_WORKERS, binary=COFOLD_BINARY):
+        self.alpha = alpha
+        self.tau = tau
+        self.parameters_path = parameters_path
+        self.workers = max(1, workers)
+        self.binary = binary
+        self.command = cofold_command(alpha, tau, parameters_path, binary)
+        self.cofold_version = None
+        self.all_workers = []
+        self.idle = queue.Queue()
+        self.lock = threading.Lock()
+        self.executor = None
+        # count of folds in progress, shared pools are only evicted when none is running
+        self.active = 0
+
+    @property
+    def version(self):
+        "Version of CoFold executable, used to address cached folds"
+        if self.cofold_version is None:
+            self.cofold_version = cofold_version(self.binary)
+        return self.cofold_version
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def hold(self):
+        "Marks start of fold, pool with folds in progress is not evicted"
+        with self.lock:
+            self.active = self.active + 1
+
+    def release(self):
+        "Marks end of fold"
+        with self.lock:
+            self.active = self.active - 1
+
+    def acquire(self):
+        "Returns idle worker, starts new one if pool is not full yet"
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self.lock:
+            if len(self.all_workers) < self.workers:
+                worker = CoFoldWorker(self.command)
+                self.all_workers.append(worker)
+                return worker
+        return self.idle.get()
+
+    def fold(self, sequence, header=DEFAULT_HEADER):
+        '''
+        Folds single sequence using idle worker
+        param sequence: string of sequence
+        param header: FASTA header of sequence
+        returns: tuple of (dot-bracket structure, minimal free energy)
+        '''
+
+        self.hold()
+        try:
+            worker = self.acquire()
+            try:
+                return worker.fold(sequence, header)
+            except CoFoldError:
+                worker.restart()
+                raise
+            finally:
+                self.idle.put(worker)
+        finally:
+            self.release()
+
+    def fold_many(self, sequences):
+        '''
+        Folds multiple sequences using all workers of pool
+        param sequences: iterable of sequence strings
+        returns: list of tuples (dot-bracket structure, minimal free energy) in order of sequences
+        '''
+
+        self.hold()
+        try:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(self.workers)
+            return list(self.executor.map(self.fold, sequences))
+        finally:
+            self.release()
+
+    def close(self):
+        "Stops all workers of pool"
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        with self.lock:
+            self.close_workers()
+
+    def close_idle(self):
+        '''
+        Stops all workers of pool unless some fold is in progress
+        returns: True if pool was stopped
+        '''
+
+        with self.lock:
+            if self.active:
+                return False
+            if self.executor is not None:
+                # no fold is running, so executor has no pending work to wait for
+                self.executor.shutdown(wait=False)
+                self.executor = None
+            self.close_workers()
+        return True
+
+    def close_workers(self):
+        "Closes every CoFold process, lock of pool is held by caller"
+        for worker in self.all_workers:
+            worker.close()
+        self.all_workers = []
+        self.idle = queue.Queue()
+
+
+POOLS = OrderedDict()
+POOLS_LOCK = threading.Lock()
+
+
+def get_pool(alpha, tau, parameters_path, workers=COFOLD_WORKERS):
+    '''
+    Returns shared pool for given CoFold parameters and worker count, least recently used idle pools are closed
+    param alpha: alpha parameter of CoFold execution
+    param tau: tau parameter of CoFold execution
+    param parameters_path: file path of parameters file for CoFold
+    param workers: maximum count of CoFold processes in pool
+    returns: CoFoldPool object
+    '''
+
+    key = ('%.5f' % alpha, '%.5f' % tau, os.path.abspath(parameters_path), max(1, workers))
+    with POOLS_LOCK:
+        pool = POOLS.pop(key, None)
+        if pool is None:
+            pool = CoFoldPool(alpha, tau, parameters_path, workers)
+        POOLS[key] = pool
+        # pools folding in other threads are kept, they are evicted by later calls once idle
+        for old_key in list(POOLS):
+            if len(POOLS) <= MAX_POOLS:
+                break
+            if old_key != key and POOLS[old_key].close_idle():
+                del POOLS[old_key]
+    return pool
+
+
+def close_pools():
+    "Stops all shared pools"
+    with POOLS_LOCK:
+        while POOLS:
+            POOLS.popitem()[1].close()
+
+
+def reset_pools():
+    "Forgets pools inherited from parent process, used as initializer of forked processes"
+    POOLS.clear()
+
+atexit.register(close_pools)
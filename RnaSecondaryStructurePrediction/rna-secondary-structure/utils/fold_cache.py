@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#pylint: disable=
+"""
+File            : fold_cache.py
+Author          : Aurimas Repecka <aurimas.repecka AT gmail dot com>
+Description     : Persistent SQLite cache of folded structures shared by all experiment scripts.
+"""
+
+import os
+import atexit
+import hashlib
+import sqlite3
+import threading
+
+import instrumentation
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '_data', 'cache', 'folds.sqlite')
+SQLITE_TIMEOUT = 60
+SQLITE_BATCH = 500
+
+PARAMETERS_HASHES = {}
+CACHES = []
+
+
+def file_hash(file_path):
+    '''
+    Calculates sha1 hash of file content, hashes are remembered while file is not modified
+    param file_path: path to file
+    raises: file not found error
+    returns: hex digest string
+    '''
+
+    file_path = os.path.abspath(file_path)
+    key = (file_path, os.path.getmtime(file_path))
+    if key not in PARAMETERS_HASHES:
+        with open(file_path, 'rb') as fin:
+            PARAMETERS_HASHES[key] = hashlib.sha1(fin.read()).hexdigest()
+    return PARAMETERS_HASHES[key]
+
+
+def fold_key(sequence, alpha, tau, parameters_hash, backend_version):
+    '''
+    Builds content address of single fold
+    param sequence: string of sequence
+    param alpha: alpha parameter of CoFold distance penalty
+    param tau: tau parameter of CoFold distance penalty
+    param parameters_hash: hash of energy parameters file
+    param backend_version: string which identifies backend and its version
+    returns: hex digest string
+    '''
+
+    key = '%s|%.5f|%.5f|%s|%s' % (sequence.strip().upper(), alpha, tau, parameters_hash, backend_version)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class FoldCache(object):
+    "SQLite store of (dot-bracket structure, mfe) by fold key, safe for concurrent processes"
+
+    def __init__(self, cache_path=DEFAULT_CACHE_PATH):
+        self.cache_path = os.path.abspath(cache_path)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        cache_dir = os.path.dirname(self.cache_path)
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir, exist_ok=True)
+        self.connection().execute('CREATE TABLE IF NOT EXISTS folds '
+            '(key TEXT PRIMARY KEY, structure TEXT NOT NULL, mfe REAL NOT NULL)')
+        CACHES.append(self)
+
+    def connection(self):
+        "Returns sqlite connection of current thread and process"
+        if getattr(self.local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.cache_path, timeout=SQLITE_TIMEOUT, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return self.local.conn
+
+    def count(self, hits, misses):
+        "Updates hit and miss counters"
+        with self.lock:
+            self.hits = self.hits + hits
+            self.misses = self.misses + misses
+        instrumentation.count('cache.hits', hits)
+        instrumentation.count('cache.misses', misses)
+
+    def get_many(self, keys):
+        '''
+        Returns cached folds of given keys
+        param keys: list of fold keys
+        returns: dictionary of key to tuple (dot-bracket structure, mfe)
+        '''
+
+        res = {}
+        unique_keys = list(set(keys))
+        with instrumentation.timer('cache.get'):
+            for idx in range(0, len(unique_keys), SQLITE_BATCH):
+                batch = unique_keys[idx:idx + SQLITE_BATCH]
+                rows = self.connection().execute('SELECT key, structure, mfe FROM folds WHERE key IN (%s)'
+                    % ','.join('?' * len(batch)), batch)
+                for key, structure, mfe in rows:
+                    res[key] = (structure, mfe)
+        self.count(sum(1 for key in keys if key in res), sum(1 for key in keys if key not in res))
+        return res
+
+    def put_many(self, items):
+        '''
+        Stores folds, already existing keys are kept
+        param items: list of tuples (key, (dot-bracket structure, mfe))
+        '''
+
+        conn = self.connection()
+        with instrumentation.timer('cache.put'), conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany('INSERT OR IGNORE INTO folds (key, structure, mfe) VALUES (?, ?, ?)',
+                [(key, res[0], res[1]) for key, res in items])
+
+    def clear(self):
+        "Removes every cached fold"
+        conn = self.connection()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM folds')
+
+    def stats(self):
+        "Returns dictionary of hit and miss counts"
+        return {'hits' : self.hits, 'misses' : self.misses}
+
+    def report(self):
+        "Prints hit and miss counts"
+        if self.hits or self.misses:
+            print("Fold cache %s: %d hits, %d misses" % (self.cache_path, self.hits, self.misses))
+
+
+class CachedFolder(object):
+    "Folder wrapper which looks up folds in cache before folding"
+
+    def __init__(self, folder, cache):
+        self.folder = folder
+        self.cache = cache
+        self.key_prefix = None
+
+    def keys(self, sequences):
+        "Returns fold keys of sequences, parameters file is hashed on first use"
+        if self.key_prefix is None:
+            self.key_prefix = (file_hash(self.folder.parameters_path), self.folder.version)
+        return [fold_key(sequence, self.folder.alpha, self.folder.tau, *self.key_prefix) for sequence in sequences]
+
+    def fold(self, sequence, header=None):
+        '''
+        Folds single sequence or returns cached fold
+        param sequence: string of sequence
+        param header: FASTA header of sequence
+        returns: tuple of (dot-bracket structure, minimal free energy)
+        '''
+
+        key = self.keys([sequence])[0]
+        cached = self.cache.get_many([key])
+        if key in cached:
+            return cached[key]
+        res = self.folder.fold(sequence, header)
+        self.cache.put_many([(key, res)])
+        return res
+
+    def fold_many(self, sequences):
+        '''
+        Folds multiple sequences, only sequences missing in cache are folded
+        param sequences: iterable of sequence strings
+        returns: list of tuples (dot-bracket structure, minimal free energy) in order of sequences
+        '''
+
+        sequences = list(sequences)
+        keys = self.keys(sequences)
+        cached = self.cache.get_many(keys)
+        missing = {}
+        for key, sequence in zip(keys, sequences):
+            if key not in cached:
+                missing[key] = sequence
+        if missing:
+            folded = list(zip(missing.keys(), self.folder.fold_many(list(missing.values()))))
+            self.cache.put_many(folded)
+            cached.update(folded)
+        return [cached[key] for key in keys]
+
+    def close(self):
+        "Closes wrapped folder"
+        self.folder.close()
+
+
+def report_caches():
+    "Prints statistics of every cache opened in this process"
+    for cache in CACHES:
+        cache.report()
+
+atexit.register(report_caches)
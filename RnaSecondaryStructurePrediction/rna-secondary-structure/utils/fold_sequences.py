@@ -20,16 +20,20 @@ from IPython import embed
 import plotly.plotly as py
 import plotly.graph_objs as go
 
-SEQUENCE_FILE = '../../../sequences/'
-TEMPFILE_PATH = '../../../temp/temp.fasta'
+import folding
+import outputs
+from scoring import check_diff, check_diff_mut
+
+SEQUENCE_FILE = '../_data/sequences/'
 OUTFILES_PATH = '../_data/output/folded-mutations/'
-STRUCTURE_PATH = '../../../secondary-structures/'
-FOLDED_STRUCTURE_PATH = '../../../secondary-structures-folded/'
-PARAMETERS_PATH = '../../../parameters/rna_andronescu2007.par'
+STRUCTURE_PATH = '../_data/secondary-structures/'
+FOLDED_STRUCTURE_PATH = '../_data/secondary-structures-folded/'
+PARAMETERS_PATH = '../_data/parameters/rna_andronescu2007.par'
 
 STRUCTURE_LENGTHS = [132,140,160,200,555]
 ALPHA = 0.5
 TAU = 640
+BACKEND = 'cofold'
 
 
 def read_file(file_path):
@@ -56,33 +60,6 @@ def write_file(file_path, output):
         fout.write(output)
 
 
-def check_diff(struc_1, struc_2):
-    '''
-    Check position-wise accuracy of two structures
-    param struc_1: dot-bracket structure of sequence 1
-    param struc_2: dot-bracket structure of sequence 2
-    returns: similarity between two structures percentage
-    '''
-    corr = 0
-    for idx, val in enumerate(struc_2):
-        if val == struc_1[idx]:
-            corr = corr + 1
-    return corr/len(struc_1)
-
-def check_diff_mut(seq_1, seq_2):
-    '''
-    Check position-wise accuracy of two sequences
-    param struc_1: string of sequence 1
-    param struc_2: string of sequence 2
-    returns: mutations between two sequences
-    '''
-
-    mutations = 0
-    for idx, val in enumerate(seq_1):
-        if val != seq_2[idx]:
-            mutations = mutations + 1
-    return mutations
-
 def parse_arguments():
     '''Parsing given arguments'''
 
@@ -111,14 +88,14 @@ def generate_sequences_fold(sequence_path, structure_path, parameters_path, alph
     returns: array of traces for visualization
     '''
 
+    pool = folding.get_folder(alpha, tau, parameters_path, BACKEND)
     mutations_count = [0 for i in range(0, len(mutations))]
-    os.chdir(OUTFILES_PATH)
-    dirname = str(len(os.listdir())) + '_' + mutations_str
-    os.mkdir(dirname)
-    os.chdir(dirname)
-    os.mkdir('sequences')
-    os.mkdir('dot-bracket-structures')
-    os.mkdir('folded-structures')
+    # directory is created atomically and working directory is not changed, so concurrent runs do not collide
+    runs_count = len(os.listdir(OUTFILES_PATH)) if os.path.exists(OUTFILES_PATH) else 0
+    output_path = outputs.unique_dir(OUTFILES_PATH, str(runs_count) + '_' + mutations_str)
+    os.mkdir(os.path.join(output_path, 'sequences'))
+    os.mkdir(os.path.join(output_path, 'dot-bracket-structures'))
+    os.mkdir(os.path.join(output_path, 'folded-structures'))
 
     for structure_length in STRUCTURE_LENGTHS:
         #Reading related sequence
@@ -147,18 +124,17 @@ def generate_sequences_fold(sequence_path, structure_path, parameters_path, alph
             mutated_sequence[mutation_idx:mutation_idx+len(mutation_seq)] = mutation_seq
 
         #Fold mutated sequence
-        write_file(TEMPFILE_PATH, sequence_header + ''.join(mutated_sequence))
-        cmd_out = os.popen('CoFold -d1 --noPS --distAlpha %.5f --distTau %.5f --paramFile=%s < %s' % (alpha, tau, parameters_path, TEMPFILE_PATH)).read()
-        sec_struc = (cmd_out.split('\n')[2]).split(' ')[0]
+        sec_struc = pool.fold(''.join(mutated_sequence), sequence_header)[0]
         corr_perc = check_diff(base_structure, sec_struc)
         corr_perc_folded = check_diff(base_structure_folded, sec_struc)
 
         #Save results
-        write_file('sequences/p%d.fasta' % (structure_length), '>' + mutations_str + '_p' + str(structure_length) + '\n' + ''.join(mutated_sequence))
-        write_file('dot-bracket-structures/p%d.dat' % (structure_length), sec_struc)
-        RNA.svg_rna_plot(''.join(mutated_sequence), sec_struc, "folded-structures/%d_%.5f_%.5f.svg" % (structure_length, corr_perc, corr_perc_folded))
+        write_file(os.path.join(output_path, 'sequences/p%d.fasta' % (structure_length)), '>' + mutations_str + '_p' + str(structure_length) + '\n' + ''.join(mutated_sequence))
+        write_file(os.path.join(output_path, 'dot-bracket-structures/p%d.dat' % (structure_length)), sec_struc)
+        RNA.svg_rna_plot(''.join(mutated_sequence), sec_struc, os.path.join(output_path,
+            "folded-structures/%d_%.5f_%.5f.svg" % (structure_length, corr_perc, corr_perc_folded)))
 
-    write_file('meta-data.txt', 'Index Mutation DiffCount \n' + str(list(zip(mutations,mutations_count))))
+    write_file(os.path.join(output_path, 'meta-data.txt'), 'Index Mutation DiffCount \n' + str(list(zip(mutations,mutations_count))))
 
 
 def main():
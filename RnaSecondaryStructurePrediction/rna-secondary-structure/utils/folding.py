@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#pylint: disable=
+"""
+File            : folding.py
+Author          : Aurimas Repecka <aurimas.repecka AT gmail dot com>
+Description     : Selection of folding backend shared by all experiment scripts.
+Packages        :   https://www.tbi.univie.ac.at/RNA/#download
+                    http://www.e-rna.org/cofold/
+"""
+
+import os
+import glob
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import fold_cache
+import cofold_pool
+
+BACKENDS = ['cofold', 'vienna']
+DEFAULT_BACKEND = 'cofold'
+# FOLD_CACHE_PATH environment variable moves cache, e.g. benchmarks keep their folds out of experiment cache
+FOLD_CACHE_PATH = os.environ.get('FOLD_CACHE_PATH', fold_cache.DEFAULT_CACHE_PATH)
+PARAMETERS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '_data', 'parameters')
+ALL_PARAMETER_SETS = 'all'
+
+VIENNA_BACKENDS = {}
+FOLDERS_LOCK = threading.Lock()
+FOLD_CACHES = {}
+
+
+def get_folder(alpha, tau, parameters_path, backend=DEFAULT_BACKEND, workers=cofold_pool.COFOLD_WORKERS,
+               cache_path=FOLD_CACHE_PATH):
+    '''
+    Returns folder object of given backend, every folder has fold and fold_many methods
+    param alpha: alpha parameter of CoFold distance penalty
+    param tau: tau parameter of CoFold distance penalty
+    param parameters_path: file path of energy parameters file
+    param backend: name of backend - cofold (external CoFold processes) or vienna (in-process ViennaRNA)
+    param workers: maximum count of CoFold processes
+    param cache_path: path of SQLite fold cache, None disables caching
+    raises: value error if backend is unknown
+    returns: folder object
+    '''
+
+    folder = get_backend(alpha, tau, parameters_path, backend, workers)
+    if cache_path is None:
+        return folder
+
+    cache_path = os.path.abspath(cache_path)
+    with FOLDERS_LOCK:
+        if cache_path not in FOLD_CACHES:
+            FOLD_CACHES[cache_path] = fold_cache.FoldCache(cache_path)
+    return fold_cache.CachedFolder(folder, FOLD_CACHES[cache_path])
+
+
+def get_backend(alpha, tau, parameters_path, backend=DEFAULT_BACKEND, workers=cofold_pool.COFOLD_WORKERS):
+    '''
+    Returns uncached folder object of given backend
+    param alpha: alpha parameter of CoFold distance penalty
+    param tau: tau parameter of CoFold distance penalty
+    param parameters_path: file path of energy parameters file
+    param backend: name of backend - cofold or vienna
+    param workers: maximum count of CoFold processes
+    raises: value error if backend is unknown
+    returns: folder object
+    '''
+
+    if backend == 'cofold':
+        return cofold_pool.get_pool(alpha, tau, parameters_path, workers)
+    elif backend == 'vienna':
+        import vienna_backend
+        key = ('%.5f' % alpha, '%.5f' % tau, os.path.abspath(parameters_path))
+        with FOLDERS_LOCK:
+            if key not in VIENNA_BACKENDS:
+                VIENNA_BACKENDS[key] = vienna_backend.ViennaBackend(alpha, tau, parameters_path)
+            return VIENNA_BACKENDS[key]
+    raise ValueError("Unknown folding backend %s, expected one of %s" % (backend, BACKENDS))
+
+
+def compare_backends(sequences, alpha, tau, parameters_path, backends=BACKENDS):
+    '''
+    Folds the same sequences with several backends
+    param sequences: list of sequence strings
+    param alpha: alpha parameter of CoFold distance penalty
+    param tau: tau parameter of CoFold distance penalty
+    param parameters_path: file path of energy parameters file
+    param backends: list of backend names
+    returns: dictionary of backend name to list of (dot-bracket structure, minimal free energy)
+    '''
+
+    return dict((backend, get_backend(alpha, tau, parameters_path, backend).fold_many(sequences)) for backend in backends)
+
+
+def parameter_sets(parameters, parameters_dir=PARAMETERS_DIR):
+    '''
+    Resolves energy parameters files
+    param parameters: file path, list of file paths or 'all' for every .par file of parameters directory
+    param parameters_dir: directory of parameters files
+    returns: list of file paths
+    '''
+
+    if parameters == ALL_PARAMETER_SETS:
+        return sorted(glob.glob(os.path.join(parameters_dir, '*.par')))
+    if isinstance(parameters, str):
+        return [parameters]
+    return list(parameters)
+
+
+def parameter_set_name(parameters_path):
+    '''
+    Short name of energy parameters file, e.g. turner2004 of rna_turner2004.par
+    param parameters_path: file path of parameters file
+    returns: string
+    '''
+
+    name = os.path.splitext(os.path.basename(parameters_path))[0]
+    return name[len('rna_'):] if name.startswith('rna_') else name
+
+
+class ParameterSetsFolder(object):
+    "Folds every sequence with several energy parameter sets, every set keeps its own resident folder"
+
+    def __init__(self, alpha, tau, parameters_paths, backend=DEFAULT_BACKEND, workers=cofold_pool.COFOLD_WORKERS,
+                 cache_path=FOLD_CACHE_PATH):
+        self.parameters_paths = list(parameters_paths)
+        self.names = [parameter_set_name(parameters_path) for parameters_path in self.parameters_paths]
+        # CoFold processes cannot switch parameters file, so workers are split between sets
+        self.folders = [get_folder(alpha, tau, parameters_path, backend, max(1, workers // len(self.parameters_paths)),
+                                   cache_path) for parameters_path in self.parameters_paths]
+        # ViennaRNA folds in this process, sets are folded one after another
+        self.concurrent = backend == 'cofold' and len(self.folders) > 1
+        self.executor = None
+
+    def fold(self, sequence, header=None):
+        '''
+        Folds single sequence with every parameter set
+        param sequence: string of sequence
+        param header: FASTA header of sequence
+        returns: list of tuples (dot-bracket structure, minimal free energy) in order of parameter sets
+        '''
+
+        return [folds[0] for folds in self.fold_many([sequence])]
+
+    def fold_many(self, sequences):
+        '''
+        Folds multiple sequences with every parameter set
+        param sequences: list of sequence strings
+        returns: list of lists of tuples (dot-bracket structure, minimal free energy), one list for every parameter set
+        '''
+
+        sequences = list(sequences)
+        if not self.concurrent:
+            return [folder.fold_many(sequences) for folder in self.folders]
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(len(self.folders))
+        return list(self.executor.map(lambda folder: folder.fold_many(sequences), self.folders))
+
+    def close(self):
+        "Stops thread pool, folders stay shared"
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+def get_parameter_sets_folder(alpha, tau, parameters, backend=DEFAULT_BACKEND, workers=cofold_pool.COFOLD_WORKERS,
+                              cache_path=FOLD_CACHE_PATH):
+    '''
+    Returns folder which evaluates the same sequences with several energy parameter sets side by side
+    param alpha: alpha parameter of CoFold distance penalty
+    param tau: tau parameter of CoFold distance penalty
+    param parameters: file path, list of file paths or 'all'
+    param backend: name of backend - cofold or vienna
+    param workers: maximum count of CoFold processes of all sets together
+    param cache_path: path of SQLite fold cache, None disables caching
+    raises: value error if no parameters file is found
+    returns: ParameterSetsFolder object
+    '''
+
+    parameters_paths = parameter_sets(parameters)
+    if not parameters_paths:
+        raise ValueError("No energy parameters files in %s" % parameters)
+    return ParameterSetsFolder(alpha, tau, parameters_paths, backend, workers, cache_path)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#pylint: disable=
+"""
+File            : indels.py
+Author          : Aurimas Repecka <aurimas.repecka AT gmail dot com>
+Description     : Scans single and double deletions and insertions across whole sequence and builds
+                  per-position accuracy impact profile.
+"""
+
+import itertools
+
+import numpy as np
+
+import folding
+import parallel
+import scoring
+
+INDEL_KINDS = ['deletion', 'double_deletion', 'insertion', 'double_insertion']
+# kind name: (count of nucleotides, True for insertion)
+INDEL_SIZES = {'deletion' : (1, False), 'double_deletion' : (2, False), 'insertion' : (1, True), 'double_insertion' : (2, True)}
+# deleted positions never match reference structure
+GAP = '-'
+
+
+def inserted_fragments(size, alphabet):
+    '''
+    Every fragment which can be inserted, index of fragment is its insert code
+    param size: count of inserted nucleotides
+    param alphabet: list of nucleotides
+    returns: list of fragment strings
+    '''
+
+    return [''.join(fragment) for fragment in itertools.product(alphabet, repeat=size)]
+
+
+def variant_descriptors(constructs, kinds, alphabet):
+    '''
+    Enumerates every indel of every construct
+    param constructs: list of tuples (sequence string, dot-bracket structure)
+    param kinds: list of indel kinds
+    param alphabet: list of nucleotides
+    returns: int array of shape (count of variants, 4) - construct index, kind index, position, insert code
+    '''
+
+    res = []
+    for construct_idx, (sequence, _) in enumerate(constructs):
+        for kind_idx, kind in enumerate(kinds):
+            size, is_insertion = INDEL_SIZES[kind]
+            positions = np.arange(len(sequence) + 1) if is_insertion else np.arange(len(sequence) - size + 1)
+            codes = np.arange(len(alphabet) ** size) if is_insertion else np.zeros(1, dtype=np.int64)
+            grid = np.array(np.meshgrid(positions, codes, indexing='ij')).reshape(2, -1).T
+            res.append(np.column_stack([np.full(len(grid), construct_idx), np.full(len(grid), kind_idx), grid]))
+    return np.concatenate(res).astype(np.int64) if res else np.zeros((0, 4), dtype=np.int64)
+
+
+def variant_sequence(sequence, kind, position, code, alphabet):
+    '''
+    Applies indel to sequence
+    param sequence: sequence string
+    param kind: indel kind
+    param position: first deleted position or position before which fragment is inserted
+    param code: insert code of inserted fragment, ignored for deletions
+    param alphabet: list of nucleotides
+    returns: sequence string
+    '''
+
+    size, is_insertion = INDEL_SIZES[kind]
+    if is_insertion:
+        return sequence[:position] + inserted_fragments(size, alphabet)[code] + sequence[position:]
+    return sequence[:position] + sequence[position + size:]
+
+
+def align_structure(structure, kind, position):
+    '''
+    Maps structure of indel variant back to coordinates of original sequence
+    param structure: dot-bracket structure of variant
+    param kind: indel kind
+    param position: position of indel
+    returns: dot-bracket structure of original length, deleted positions are GAP
+    '''
+
+    size, is_insertion = INDEL_SIZES[kind]
+    if is_insertion:
+        return structure[:position] + structure[position + size:]
+    return structure[:position] + GAP * size + structure[position:]
+
+
+def fold_variants(task):
+    '''
+    Folds chunk of unique variants, runs in separate process when several jobs are used
+    param task: dictionary with start, stop indexes of variants and parameters of scan_indels
+    returns: list of dot-bracket structures of chunk
+    '''
+
+    folder = folding.get_folder(task['alpha'], task['tau'], task['parameters_path'], task['backend'], task['workers'])
+    sequences = [variant_sequence(task['constructs'][construct_idx][0], task['kinds'][kind_idx], position, code, task['alphabet'])
+                 for construct_idx, kind_idx, position, code in task['descriptors'][task['start']:task['stop']]]
+    return [fold[0] for fold in folder.fold_many(sequences)]
+
+
+def scan_indels(constructs, kinds, alphabet, alpha, tau, parameters_path, backend=folding.DEFAULT_BACKEND, jobs=1):
+    '''
+    Folds every indel of every construct and averages accuracy change at every position
+    param constructs: list of tuples (sequence string, dot-bracket structure), one for every structure length
+    param kinds: list of indel kinds
+    param alphabet: list of nucleotides
+    param alpha: alpha parameter of CoFold distance penalty
+    param tau: tau parameter of CoFold distance penalty
+    param parameters_path: file path of energy parameters file
+    param backend: name of folding backend
+    param jobs: count of processes
+    returns: tuple (float32 array of shape (count of kinds, count of constructs, longest sequence + 1) with mean accuracy
+             change against unmodified sequence and NaN where indel does not exist, array of unmodified accuracies,
+             count of folded unique sequences)
+    '''
+
+    folder = folding.get_folder(alpha, tau, parameters_path, backend)
+    base_folds = folder.fold_many([sequence for sequence, _ in constructs])
+    base_accuracies = np.array([scoring.accuracy_batch([fold[0]], [structure])[0, 0]
+                                for fold, (_, structure) in zip(base_folds, constructs)])
+
+    descriptors = variant_descriptors(constructs, kinds, alphabet)
+    sequences = [variant_sequence(constructs[construct_idx][0], kinds[kind_idx], position, code, alphabet)
+                 for construct_idx, kind_idx, position, code in descriptors]
+    # identical variants (e.g. deletions inside homopolymer runs) are folded once
+    unique_idx = {}
+    for idx, sequence in enumerate(sequences):
+        unique_idx.setdefault(sequence, idx)
+    inverse = np.array([unique_idx[sequence] for sequence in sequences], dtype=np.int64)
+    representatives = np.unique(inverse)
+    del sequences, unique_idx
+
+    structures = []
+    for chunk in parallel.imap_chunks(fold_variants, len(representatives), jobs, constructs=constructs, kinds=kinds,
+                                      alphabet=alphabet, descriptors=descriptors[representatives], alpha=alpha, tau=tau,
+                                      parameters_path=parameters_path, backend=backend,
+                                      workers=parallel.workers_per_job(jobs)):
+        structures.extend(chunk)
+    structure_of = dict(zip(representatives.tolist(), structures))
+
+    width = max(len(sequence) for sequence, _ in constructs) + 1 if constructs else 0
+    totals = np.zeros((len(kinds), len(constructs), width))
+    counts = np.zeros((len(kinds), len(constructs), width))
+    for construct_idx, (_, reference) in enumerate(constructs):
+        mask = descriptors[:, 0] == construct_idx
+        rows = descriptors[mask]
+        aligned = [align_structure(structure_of[idx], kinds[kind_idx], position)
+                   for idx, (_, kind_idx, position, _) in zip(inverse[mask], rows)]
+        if not aligned:
+            continue
+        deltas = scoring.accuracy_batch(aligned, [reference])[:, 0] - base_accuracies[construct_idx]
+        np.add.at(totals, (rows[:, 1], construct_idx, rows[:, 2]), deltas)
+        np.add.at(counts, (rows[:, 1], construct_idx, rows[:, 2]), 1)
+
+    with np.errstate(invalid='ignore'):
+        profile = np.where(counts > 0, totals / np.maximum(counts, 1), np.nan).astype(np.float32)
+    return profile, base_accuracies, len(representatives)
@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#pylint: disable=
+"""
+File            : instrumentation.py
+Author          : Aurimas Repecka <aurimas.repecka AT gmail dot com>
+Description     : Low overhead timers, counters and histograms of hot path stages shared by all experiment scripts.
+                  Summary is printed on exit, INSTRUMENTATION_REPORT and INSTRUMENTATION_PROMETHEUS environment
+                  variables also write JSON report and Prometheus textfile.
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import bisect
+import threading
+import multiprocessing
+
+# INSTRUMENTATION=0 turns every timer and counter into no-op
+ENABLED = os.environ.get('INSTRUMENTATION', '1') != '0'
+REPORT_PATH = os.environ.get('INSTRUMENTATION_REPORT')
+PROMETHEUS_PATH = os.environ.get('INSTRUMENTATION_PROMETHEUS')
+METRIC_PREFIX = 'rna_'
+# upper bounds of histogram buckets in seconds
+HISTOGRAM_BUCKETS = (1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0, 10.0, 100.0)
+PROGRESS_INTERVAL = 10.0
+
+STAGES = {}
+COUNTERS = {}
+LOCK = threading.Lock()
+
+
+class StageStats(object):
+    "Count, total time and histogram of durations of single stage"
+
+    __slots__ = ('count', 'total', 'min', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        # last bucket counts durations above every bound
+        self.buckets = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+
+    def observe(self, seconds):
+        "Adds single duration"
+        self.count = self.count + 1
+        self.total = self.total + seconds
+        self.min = seconds if self.min is None or seconds < self.min else self.min
+        self.max = seconds if self.max is None or seconds > self.max else self.max
+        self.buckets[bisect.bisect_left(HISTOGRAM_BUCKETS, seconds)] += 1
+
+    def merge(self, stats):
+        "Adds stage statistics given as dictionary of to_dict"
+        self.count = self.count + stats['count']
+        self.total = self.total + stats['total']
+        if stats['min'] is not None:
+            self.min = stats['min'] if self.min is None else min(self.min, stats['min'])
+            self.max = stats['max'] if self.max is None else max(self.max, stats['max'])
+        self.buckets = [left + right for left, right in zip(self.buckets, stats['buckets'])]
+
+    def to_dict(self):
+        "Returns statistics as dictionary"
+        return {'count' : self.count, 'total' : self.total, 'min' : self.min, 'max' : self.max,
+                'mean' : self.total / self.count if self.count else None, 'buckets' : list(self.buckets)}
+
+
+class Timer(object):
+    "Context manager which adds its duration to stage"
+
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        observe(self.name, time.perf_counter() - self.start)
+
+
+class NullTimer(object):
+    "Timer used while instrumentation is disabled"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+NULL_TIMER = NullTimer()
+
+
+def timer(name):
+    '''
+    Times block of code - with instrumentation.timer('cofold.fold'): ...
+    param name: name of stage
+    returns: context manager
+    '''
+
+    return Timer(name) if ENABLED else NULL_TIMER
+
+
+def timed(name):
+    '''
+    Decorator which times every call of function
+    param name: name of stage
+    returns: decorator
+    '''
+
+    def decorator(func):
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - start)
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+    return decorator
+
+
+def observe(name, seconds):
+    '''
+    Adds duration to stage
+    param name: name of stage
+    param seconds: duration
+    '''
+
+    if not ENABLED:
+        return
+    with LOCK:
+        stats = STAGES.get(name)
+        if stats is None:
+            stats = STAGES[name] = StageStats()
+        stats.observe(seconds)
+
+
+def count(name, value=1):
+    '''
+    Increments counter
+    param name: name of counter
+    param value: increment
+    '''
+
+    if not ENABLED:
+        return
+    with LOCK:
+        COUNTERS[name] = COUNTERS.get(name, 0) + value
+
+
+def snapshot(reset=False):
+    '''
+    Returns statistics of this process
+    param reset: clears statistics after they are taken
+    returns: dictionary with stages and counters
+    '''
+
+    with LOCK:
+        res = {'stages' : dict((name, stats.to_dict()) for name, stats in STAGES.items()), 'counters' : dict(COUNTERS)}
+        if reset:
+            STAGES.clear()
+            COUNTERS.clear()
+    return res
+
+
+def merge(stats):
+    '''
+    Adds statistics of other process
+    param stats: dictionary of snapshot
+    '''
+
+    with LOCK:
+        for name, stage in stats['stages'].items():
+            STAGES.setdefault(name, StageStats()).merge(stage)
+        for name, value in stats['counters'].items():
+            COUNTERS[name] = COUNTERS.get(name, 0) + value
+
+
+def reset():
+    "Clears statistics, child processes start with empty statistics"
+    with LOCK:
+        STAGES.clear()
+        COUNTERS.clear()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset)
+
+
+def call(func, task):
+    '''
+    Runs function in worker process and returns statistics collected meanwhile, pair with collect in parent
+    param func: module level function
+    param task: argument of function
+    returns: tuple (result of function, statistics)
+    '''
+
+    res = func(task)
+    return res, snapshot(reset=True)
+
+
+def call_task(item):
+    "Runs call with tuple (func, task), used as function of process pools"
+    return call(*item)
+
+
+def collect(item):
+    '''
+    Merges statistics returned by call and returns result of function
+    param item: tuple (result, statistics)
+    returns: result of function
+    '''
+
+    res, stats = item
+    merge(stats)
+    return res
+
+
+class Progress(object):
+    "Counts processed items and periodically prints rate and ETA"
+
+    def __init__(self, name, total=None, interval=PROGRESS_INTERVAL):
+        '''
+        param name: name of progress and its counter
+        param total: count of items, None prints rate without ETA
+        param interval: minimal count of seconds between printed lines
+        '''
+
+        self.name = name
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.start = time.time()
+        self.printed = self.start
+
+    def update(self, items=1):
+        '''
+        Adds processed items, prints summary when interval has passed
+        param items: count of processed items
+        '''
+
+        self.done = self.done + items
+        count(self.name, items)
+        now = time.time()
+        if now - self.printed >= self.interval or (self.total is not None and self.done >= self.total):
+            self.printed = now
+            print(self.summary(now))
+
+    def summary(self, now=None):
+        "Returns line with count of items, rate and ETA"
+        elapsed = max((now or time.time()) - self.start, 1e-9)
+        rate = self.done / elapsed
+        if self.total is None:
+            return "%s: %d items %.1f/s elapsed %s" % (self.name, self.done, rate, format_seconds(elapsed))
+        eta = (self.total - self.done) / rate if rate > 0 else float('inf')
+        return "%s: %d/%d (%.1f%%) %.1f/s elapsed %s ETA %s" % (self.name, self.done, self.total,
+            100.0 * self.done / self.total if self.total else 100.0, rate, format_seconds(elapsed), format_seconds(eta))
+
+
+def format_seconds(seconds):
+    '''
+    Formats duration as h:mm:ss
+    param seconds: duration
+    returns: string
+    '''
+
+    if seconds == float('inf'):
+        return '?'
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return "%d:%02d:%02d" % (hours, minutes, seconds)
+
+
+def report():
+    "Returns statistics with process information as dictionary"
+    res = snapshot()
+    res.update({'created' : time.strftime('%Y-%m-%dT%H:%M:%S'), 'script' : os.path.basename(sys.argv[0]),
+                'pid' : os.getpid(), 'histogram_buckets' : list(HISTOGRAM_BUCKETS)})
+    return res
+
+
+def write_atomic(file_path, content):
+    "Writes file through temporary file so readers never see partial file"
+    folder_path = os.path.dirname(os.path.abspath(file_path))
+    if not os.path.exists(folder_path):
+        os.makedirs(folder_path, exist_ok=True)
+    tmp_path = '%s.%d.tmp' % (file_path, os.getpid())
+    with open(tmp_path, 'w') as fout:
+        fout.write(content)
+    os.replace(tmp_path, file_path)
+
+
+def write_json(file_path):
+    '''
+    Writes JSON report
+    param file_path: path of report
+    '''
+
+    write_atomic(file_path, json.dumps(report(), indent=2, sort_keys=True))
+
+
+def prometheus_text(stats=None):
+    '''
+    Formats statistics in Prometheus text exposition format
+    param stats: dictionary of snapshot, defaults to statistics of this process
+    returns: string
+    '''
+
+    stats = stats or snapshot()
+    lines = ['# HELP %sstage_seconds Time spent in hot path stage' % METRIC_PREFIX,
+             '# TYPE %sstage_seconds histogram' % METRIC_PREFIX]
+    for name, stage in sorted(stats['stages'].items()):
+        cumulative = 0
+        for bound, bucket in zip(list(HISTOGRAM_BUCKETS) + ['+Inf'], stage['buckets']):
+            cumulative = cumulative + bucket
+            lines.append('%sstage_seconds_bucket{stage="%s",le="%s"} %d' % (METRIC_PREFIX, name, bound, cumulative))
+        lines.append('%sstage_seconds_sum{stage="%s"} %r' % (METRIC_PREFIX, name, stage['total']))
+        lines.append('%sstage_seconds_count{stage="%s"} %d' % (METRIC_PREFIX, name, stage['count']))
+    lines.extend(['# HELP %sevents_total Count of events' % METRIC_PREFIX, '# TYPE %sevents_total counter' % METRIC_PREFIX])
+    for name, value in sorted(stats['counters'].items()):
+        lines.append('%sevents_total{name="%s"} %r' % (METRIC_PREFIX, name, value))
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(file_path):
+    '''
+    Writes Prometheus textfile, suitable for node exporter textfile collector
+    param file_path: path of .prom file
+    '''
+
+    write_atomic(file_path, prometheus_text())
+
+
+def print_summary():
+    "Prints total and mean time of every stage and every counter"
+    stats = snapshot()
+    for name, stage in sorted(stats['stages'].items(), key=lambda item: -item[1]['total']):
+        print("Stage %-28s %10d calls %10.3f s total %12.6f s mean" % (name, stage['count'], stage['total'], stage['mean']))
+    for name, value in sorted(stats['counters'].items()):
+        print("Counter %-26s %10d" % (name, value))
+
+
+def finish():
+    "Prints summary and writes configured reports, only main process reports"
+    if multiprocessing.current_process().name != 'MainProcess' or not (STAGES or COUNTERS):
+        return
+    print_summary()
+    if REPORT_PATH:
+        write_json(REPORT_PATH)
+    if PROMETHEUS_PATH:
+        write_prometheus(PROMETHEUS_PATH)
+
+atexit.register(finish)
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#pylint: disable=
+"""
+File            : journal.py
+Author          : Aurimas Repecka <aurimas.repecka AT gmail dot com>
+Description     : Append-only journal of finished work of long sweeps, so crashed sweeps resume where they stopped.
+                  Failing folds are retried and quarantined instead of aborting whole sweep, resumed sweeps retry them.
+                  First record keeps configuration of sweep, journal of different configuration is not resumed.
+"""
+
+import os
+import json
+
+import numpy as np
+
+import parallel
+import cofold_pool
+
+RETRIES = 2
+# errors of single fold which should not abort sweep
+RETRY_ERRORS = (cofold_pool.CoFoldError, OSError)
+# size of journaled chunks of candidates, independent of count of jobs so resumed runs split candidates the same way
+JOURNAL_CHUNK = 256
+
+
+class Journal(object):
+    "JSON lines file of finished keys with their values or errors, every record is flushed to disk when written"
+
+    def __init__(self, file_path, resume=False, config=None):
+        '''
+        param file_path: path of journal file
+        param resume: reads finished records of existing journal
+        param config: JSON serializable configuration of sweep, e.g. mode, parameters and backend
+        raises: file exists error if journal already has records and resume is not requested,
+                value error if resumed journal was written with different configuration
+        '''
+
+        self.file_path = file_path
+        self.records = {}
+        self.quarantined = {}
+        self.config = None
+        exists = os.path.exists(file_path) and os.path.getsize(file_path) > 0
+        if exists and not resume:
+            raise FileExistsError("Journal %s already exists, resume it or remove it" % file_path)
+        folder_path = os.path.dirname(os.path.abspath(file_path))
+        if not os.path.exists(folder_path):
+            os.makedirs(folder_path, exist_ok=True)
+        if exists:
+            self.load()
+            # configuration is compared as JSON, so tuples equal lists of journal
+            if config is not None and self.config != json.loads(json.dumps(config)):
+                raise ValueError("Journal %s was written with configuration %s, current configuration is %s"
+                                 % (file_path, self.config, config))
+        self.fout = open(file_path, 'a')
+        if exists and not self.ends_with_newline():
+            # record cut by crash is ignored, next record starts on its own line
+            self.fout.write('\n')
+            self.fout.flush()
+        if not exists and config is not None:
+            self.config = json.loads(json.dumps(config))
+            self.write({'config' : config})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __contains__(self, key):
+        return key in self.records
+
+    def __len__(self):
+        return len(self.records)
+
+    def ends_with_newline(self):
+        "Checks if last record of journal file is complete"
+        with open(self.file_path, 'rb') as fin:
+            fin.seek(-1, 2)
+            return fin.read(1) == b'\n'
+
+    def load(self):
+        "Reads records of journal, incomplete lines of crashed run are skipped"
+        with open(self.file_path) as fin:
+            for line in fin:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if 'config' in record:
+                    self.config = record['config']
+                elif 'error' in record:
+                    self.quarantined[record['key']] = record['error']
+                else:
+                    self.quarantined.pop(record['key'], None)
+                    self.records[record['key']] = record['value']
+
+    def get(self, key, default=None):
+        '''
+        Returns value of finished key
+        param key: string key
+        param default: value returned for unfinished key
+        returns: JSON value of record
+        '''
+
+        return self.records.get(key, default)
+
+    def write(self, record):
+        "Appends single record and forces it to disk"
+        self.fout.write(json.dumps(record) + '\n')
+        self.fout.flush()
+        os.fsync(self.fout.fileno())
+
+    def record(self, key, value):
+        '''
+        Records finished work
+        param key: string key
+        param value: JSON serializable value
+        '''
+
+        self.records[key] = value
+        self.write({'key' : key, 'value' : value})
+
+    def quarantine(self, key, error):
+        '''
+        Records work which failed after every retry, resumed runs retry it
+        param key: string key
+        param error: error message
+        '''
+
+        self.quarantined[key] = error
+        self.write({'key' : key, 'error' : error})
+        print("Quarantined %s: %s" % (key, error))
+
+    def close(self):
+        "Closes journal file"
+        if not self.fout.closed:
+            self.fout.close()
+
+
+def call_with_retries(func, task, retries=RETRIES, errors=RETRY_ERRORS):
+    '''
+    Calls function and repeats call if it fails with one of errors, CoFold pool restarts failed worker meanwhile
+    param func: function which takes one task
+    param task: argument of function
+    param retries: count of repeated calls
+    param errors: tuple of retried exception types
+    returns: tuple (result, None) or (None, error message) if every call failed
+    '''
+
+    for attempt in range(retries + 1):
+        try:
+            return func(task), None
+        except errors as err:
+            error = '%s: %s' % (type(err).__name__, err)
+            print("Attempt %d of %d failed: %s" % (attempt + 1, retries + 1, error))
+    return None, error
+
+
+def guarded(item):
+    '''
+    Runs call_with_retries with tuple (key, func, task), used as function of process pools
+    param item: tuple (key, module level function, task)
+    returns: tuple (key, result, error message or None)
+    '''
+
+    key, func, task = item
+    res, error = call_with_retries(func, task)
+    return key, res, error
+
+
+def run_journaled(func, tasks, jobs=1, journal=None, encode=None):
+    '''
+    Runs tasks which are not finished in journal and records their results as soon as they are ready
+    param func: module level function which takes one task
+    param tasks: list of tuples (string key, task)
+    param jobs: count of processes
+    param journal: Journal object, None runs every task without recording
+    param encode: function which converts result to JSON value, None records result as it is
+    returns: generator of tuples (key, result) of new results in order of completion, failed tasks are skipped
+    '''
+
+    pending = [(key, func, task) for key, task in tasks if journal is None or key not in journal]
+    for key, res, error in parallel.imap_unordered(guarded, pending, jobs):
+        if error is not None:
+            if journal is not None:
+                journal.quarantine(key, error)
+            else:
+                print("Skipped %s: %s" % (key, error))
+            continue
+        if journal is not None:
+            journal.record(key, encode(res) if encode is not None else res)
+        yield key, res
+
+
+class GuardedFolder(object):
+    "Folder which retries failed batch one sequence at a time, so single failing fold does not lose whole batch"
+
+    def __init__(self, folder, retries=RETRIES):
+        '''
+        param folder: folder object with fold and fold_many methods
+        param retries: count of repeated calls of every failed sequence
+        '''
+
+        self.folder = folder
+        self.retries = retries
+        # sequence to error message of folds which failed after every retry
+        self.failed = {}
+
+    def fold(self, sequence, header=None):
+        '''
+        Folds single sequence
+        param sequence: string of sequence
+        param header: FASTA header of sequence
+        returns: tuple of (dot-bracket structure, minimal free energy) or None if every call failed
+        '''
+
+        res, error = call_with_retries(lambda sequence_: self.folder.fold(sequence_, header), sequence, self.retries)
+        if error is not None:
+            self.failed[sequence] = error
+        return res
+
+    def fold_many(self, sequences):
+        '''
+        Folds multiple sequences, batch which fails is folded one sequence at a time
+        param sequences: list of sequence strings
+        returns: list of tuples (dot-bracket structure, minimal free energy) with None for failed folds
+        '''
+
+        try:
+            return self.folder.fold_many(sequences)
+        except RETRY_ERRORS as err:
+            print("Batch of %d sequences failed, folding one at a time: %s: %s" % (len(sequences), type(err).__name__, err))
+        return [self.fold(sequence) for sequence in sequences]
+
+
+def table_to_json(table):
+    '''
+    Converts result table to JSON value
+    param table: structured array
+    returns: list of rows
+    '''
+
+    return [[value.item() for value in row] for row in table]
+
+
+def table_from_json(rows, dtype):
+    '''
+    Converts JSON value of table_to_json back to result table
+    param rows: list of rows
+    param dtype: structured dtype of table
+    returns: structured array
+    '''
+
+    return np.array([tuple(row) for row in rows], dtype=dtype)
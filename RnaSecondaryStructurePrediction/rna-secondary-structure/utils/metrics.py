@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#pylint: disable=
+"""
+File            : metrics.py
+Author          : Aurimas Repecka <aurimas.repecka AT gmail dot com>
+Description     : Base pair distance, F1 and mountain distance of structure batches. Structures are converted to
+                  pair tables once, batches are compared against reference or all-vs-all as condensed matrix.
+"""
+
+import numpy as np
+
+import scoring
+import instrumentation
+
+METRICS = ['bp_distance', 'f1', 'mountain_distance']
+# count of elements compared at once in all-vs-all, bounds temporary memory
+BLOCK_ELEMENTS = 2 ** 24
+
+
+def as_pair_tables(structures, length=None):
+    '''
+    Converts structures to pair tables, pair tables are returned as they are
+    param structures: list of dot-bracket structures, encoded uint8 array or int pair tables of scoring.pair_tables
+    param length: width of pair tables, shorter tables are padded as unpaired
+    returns: int32 array of pair tables
+    '''
+
+    if isinstance(structures, np.ndarray) and structures.dtype.kind == 'i':
+        tables = structures
+        if length is not None and tables.shape[1] < length:
+            tables = np.pad(tables, ((0, 0), (0, length - tables.shape[1])), 'constant', constant_values=-1)
+        return tables
+    return scoring.pair_tables(structures, length)
+
+
+def openers(tables, unpaired=-1):
+    '''
+    Keeps partner of every opening nucleotide, so equal elements of two tables are shared base pairs
+    param tables: int pair tables
+    param unpaired: value of nucleotides which do not open base pair
+    returns: int array of the same shape
+    '''
+
+    positions = np.arange(tables.shape[1])
+    return np.where(tables > positions, tables, unpaired).astype(np.int16 if tables.shape[1] < 2 ** 15 else np.int32)
+
+
+def pairs_count(tables):
+    '''
+    Count of base pairs of every structure
+    param tables: int pair tables
+    returns: int array
+    '''
+
+    return (tables > np.arange(tables.shape[1])).sum(axis=1)
+
+
+def mountains(tables):
+    '''
+    Mountain representation - count of base pairs enclosing every position
+    param tables: int pair tables
+    returns: int array of the same shape
+    '''
+
+    positions = np.arange(tables.shape[1])
+    steps = (tables > positions).astype(np.int32) - ((tables >= 0) & (tables < positions)).astype(np.int32)
+    return np.cumsum(steps, axis=1)
+
+
+def f1_from_counts(true_pairs, count_1, count_2):
+    '''
+    F1 of base pairs, two structures without base pairs are identical
+    param true_pairs: count of shared base pairs
+    param count_1: count of base pairs of first structures
+    param count_2: count of base pairs of second structures
+    returns: float array
+    '''
+
+    total = count_1 + count_2
+    return np.where(total > 0, 2.0 * true_pairs / np.maximum(total, 1), 1.0)
+
+
+def reference_tables(structures, reference):
+    '''
+    Pair tables of batch and reference of common width
+    param structures: structures of as_pair_tables
+    param reference: reference dot-bracket structure or pair table
+    returns: tuple (pair tables of batch, pair table of reference with shape (1, width))
+    '''
+
+    ref = as_pair_tables(reference if isinstance(reference, np.ndarray) else [reference])
+    tables = as_pair_tables(structures, ref.shape[1])
+    return tables, as_pair_tables(ref.reshape(1, -1), tables.shape[1])
+
+
+@instrumentation.timed('metrics.bp_distance')
+def bp_distance(structures, reference):
+    '''
+    Base pair distance (RNA.bp_distance) of every structure against reference
+    param structures: list of dot-bracket structures or pair tables
+    param reference: reference dot-bracket structure or pair table
+    returns: int array of count of base pairs present in only one of structures
+    '''
+
+    tables, ref = reference_tables(structures, reference)
+    true_pairs = (openers(tables) == openers(ref, -2)).sum(axis=1)
+    return pairs_count(tables) + pairs_count(ref)[0] - 2 * true_pairs
+
+
+@instrumentation.timed('metrics.f1')
+def f1(structures, reference):
+    '''
+    F1 of base pairs of every structure against reference
+    param structures: list of dot-bracket structures or pair tables
+    param reference: reference dot-bracket structure or pair table
+    returns: float array in range [0, 1]
+    '''
+
+    tables, ref = reference_tables(structures, reference)
+    true_pairs = (openers(tables) == openers(ref, -2)).sum(axis=1)
+    return f1_from_counts(true_pairs, pairs_count(tables), pairs_count(ref)[0])
+
+
+@instrumentation.timed('metrics.mountain_distance')
+def mountain_distance(structures, reference):
+    '''
+    Mountain distance (sum of absolute differences of mountain representations) against reference
+    param structures: list of dot-bracket structures or pair tables
+    param reference: reference dot-bracket structure or pair table
+    returns: int array
+    '''
+
+    tables, ref = reference_tables(structures, reference)
+    return np.abs(mountains(tables) - mountains(ref)).sum(axis=1)
+
+
+def condensed_offset(row, count):
+    '''
+    Index of pair (row, row + 1) in condensed matrix, same order as scipy.spatial.distance.pdist
+    param row: index of first structure
+    param count: count of structures
+    returns: int
+    '''
+
+    return row * count - row * (row + 1) // 2
+
+
+@instrumentation.timed('metrics.all_vs_all')
+def all_vs_all(structures, metric='bp_distance'):
+    '''
+    Compares every pair of structures, suitable for scipy.cluster.hierarchy.linkage
+    param structures: list of dot-bracket structures or pair tables
+    param metric: one of METRICS
+    raises: value error if metric is unknown
+    returns: condensed array of length n * (n - 1) / 2, pair (i, j) with i < j is at condensed_offset(i, n) + j - i - 1
+    '''
+
+    if metric not in METRICS:
+        raise ValueError("Unknown metric %s, expected one of %s" % (metric, METRICS))
+    tables = as_pair_tables(structures)
+    count, width = tables.shape
+    res = np.empty(count * (count - 1) // 2, dtype=np.float64 if metric == 'f1' else np.int32)
+    if count < 2:
+        return res
+
+    if metric == 'mountain_distance':
+        rows = cols = mountains(tables).astype(np.int16 if width < 2 ** 15 else np.int32)
+    else:
+        rows, cols = openers(tables), openers(tables, -2)
+        counts = pairs_count(tables)
+
+    block = max(1, BLOCK_ELEMENTS // max(1, count * width))
+    for start in range(0, count - 1, block):
+        stop = min(start + block, count - 1)
+        # rows of block are compared with every later structure, earlier ones are already done
+        others = cols[start + 1:]
+        if metric == 'mountain_distance':
+            values = np.abs(rows[start:stop, np.newaxis, :] - others[np.newaxis]).sum(axis=2)
+        else:
+            true_pairs = (rows[start:stop, np.newaxis, :] == others[np.newaxis]).sum(axis=2)
+            if metric == 'f1':
+                values = f1_from_counts(true_pairs, counts[start:stop, np.newaxis], counts[np.newaxis, start + 1:])
+            else:
+                values = counts[start:stop, np.newaxis] + counts[np.newaxis, start + 1:] - 2 * true_pairs
+        for row in range(start, stop):
+            offset = condensed_offset(row, count)
+            res[offset:offset + count - row - 1] = values[row - start, row - start:]
+    return res
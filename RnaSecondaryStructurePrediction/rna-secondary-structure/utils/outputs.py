@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#pylint: disable=
+"""
+File            : outputs.py
+Author          : Aurimas Repecka <aurimas.repecka AT gmail dot com>
+Description     : Unique output directories of runs and per-process scratch directories, so concurrent experiments
+                  never write into the same files.
+"""
+
+import os
+import time
+import uuid
+import shutil
+import atexit
+import tempfile
+
+# tmpfs keeps scratch files in memory, SCRATCH_PATH environment variable moves scratch elsewhere
+SCRATCH_ROOT = os.environ.get('SCRATCH_PATH', '/dev/shm' if os.access('/dev/shm', os.W_OK) else tempfile.gettempdir())
+# scratch of whole run, child processes inherit it from environment and only first process removes it
+SCRATCH_RUN_VARIABLE = 'SCRATCH_RUN_PATH'
+MAX_SUFFIX = 10000
+
+if SCRATCH_RUN_VARIABLE not in os.environ:
+    os.environ[SCRATCH_RUN_VARIABLE] = os.path.join(SCRATCH_ROOT, 'rna-%d-%s' % (os.getpid(), uuid.uuid4().hex[:8]))
+    SCRATCH_OWNER = os.getpid()
+else:
+    SCRATCH_OWNER = None
+SCRATCH_RUN_PATH = os.environ[SCRATCH_RUN_VARIABLE]
+
+
+def unique_dir(parent_path, name):
+    '''
+    Creates new directory, name gets numeric suffix if directory already exists
+    param parent_path: directory in which new directory is created, created if missing
+    param name: preferred name of directory
+    raises: file exists error if no free name is found
+    returns: path of created directory
+    '''
+
+    if parent_path and not os.path.exists(parent_path):
+        os.makedirs(parent_path, exist_ok=True)
+    for suffix in range(MAX_SUFFIX):
+        dir_path = os.path.join(parent_path, name if not suffix else '%s-%d' % (name, suffix))
+        try:
+            # mkdir is atomic, so concurrent runs never get the same directory
+            os.mkdir(dir_path)
+            return dir_path
+        except FileExistsError:
+            continue
+    raise FileExistsError("No free directory name for %s in %s" % (name, parent_path))
+
+
+def run_dir(parent_path, prefix=''):
+    '''
+    Creates output directory of single run named by start time and process id
+    param parent_path: directory of all runs
+    param prefix: prefix of directory name
+    returns: path of created directory
+    '''
+
+    return unique_dir(parent_path, '%s%s-%d' % (prefix, time.strftime('%Y%m%d-%H%M%S'), os.getpid()))
+
+
+def scratch_dir():
+    '''
+    Returns scratch directory of current process inside scratch of run
+    returns: path of directory
+    '''
+
+    dir_path = os.path.join(SCRATCH_RUN_PATH, str(os.getpid()))
+    if not os.path.exists(dir_path):
+        os.makedirs(dir_path, exist_ok=True)
+    return dir_path
+
+
+def remove_scratch():
+    "Removes scratch of run when process which started run exits"
+    if SCRATCH_OWNER == os.getpid():
+        shutil.rmtree(SCRATCH_RUN_PATH, ignore_errors=True)
+
+atexit.register(remove_scratch)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#pylint: disable=
+"""
+File            : parallel.py
+Author          : Aurimas Repecka <aurimas.repecka AT gmail dot com>
+Description     : Helpers to split candidate index space into chunks and fold them in process pool.
+"""
+
+import multiprocessing
+
+import cofold_pool
+import instrumentation
+
+CHUNKS_PER_JOB = 4
+
+
+def split_range(count, chunks):
+    '''
+    Splits range of indexes into continuous chunks
+    param count: count of indexes
+    param chunks: count of chunks
+    returns: list of tuples (start, stop)
+    '''
+
+    chunks = max(1, min(chunks, count))
+    step, rest = divmod(count, chunks)
+    res = []
+    start = 0
+    for idx in range(chunks):
+        stop = start + step + (1 if idx < rest else 0)
+        res.append((start, stop))
+        start = stop
+    return res
+
+
+def map_ordered(func, tasks, jobs=1):
+    '''
+    Applies function to every task, in process pool if more than one job is given
+    param func: module level function which takes one task
+    param tasks: list of tasks
+    param jobs: count of processes
+    returns: list of results in order of tasks
+    '''
+
+    if jobs <= 1:
+        return [func(task) for task in tasks]
+
+    with multiprocessing.Pool(jobs, initializer=cofold_pool.reset_pools) as pool:
+        return [instrumentation.collect(res) for res in pool.map(instrumentation.call_task, [(func, task) for task in tasks],
+                                                                 chunksize=1)]
+
+
+def map_chunks(func, count, jobs=1, **kwargs):
+    '''
+    Splits range of candidates into chunks and concatenates results of every chunk
+    param func: module level function which takes dictionary with start, stop and given kwargs
+    param count: count of candidates
+    param jobs: count of processes
+    returns: list of results in order of candidates
+    '''
+
+    chunks = 1 if jobs <= 1 else jobs * CHUNKS_PER_JOB
+    res = []
+    for chunk_res in imap_chunks(func, count, jobs, chunks, **kwargs):
+        res.extend(chunk_res)
+    return res
+
+
+def imap_chunks(func, count, jobs=1, chunks=None, **kwargs):
+    '''
+    Splits range of candidates into chunks and yields results of every chunk as soon as it is folded
+    param func: module level function which takes dictionary with start, stop and given kwargs
+    param count: count of candidates
+    param jobs: count of processes
+    param chunks: count of chunks, defaults to CHUNKS_PER_JOB chunks for every process
+    returns: generator of chunk results in order of candidates
+    '''
+
+    chunks = max(1, jobs) * CHUNKS_PER_JOB if chunks is None else chunks
+    tasks = [dict(kwargs, start=start, stop=stop) for start, stop in split_range(count, chunks)]
+    if jobs <= 1:
+        for task in tasks:
+            yield func(task)
+        return
+
+    with multiprocessing.Pool(jobs, initializer=cofold_pool.reset_pools) as pool:
+        for res in pool.imap(instrumentation.call_task, [(func, task) for task in tasks], chunksize=1):
+            yield instrumentation.collect(res)
+
+
+def workers_per_job(jobs):
+    '''
+    Count of CoFold processes every job may start without oversubscribing cores
+    param jobs: count of processes
+    returns: count of CoFold workers per process
+    '''
+
+    return max(1, cofold_pool.COFOLD_WORKERS // max(1, jobs))
+
+
+def imap_unordered(func, tasks, jobs=1):
+    '''
+    Applies function to every task and yields results as soon as they are ready
+    param func: module level function which takes one task
+    param tasks: list of tasks
+    param jobs: count of processes
+    returns: generator of results in order of completion
+    '''
+
+    if jobs <= 1:
+        for task in tasks:
+            yield func(task)
+        return
+
+    with multiprocessing.Pool(jobs, initializer=cofold_pool.reset_pools) as pool:
+        for res in pool.imap_unordered(instrumentation.call_task, [(func, task) for task in tasks]):
+            yield instrumentation.collect(res)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#pylint: disable=
+"""
+File            : pipeline.py
+Author          : Aurimas Repecka <aurimas.repecka AT gmail dot com>
+Description     : Streaming pipeline of stages connected by bounded queues: source -> stages -> sink.
+"""
+
+import queue
+import threading
+import multiprocessing
+
+import cofold_pool
+import instrumentation
+
+QUEUE_SIZE = 4
+POLL_TIMEOUT = 0.5
+
+STOP = object()
+
+
+class PipelineAborted(Exception):
+    "Raised inside stage threads when other stage has failed"
+    pass
+
+
+class Stage(object):
+    "Single step of pipeline, function takes one item and returns one item"
+
+    def __init__(self, func, jobs=1):
+        '''
+        param func: function of stage, must be module level function if jobs > 1
+        param jobs: count of processes, 1 runs function in stage thread
+        '''
+
+        self.func = func
+        self.jobs = jobs
+
+
+class Pipeline(object):
+    "Runs every stage in its own thread, bounded queues block producers while consumers are behind"
+
+    def __init__(self, stages, queue_size=QUEUE_SIZE):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.abort = threading.Event()
+        self.errors = []
+
+    def put(self, out_queue, item):
+        "Puts item into queue, waits while queue is full"
+        while True:
+            if self.abort.is_set():
+                raise PipelineAborted()
+            try:
+                out_queue.put(item, timeout=POLL_TIMEOUT)
+                return
+            except queue.Full:
+                pass
+
+    def get(self, in_queue):
+        "Gets item from queue, waits while queue is empty"
+        while True:
+            if self.abort.is_set():
+                raise PipelineAborted()
+            try:
+                return in_queue.get(timeout=POLL_TIMEOUT)
+            except queue.Empty:
+                pass
+
+    def items(self, in_queue, in_flight=None):
+        "Yields items of queue until stop marker, in_flight semaphore bounds items given to process pool"
+        while True:
+            item = self.get(in_queue)
+            if item is STOP:
+                return
+            if in_flight is not None:
+                while not in_flight.acquire(timeout=POLL_TIMEOUT):
+                    if self.abort.is_set():
+                        return
+            yield item
+
+    def guard(self, func, *args):
+        "Runs thread function and remembers its error"
+        try:
+            func(*args)
+        except PipelineAborted:
+            pass
+        except BaseException as error:
+            self.errors.append(error)
+            self.abort.set()
+
+    def run_source(self, source, out_queue):
+        "Puts every item of source into first queue"
+        for item in source:
+            self.put(out_queue, item)
+        self.put(out_queue, STOP)
+
+    def run_stage(self, stage, in_queue, out_queue):
+        "Applies stage function to every item, in process pool if stage has several jobs"
+        if stage.jobs <= 1:
+            for item in self.items(in_queue):
+                self.put(out_queue, stage.func(item))
+        else:
+            in_flight = threading.Semaphore(stage.jobs + self.queue_size)
+            with multiprocessing.Pool(stage.jobs, initializer=cofold_pool.reset_pools) as pool:
+                tasks = ((stage.func, item) for item in self.items(in_queue, in_flight))
+                for res in pool.imap(instrumentation.call_task, tasks):
+                    in_flight.release()
+                    self.put(out_queue, instrumentation.collect(res))
+        self.put(out_queue, STOP)
+
+    def run(self, source, sink):
+        '''
+        Runs pipeline until source is exhausted, sink is called in calling thread
+        param source: iterable of items
+        param sink: function which consumes output of last stage
+        raises: first error of any stage
+        '''
+
+        queues = [queue.Queue(self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self.guard, args=(self.run_source, source, queues[0]))]
+        for idx, stage in enumerate(self.stages):
+            threads.append(threading.Thread(target=self.guard, args=(self.run_stage, stage, queues[idx], queues[idx + 1])))
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            for item in self.items(queues[-1]):
+                sink(item)
+        except PipelineAborted:
+            pass
+        except BaseException:
+            self.abort.set()
+            raise
+        finally:
+            for thread in threads:
+                thread.join()
+        if self.errors:
+            raise self.errors[0]
+
+
+def run_pipeline(source, stages, sink, queue_size=QUEUE_SIZE):
+    '''
+    Streams items of source through stages into sink
+    param source: iterable of items
+    param stages: list of Stage objects
+    param sink: function which consumes output of last stage
+    param queue_size: maximum count of items waiting between two stages
+    '''
+
+    Pipeline(stages, queue_size).run(source, sink)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#pylint: disable=
+"""
+File            : priority_groups.py
+Author          : Aurimas Repecka <aurimas.repecka AT gmail dot com>
+Description     : Enumerates unique fragments of priority groups as base-4 integer codes.
+"""
+
+import numpy as np
+
+
+def nucleotide_table(groups, alphabet):
+    '''
+    Builds table of nucleotide indexes of every priority group at every position
+    param groups: list of priority groups, group is list of tuples (nucleotide, 1-based position)
+    param alphabet: list of 4 nucleotides in order of generation
+    returns: uint8 array of shape (count of groups, count of positions)
+    '''
+
+    positions = max(position for group in groups for _, position in group)
+    res = np.zeros((len(groups), positions), dtype=np.uint8)
+    for group_idx, group in enumerate(groups):
+        for nucleotide, position in group:
+            res[group_idx, position - 1] = alphabet.index(nucleotide)
+    return res
+
+
+def label_assignments(counts, positions):
+    '''
+    Every assignment of priority group labels to positions with given count of every label
+    param counts: list of counts of every label, counts sum to count of positions
+    param positions: count of positions
+    returns: uint8 array of shape (count of assignments, positions) of 0-based labels
+    '''
+
+    labels = len(counts)
+    if sum(counts) != positions or min(counts) < 0:
+        return np.zeros((0, positions), dtype=np.uint8)
+    codes = np.arange(labels ** positions, dtype=np.int64)
+    digits = (codes[:, np.newaxis] // labels ** np.arange(positions - 1, -1, -1)) % labels
+    mask = np.ones(len(codes), dtype=bool)
+    for label, count in enumerate(counts):
+        mask &= (digits == label).sum(axis=1) == count
+    return digits[mask].astype(np.uint8)
+
+
+def enumerate_fragments(groups, proportion, alphabet):
+    '''
+    Enumerates unique fragments where first groups take given count of positions and last group takes the rest
+    param groups: list of priority groups, group is list of tuples (nucleotide, 1-based position)
+    param proportion: counts of positions taken by every group except the last one
+    param alphabet: list of 4 nucleotides in order of generation
+    returns: tuple (sorted array of unique fragment codes, list of label arrays which produce every code)
+    '''
+
+    table = nucleotide_table(groups, alphabet)
+    positions = table.shape[1]
+    counts = list(proportion) + [positions - sum(proportion)]
+    labels = label_assignments(counts, positions)
+
+    nucleotides = table[labels, np.arange(positions)].astype(np.int64)
+    codes = (nucleotides * 4 ** np.arange(positions - 1, -1, -1)).sum(axis=1)
+    unique_codes, inverse = np.unique(codes, return_inverse=True)
+    order = np.argsort(inverse, kind='stable')
+    bounds = np.searchsorted(inverse[order], np.arange(len(unique_codes) + 1))
+    code_labels = [labels[order[bounds[idx]:bounds[idx + 1]]] + 1 for idx in range(len(unique_codes))]
+    return unique_codes, code_labels
+
+
+def enumerate_proportions(groups, proportions, alphabet):
+    '''
+    Enumerates unique fragments of every proportion
+    param groups: list of priority groups
+    param proportions: list of proportions
+    param alphabet: list of 4 nucleotides in order of generation
+    returns: tuple (dictionary of proportion to result of enumerate_fragments, sorted array of codes of all proportions)
+    '''
+
+    res = dict((tuple(proportion), enumerate_fragments(groups, proportion, alphabet)) for proportion in proportions)
+    codes = [codes for codes, _ in res.values()]
+    return res, np.unique(np.concatenate(codes)) if codes else np.zeros(0, dtype=np.int64)
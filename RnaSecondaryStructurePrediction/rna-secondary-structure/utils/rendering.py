@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#pylint: disable=
+"""
+File            : rendering.py
+Author          : Aurimas Repecka <aurimas.repecka AT gmail dot com>
+Description     : Deferred SVG rendering of folded structures in background process pool.
+Packages        :   https://www.tbi.univie.ac.at/RNA/#download
+"""
+
+import os
+import heapq
+import itertools
+import concurrent.futures
+
+import instrumentation
+
+# Render modes: 'top' renders best candidates of every group after sweep, 'all' renders every candidate
+# while sweep is still folding, 'none' only keeps results for rendering on demand
+RENDER_MODES = ['top', 'all', 'none']
+RENDER_MODE = 'top'
+TOP_K = 10
+RENDER_WORKERS = 2
+
+
+def render_svg(task):
+    '''
+    Plots single structure into SVG file, runs in rendering process
+    param task: tuple (sequence, dot-bracket structure, file path)
+    returns: file path of plot
+    '''
+
+    import RNA
+
+    sequence, structure, file_path = task
+    folder_path = os.path.dirname(file_path)
+    if folder_path and not os.path.exists(folder_path):
+        os.makedirs(folder_path, exist_ok=True)
+    with instrumentation.timer('render.svg'):
+        RNA.svg_rna_plot(sequence, structure, file_path)
+    return file_path
+
+
+class Renderer(object):
+    "Renders SVG plots in background processes so rendering overlaps folding"
+
+    def __init__(self, workers=RENDER_WORKERS):
+        self.workers = workers
+        self.executor = None
+        self.futures = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def submit(self, sequence, structure, file_path):
+        '''
+        Queues single plot, pool is started on first plot
+        param sequence: string of sequence
+        param structure: dot-bracket structure
+        param file_path: path of SVG file
+        '''
+
+        if self.workers <= 0:
+            render_svg((sequence, structure, file_path))
+            return
+        if self.executor is None:
+            self.executor = concurrent.futures.ProcessPoolExecutor(self.workers)
+        self.futures.append(self.executor.submit(instrumentation.call, render_svg, (sequence, structure, file_path)))
+
+    def wait(self):
+        '''
+        Waits until every queued plot is written
+        raises: first error of rendering process
+        returns: list of written file paths
+        '''
+
+        res = [instrumentation.collect(future.result()) for future in self.futures]
+        self.futures = []
+        return res
+
+    def close(self):
+        "Waits for queued plots and stops rendering processes"
+        try:
+            self.wait()
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+
+
+class TopResults(object):
+    "Keeps best scored records of every group, only records kept are rendered"
+
+    def __init__(self, top_k=TOP_K):
+        self.top_k = top_k
+        self.groups = {}
+        self.counter = itertools.count()
+
+    def add(self, group, score, sequence, structure, file_path):
+        '''
+        Adds scored record, records worse than current top k of group are dropped
+        param group: hashable name of group
+        param score: score of record, higher is better
+        param sequence: string of sequence
+        param structure: dot-bracket structure
+        param file_path: path of SVG file
+        '''
+
+        # counter breaks ties so that earlier records win and strings are never compared
+        item = (score, -next(self.counter), sequence, structure, file_path)
+        heap = self.groups.setdefault(group, [])
+        if len(heap) < self.top_k:
+            heapq.heappush(heap, item)
+        elif item > heap[0]:
+            heapq.heapreplace(heap, item)
+
+    def records(self, group):
+        '''
+        Returns kept records of group
+        param group: name of group
+        returns: list of tuples (score, sequence, structure, file path) from best to worst
+        '''
+
+        return [(item[0], item[2], item[3], item[4]) for item in sorted(self.groups.get(group, []), reverse=True)]
+
+    def render(self, renderer):
+        '''
+        Queues kept records of every group for rendering
+        param renderer: Renderer object
+        '''
+
+        for group in self.groups:
+            for _, sequence, structure, file_path in self.records(group):
+                renderer.submit(sequence, structure, file_path)
+
+
+def render_records(records, top_k=None, workers=RENDER_WORKERS):
+    '''
+    Renders stored results on demand
+    param records: iterable of tuples (score, sequence, structure, file path)
+    param top_k: count of best records rendered, None renders every record
+    param workers: count of rendering processes
+    returns: list of written file paths
+    '''
+
+    if top_k is not None:
+        records = heapq.nlargest(top_k, records, key=lambda record: record[0])
+    with Renderer(workers) as renderer:
+        for _, sequence, structure, file_path in records:
+            renderer.submit(sequence, structure, file_path)
+        return renderer.wait()
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#pylint: disable=
+"""
+File            : results.py
+Author          : Aurimas Repecka <aurimas.repecka AT gmail dot com>
+Description     : Typed columnar table of generated fragment results stored as NumPy structured array.
+Packages        :   https://arrow.apache.org/docs/python/ (optional, parquet files only)
+"""
+
+import struct
+
+import numpy as np
+
+FRAGMENT_FIELD = 'fragment'
+MUTATIONS_FIELD = 'mutations'
+ACCURACY_FIELD = 'accuracy_%d'
+# ensemble scoring columns - probability of target structure and its ensemble defect
+PROBABILITY_FIELD = 'probability_%d'
+DEFECT_FIELD = 'defect_%d'
+# sparse base pair probabilities, 1-based positions i < j of ViennaRNA
+PAIR_FIELDS = ('i', 'j', 'probability')
+# base pair probabilities below threshold are dropped, so stored pairs grow with length instead of length squared
+PROBABILITY_THRESHOLD = 1e-3
+# suboptimal structures summary columns - count of structures in band, best accuracy and its energy above MFE
+SUBOPT_FIELDS = ('subopt_count_%d', 'best_accuracy_%d', 'energy_gap_%d')
+# .npy header is reserved for 20 digit row count so it can be rewritten in place while rows are appended
+NPY_MAX_COUNT = 10 ** 20 - 1
+
+
+def fragment_dtype(fragment_length):
+    '''
+    Smallest unsigned integer type which holds base-4 code of fragment
+    param fragment_length: count of nucleotides in fragment
+    returns: numpy dtype
+    '''
+
+    for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if 2 * fragment_length <= np.iinfo(dtype).bits:
+            return np.dtype(dtype)
+    raise ValueError("Fragment of %d nucleotides does not fit into 64 bits" % fragment_length)
+
+
+def table_dtype(fragment_length, structure_lengths, ensemble=False):
+    '''
+    Builds dtype of result table
+    param fragment_length: count of nucleotides in generated fragment
+    param structure_lengths: list of structure lengths, every length gets its own accuracy column
+    param ensemble: adds probability and ensemble defect columns of every length
+    returns: numpy structured dtype
+    '''
+
+    fields = [(FRAGMENT_FIELD, fragment_dtype(fragment_length)), (MUTATIONS_FIELD, np.uint8)]
+    fields.extend((ACCURACY_FIELD % length, np.float32) for length in structure_lengths)
+    if ensemble:
+        fields.extend((PROBABILITY_FIELD % length, np.float32) for length in structure_lengths)
+        fields.extend((DEFECT_FIELD % length, np.float32) for length in structure_lengths)
+    return np.dtype(fields)
+
+
+def pairs_dtype(fragment_length):
+    '''
+    Builds dtype of sparse base pair probabilities, one row for every pair above threshold
+    param fragment_length: count of nucleotides in generated fragment
+    returns: numpy structured dtype
+    '''
+
+    return np.dtype([(FRAGMENT_FIELD, fragment_dtype(fragment_length)), (PAIR_FIELDS[0], np.uint16),
+                     (PAIR_FIELDS[1], np.uint16), (PAIR_FIELDS[2], np.float32)])
+
+
+def accuracy_fields(table):
+    '''
+    Returns names of accuracy columns in order of structure lengths
+    param table: result table
+    returns: list of field names
+    '''
+
+    return [name for name in table.dtype.names if name.startswith(ACCURACY_FIELD.split('%')[0])]
+
+
+def encode_fragments(fragments, alphabet):
+    '''
+    Encodes fragments as base-4 integers, code of fragment equals its index in itertools.product(alphabet)
+    param fragments: list of fragment strings of the same length
+    param alphabet: list of 4 nucleotides in order of generation
+    returns: array of fragment codes
+    '''
+
+    fragments = list(fragments)
+    if not fragments:
+        return np.zeros(0, dtype=np.uint8)
+    lookup = np.zeros(256, dtype=np.uint64)
+    for idx, nucleotide in enumerate(alphabet):
+        lookup[ord(nucleotide)] = idx
+    length = len(fragments[0])
+    encoded = np.frombuffer(''.join(fragments).encode('ascii'), dtype=np.uint8).reshape(len(fragments), length)
+    weights = np.uint64(4) ** np.arange(length - 1, -1, -1, dtype=np.uint64)
+    return (lookup[encoded] * weights).sum(axis=1).astype(fragment_dtype(length))
+
+
+def decode_fragments(codes, fragment_length, alphabet):
+    '''
+    Decodes base-4 fragment codes back to strings
+    param codes: array of fragment codes
+    param fragment_length: count of nucleotides in fragment
+    param alphabet: list of 4 nucleotides in order of generation
+    returns: array of fragment strings
+    '''
+
+    codes = np.asarray(codes, dtype=np.uint64)
+    shifts = np.uint64(2) * np.arange(fragment_length - 1, -1, -1, dtype=np.uint64)
+    digits = (codes[:, np.newaxis] >> shifts) & np.uint64(3)
+    letters = np.frombuffer(''.join(alphabet).encode('ascii'), dtype=np.uint8)[digits.astype(np.intp)]
+    return np.ascontiguousarray(letters).view('S%d' % fragment_length).ravel().astype(str)
+
+
+def subopt_dtype(fragment_length, structure_lengths):
+    '''
+    Builds dtype of suboptimal structures summary table
+    param fragment_length: count of nucleotides in generated fragment
+    param structure_lengths: list of structure lengths, every length gets its own summary columns
+    returns: numpy structured dtype
+    '''
+
+    fields = [(FRAGMENT_FIELD, fragment_dtype(fragment_length)), (MUTATIONS_FIELD, np.uint8)]
+    for length in structure_lengths:
+        fields.extend([(SUBOPT_FIELDS[0] % length, np.uint32), (SUBOPT_FIELDS[1] % length, np.float32),
+                       (SUBOPT_FIELDS[2] % length, np.float32)])
+    return np.dtype(fields)
+
+
+def make_table(codes, mutations, accuracies, fragment_length, structure_lengths, probabilities=None, defects=None):
+    '''
+    Builds result table from columns
+    param codes: array of fragment codes
+    param mutations: array of mutation counts
+    param accuracies: array of shape (count of fragments, count of structure lengths)
+    param fragment_length: count of nucleotides in generated fragment
+    param structure_lengths: list of structure lengths
+    param probabilities: array of target structure probabilities shaped like accuracies, None for MFE only table
+    param defects: array of ensemble defects shaped like accuracies
+    returns: structured array
+    '''
+
+    shape = (len(codes), len(structure_lengths))
+    accuracies = np.asarray(accuracies, dtype=np.float32).reshape(shape)
+    table = np.empty(len(codes), dtype=table_dtype(fragment_length, structure_lengths, probabilities is not None))
+    table[FRAGMENT_FIELD] = codes
+    table[MUTATIONS_FIELD] = mutations
+    for idx, length in enumerate(structure_lengths):
+        table[ACCURACY_FIELD % length] = accuracies[:, idx]
+    if probabilities is not None:
+        probabilities = np.asarray(probabilities, dtype=np.float32).reshape(shape)
+        defects = np.asarray(defects, dtype=np.float32).reshape(shape)
+        for idx, length in enumerate(structure_lengths):
+            table[PROBABILITY_FIELD % length] = probabilities[:, idx]
+            table[DEFECT_FIELD % length] = defects[:, idx]
+    return table
+
+
+def make_pairs(codes, pairs, fragment_length):
+    '''
+    Builds sparse base pair probability table of fragments
+    param codes: array of fragment codes
+    param pairs: list of tuples (i array, j array, probability array), one tuple for every fragment
+    param fragment_length: count of nucleotides in generated fragment
+    returns: structured array
+    '''
+
+    counts = [len(pair[0]) for pair in pairs]
+    table = np.empty(sum(counts), dtype=pairs_dtype(fragment_length))
+    table[FRAGMENT_FIELD] = np.repeat(np.asarray(codes), counts)
+    for idx, field in enumerate(PAIR_FIELDS):
+        table[field] = np.concatenate([pair[idx] for pair in pairs]) if pairs else []
+    return table
+
+
+def concatenate(tables):
+    '''
+    Concatenates result tables of chunks
+    param tables: list of structured arrays of the same dtype
+    returns: structured array
+    '''
+
+    tables = list(tables)
+    return np.concatenate(tables) if tables else tables
+
+
+def save_table(table, file_path):
+    '''
+    Writes result table, .parquet files are written with pyarrow, other files as .npy
+    param table: structured array
+    param file_path: path of output file
+    raises: import error if parquet is requested without pyarrow
+    '''
+
+    if file_path.endswith('.parquet'):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        pq.write_table(pa.table(dict((name, table[name]) for name in table.dtype.names)), file_path)
+    else:
+        np.save(file_path, table, allow_pickle=False)
+
+
+def npy_header(dtype, count, size=None):
+    '''
+    Builds .npy version 1.0 header of one-dimensional array
+    param dtype: dtype of array
+    param count: count of rows
+    param size: total size of header in bytes, defaults to size which fits NPY_MAX_COUNT rows
+    returns: header bytes
+    '''
+
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (np.lib.format.dtype_to_descr(dtype), count)
+    if size is None:
+        max_header = npy_header(dtype, NPY_MAX_COUNT, 0)
+        size = (len(max_header) + 63) // 64 * 64
+    prefix = np.lib.format.magic(1, 0)
+    header = header.ljust(max(size - len(prefix) - 3, len(header))) + '\n'
+    return prefix + struct.pack('<H', len(header)) + header.encode('latin1')
+
+
+class TableWriter(object):
+    "Appends result table chunks to file, rows written so far are readable with load_table while writing"
+
+    def __init__(self, file_path, dtype):
+        self.file_path = file_path
+        self.dtype = np.dtype(dtype)
+        self.count = 0
+        self.parquet = None
+        if file_path.endswith('.parquet'):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            schema = pa.schema([(name, pa.from_numpy_dtype(self.dtype[name])) for name in self.dtype.names])
+            self.parquet = pq.ParquetWriter(file_path, schema)
+        else:
+            self.fout = open(file_path, 'wb')
+            self.header_size = len(npy_header(self.dtype, 0))
+            self.fout.write(npy_header(self.dtype, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def append(self, table):
+        '''
+        Appends rows and flushes them to disk
+        param table: structured array of writer dtype
+        '''
+
+        if self.parquet is not None:
+            import pyarrow as pa
+            self.parquet.write_table(pa.table(dict((name, table[name]) for name in self.dtype.names)))
+        else:
+            self.fout.write(np.ascontiguousarray(table, dtype=self.dtype).tobytes())
+            # rows are written before row count, so readers never see incomplete rows
+            self.fout.flush()
+            self.fout.seek(0)
+            self.fout.write(npy_header(self.dtype, self.count + len(table), self.header_size))
+            self.fout.seek(0, 2)
+            self.fout.flush()
+        self.count = self.count + len(table)
+
+    def close(self):
+        "Closes output file"
+        if self.parquet is not None:
+            self.parquet.close()
+        elif not self.fout.closed:
+            self.fout.close()
+
+
+def load_table(file_path, mmap=True):
+    '''
+    Reads result table written by save_table
+    param file_path: path of input file
+    param mmap: memory map .npy file instead of reading it
+    returns: structured array
+    '''
+
+    if file_path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        columns = pq.read_table(file_path)
+        table = np.empty(columns.num_rows, dtype=[(name, columns.column(name).type.to_pandas_dtype())
+                                                  for name in columns.column_names])
+        for name in columns.column_names:
+            table[name] = columns.column(name).to_numpy()
+        return table
+    return np.load(file_path, mmap_mode='r' if mmap else None, allow_pickle=False)
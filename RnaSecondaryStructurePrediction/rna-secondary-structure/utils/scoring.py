@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#pylint: disable=
+"""
+File            : scoring.py
+Author          : Aurimas Repecka <aurimas.repecka AT gmail dot com>
+Description     : Structure accuracy scoring of single candidates and vectorized scoring of candidate batches.
+"""
+
+import numpy as np
+
+import instrumentation
+
+OPEN_BRACKET = ord('(')
+CLOSE_BRACKET = ord(')')
+
+
+@instrumentation.timed('score.check_diff')
+def check_diff(struc_1, struc_2):
+    '''
+    Check position-wise accuracy of two structures
+    param struc_1: dot-bracket structure of sequence 1
+    param struc_2: dot-bracket structure of sequence 2
+    returns: similarity between two structures percentage
+    '''
+
+    return sum(1 for val_1, val_2 in zip(struc_1, struc_2) if val_1 == val_2)/len(struc_1)
+
+
+@instrumentation.timed('score.check_diff_mut')
+def check_diff_mut(seq_1, seq_2):
+    '''
+    Check position-wise accuracy of two sequences
+    param seq_1: string of sequence 1
+    param seq_2: string of sequence 2
+    returns: mutations between two sequences
+    '''
+
+    return sum(1 for val_1, val_2 in zip(seq_1, seq_2) if val_1 != val_2)
+
+
+def encode_strings(strings, length=None):
+    '''
+    Encodes strings as rows of uint8 array, shorter strings are padded with zeros
+    param strings: list of strings or lists of characters
+    param length: width of array, longer strings are truncated, defaults to longest string
+    returns: uint8 array of shape (count of strings, length)
+    '''
+
+    strings = [''.join(string) for string in strings]
+    if length is None:
+        length = max(len(string) for string in strings) if strings else 0
+    res = np.zeros((len(strings), length), dtype=np.uint8)
+    for idx, string in enumerate(strings):
+        row = np.frombuffer(string[:length].encode('ascii'), dtype=np.uint8)
+        res[idx, :len(row)] = row
+    return res
+
+
+def is_encoded(strings):
+    '''
+    Checks if strings are already encoded by encode_strings
+    param strings: list or array of strings
+    returns: True for uint8 array
+    '''
+
+    return isinstance(strings, np.ndarray) and strings.dtype == np.uint8
+
+
+def string_lengths(encoded):
+    '''
+    Returns lengths of encoded strings
+    param encoded: uint8 array of encoded strings
+    returns: int array of lengths
+    '''
+
+    return (encoded != 0).sum(axis=1)
+
+
+@instrumentation.timed('score.accuracy_batch')
+def accuracy_batch(structures, references):
+    '''
+    Position-wise accuracy (check_diff) of every structure against every reference
+    param structures: list of dot-bracket structures or encoded uint8 array
+    param references: list of reference dot-bracket structures
+    returns: float array of shape (count of structures, count of references)
+    '''
+
+    refs = encode_strings(references)
+    cands = structures if is_encoded(structures) else encode_strings(structures, refs.shape[1])
+    cands = cands[:, :refs.shape[1]]
+    if cands.shape[1] < refs.shape[1]:
+        cands = np.pad(cands, ((0, 0), (0, refs.shape[1] - cands.shape[1])), 'constant')
+
+    res = np.empty((cands.shape[0], refs.shape[0]), dtype=np.float64)
+    for idx, ref in enumerate(refs):
+        matches = (cands == ref) & (cands != 0)
+        res[:, idx] = matches.sum(axis=1) / string_lengths(ref[np.newaxis])[0]
+    return res
+
+
+@instrumentation.timed('score.mutations_batch')
+def mutations_batch(fragments, reference):
+    '''
+    Count of mutations (check_diff_mut) of every fragment against reference fragment
+    param fragments: list of fragments or encoded uint8 array
+    param reference: reference fragment
+    returns: uint8 array of mutation counts
+    '''
+
+    ref = encode_strings([reference])[0]
+    frags = fragments if is_encoded(fragments) else encode_strings(fragments, len(ref))
+    return (frags[:, :len(ref)] != ref).sum(axis=1).astype(np.uint8)
+
+
+def pair_tables(structures, length=None):
+    '''
+    Converts dot-bracket structures to pair tables in one vectorized pass
+    param structures: list of dot-bracket structures or encoded uint8 array
+    param length: width of pair tables, defaults to longest structure
+    returns: int32 array where element is 0-based index of paired nucleotide or -1 if unpaired
+    '''
+
+    encoded = structures if is_encoded(structures) else encode_strings(structures, length)
+    if length is not None and encoded.shape[1] < length:
+        encoded = np.pad(encoded, ((0, 0), (0, length - encoded.shape[1])), 'constant')
+
+    opens = encoded == OPEN_BRACKET
+    closes = encoded == CLOSE_BRACKET
+    levels = np.cumsum(opens.astype(np.int32) - closes.astype(np.int32), axis=1)
+    # opening bracket has the same level as its closing bracket before decrement
+    levels = levels + closes
+
+    rows, cols = np.nonzero(opens | closes)
+    bracket_levels = levels[rows, cols]
+    order = np.lexsort((cols, bracket_levels, rows))
+    rows, cols, bracket_levels = rows[order], cols[order], bracket_levels[order]
+
+    # brackets of the same level alternate, unbalanced brackets are left unpaired
+    is_open = opens[rows, cols]
+    paired = is_open[:-1] & ~is_open[1:] & (rows[:-1] == rows[1:]) & (bracket_levels[:-1] == bracket_levels[1:])
+    first = np.nonzero(paired)[0]
+
+    res = np.full(encoded.shape, -1, dtype=np.int32)
+    res[rows[first], cols[first]] = cols[first + 1]
+    res[rows[first + 1], cols[first + 1]] = cols[first]
+    return res
+
+
+def score_batch(structures, references):
+    '''
+    Scores batch of structures against references: position-wise accuracy, base pair sensitivity and PPV
+    param structures: list of dot-bracket structures
+    param references: list of reference dot-bracket structures
+    returns: dictionary of float arrays of shape (count of structures, count of references)
+    '''
+
+    refs = encode_strings(references)
+    cands = encode_strings(structures, refs.shape[1])
+    cand_pairs = pair_tables(cands)
+    ref_pairs = pair_tables(refs)
+    positions = np.arange(refs.shape[1])
+    cand_pairs_count = (cand_pairs > positions).sum(axis=1)
+
+    res = {'accuracy' : accuracy_batch(cands, references),
+           'sensitivity' : np.zeros((cands.shape[0], refs.shape[0])),
+           'ppv' : np.zeros((cands.shape[0], refs.shape[0]))}
+    for idx, ref_pair in enumerate(ref_pairs):
+        true_pairs = ((cand_pairs == ref_pair) & (ref_pair > positions)).sum(axis=1)
+        ref_pairs_count = (ref_pair > positions).sum()
+        res['sensitivity'][:, idx] = true_pairs / ref_pairs_count if ref_pairs_count else 1.0
+        res['ppv'][:, idx] = np.where(cand_pairs_count > 0, true_pairs / np.maximum(cand_pairs_count, 1), 1.0)
+    return res
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#pylint: disable=
+"""
+File            : search.py
+Author          : Aurimas Repecka <aurimas.repecka AT gmail dot com>
+Description     : Heuristic search of NZONE fragments - simulated annealing, genetic algorithm and beam search.
+"""
+
+import math
+import random
+
+import results
+import scoring
+
+STRATEGIES = ['anneal', 'genetic', 'beam']
+DEFAULT_STRATEGY = 'genetic'
+MUTATION_WEIGHT = 0.0
+SEED = 0
+
+ANNEAL_ITERATIONS = 2000
+ANNEAL_BATCH = 8
+ANNEAL_TEMPERATURE = 0.05
+ANNEAL_COOLING = 0.995
+
+GENETIC_POPULATION = 64
+GENETIC_GENERATIONS = 40
+GENETIC_ELITE = 8
+GENETIC_MUTATION_RATE = 0.1
+
+BEAM_WIDTH = 8
+BEAM_ROUNDS = 20
+# count of rounds without better fragment after which beam search stops, ties often lead out of plateau
+BEAM_PATIENCE = 3
+
+
+class Objective(object):
+    "Scores fragments by mean accuracy over constructs minus mutation penalty, every fragment is folded once"
+
+    def __init__(self, folder, constructs, nzone_range, alphabet, mutation_weight=MUTATION_WEIGHT):
+        '''
+        param folder: folder object with fold_many method
+        param constructs: list of tuples (sequence string, dot-bracket structure), one for every structure length
+        param nzone_range: range of nucleotides which is designed
+        param alphabet: list of 4 nucleotides
+        param mutation_weight: accuracy lost for every mutation against original fragment
+        '''
+
+        self.folder = folder
+        self.constructs = constructs
+        self.nzone_range = nzone_range
+        self.alphabet = alphabet
+        self.mutation_weight = mutation_weight
+        # original fragment is written in the same alphabet (T or U) as generated fragments
+        reference = constructs[0][0][nzone_range[0]:nzone_range[1]].upper()
+        self.reference = reference.replace('U', 'T') if 'T' in alphabet else reference.replace('T', 'U')
+        self.evaluated = {}
+
+    def evaluate(self, fragments):
+        '''
+        Scores fragments, fragments which were not scored yet are folded in one batch for every construct
+        param fragments: list of fragment strings
+        returns: list of scores in order of fragments
+        '''
+
+        missing = list(dict.fromkeys(fragment for fragment in fragments if fragment not in self.evaluated))
+        if missing:
+            accuracies = []
+            for sequence, structure in self.constructs:
+                sequences = [sequence[:self.nzone_range[0]] + fragment + sequence[self.nzone_range[1]:] for fragment in missing]
+                folds = self.folder.fold_many(sequences)
+                accuracies.append(scoring.accuracy_batch([fold[0] for fold in folds], [structure])[:,0])
+            mutations = scoring.mutations_batch(missing, self.reference)
+            for idx, fragment in enumerate(missing):
+                accuracy = [accuracies_[idx] for accuracies_ in accuracies]
+                score = sum(accuracy) / len(accuracy) - self.mutation_weight * int(mutations[idx])
+                self.evaluated[fragment] = (score, int(mutations[idx]), accuracy)
+        return [self.evaluated[fragment][0] for fragment in fragments]
+
+    def best(self, count=1):
+        '''
+        Returns best scored fragments
+        param count: count of fragments
+        returns: list of tuples (fragment, score, mutations count, list of accuracies)
+        '''
+
+        ranked = sorted(self.evaluated.items(), key=lambda item: item[1][0], reverse=True)[:count]
+        return [(fragment, res[0], res[1], res[2]) for fragment, res in ranked]
+
+    def table(self, structure_lengths):
+        '''
+        Returns every evaluated fragment as result table
+        param structure_lengths: list of structure lengths of constructs
+        returns: structured array of results module
+        '''
+
+        fragments = list(self.evaluated.keys())
+        codes = results.encode_fragments(fragments, self.alphabet)
+        mutations = [self.evaluated[fragment][1] for fragment in fragments]
+        accuracies = [self.evaluated[fragment][2] for fragment in fragments]
+        return results.make_table(codes, mutations, accuracies, self.nzone_range[1] - self.nzone_range[0], structure_lengths)
+
+
+def mutate(fragment, alphabet, rng, rate=None):
+    '''
+    Substitutes one random position of fragment, or every position with given probability
+    param fragment: fragment string
+    param alphabet: list of nucleotides
+    param rng: random.Random object
+    param rate: probability of substitution of every position, None substitutes exactly one position
+    returns: new fragment string
+    '''
+
+    fragment = list(fragment)
+    positions = [rng.randrange(len(fragment))] if rate is None else [idx for idx in range(len(fragment)) if rng.random() < rate]
+    for idx in positions:
+        fragment[idx] = rng.choice([nucleotide for nucleotide in alphabet if nucleotide != fragment[idx]])
+    return ''.join(fragment)
+
+
+def anneal(objective, iterations=ANNEAL_ITERATIONS, batch=ANNEAL_BATCH, temperature=ANNEAL_TEMPERATURE,
+           cooling=ANNEAL_COOLING, seed=SEED):
+    '''
+    Simulated annealing from original fragment, every step scores batch of neighbours at once
+    param objective: Objective object
+    param iterations: count of steps
+    param batch: count of neighbours scored in every step
+    param temperature: initial temperature in units of score
+    param cooling: temperature multiplier of every step
+    param seed: seed of random generator
+    returns: list of best tuples (fragment, score, mutations count, list of accuracies)
+    '''
+
+    rng = random.Random(seed)
+    current = objective.reference
+    current_score = objective.evaluate([current])[0]
+    for _ in range(iterations):
+        neighbours = [mutate(current, objective.alphabet, rng) for _ in range(batch)]
+        scores = objective.evaluate(neighbours)
+        idx = max(range(batch), key=lambda idx: scores[idx])
+        delta = scores[idx] - current_score
+        if delta >= 0 or rng.random() < math.exp(delta / max(temperature, 1e-12)):
+            current, current_score = neighbours[idx], scores[idx]
+        temperature = temperature * cooling
+    return objective.best(BEAM_WIDTH)
+
+
+def genetic(objective, population=GENETIC_POPULATION, generations=GENETIC_GENERATIONS, elite=GENETIC_ELITE,
+            mutation_rate=GENETIC_MUTATION_RATE, seed=SEED):
+    '''
+    Genetic algorithm, whole population is folded as one batch in every generation
+    param objective: Objective object
+    param population: count of fragments in generation
+    param generations: count of generations
+    param elite: count of best fragments which survive unchanged
+    param mutation_rate: probability of substitution of every position of child
+    param seed: seed of random generator
+    returns: list of best tuples (fragment, score, mutations count, list of accuracies)
+    '''
+
+    rng = random.Random(seed)
+    length = len(objective.reference)
+    members = [objective.reference] + [mutate(objective.reference, objective.alphabet, rng, 1.0 / length)
+                                       for _ in range(population - 1)]
+    for _ in range(generations):
+        scores = objective.evaluate(members)
+        ranked = [members[idx] for idx in sorted(range(len(members)), key=lambda idx: scores[idx], reverse=True)]
+        parents = ranked[:max(2, population // 2)]
+        children = ranked[:elite]
+        while len(children) < population:
+            father, mother = rng.sample(parents, 2)
+            cut = rng.randrange(1, length) if length > 1 else 0
+            children.append(mutate(father[:cut] + mother[cut:], objective.alphabet, rng, mutation_rate))
+        members = children
+    objective.evaluate(members)
+    return objective.best(BEAM_WIDTH)
+
+
+def beam(objective, width=BEAM_WIDTH, rounds=BEAM_ROUNDS, patience=BEAM_PATIENCE):
+    '''
+    Beam search over single substitutions, every round scores all neighbours of beam at once
+    param objective: Objective object
+    param width: count of fragments kept in beam
+    param rounds: maximal count of rounds
+    param patience: count of rounds without better fragment after which search stops
+    returns: list of best tuples (fragment, score, mutations count, list of accuracies)
+    '''
+
+    members = [objective.reference]
+    best_score = objective.evaluate(members)[0]
+    stale = 0
+    for _ in range(rounds):
+        neighbours = set()
+        for fragment in members:
+            for idx, current in enumerate(fragment):
+                for nucleotide in objective.alphabet:
+                    if nucleotide != current:
+                        neighbours.add(fragment[:idx] + nucleotide + fragment[idx + 1:])
+        neighbours = sorted(neighbours)
+        scores = objective.evaluate(neighbours)
+        ranked = sorted(zip(scores, neighbours), reverse=True)[:width]
+        members = [fragment for _, fragment in ranked]
+        if ranked[0][0] > best_score:
+            best_score, stale = ranked[0][0], 0
+        else:
+            stale = stale + 1
+            if stale >= patience:
+                break
+    return objective.best(width)
+
+
+def run_search(strategy, objective, **kwargs):
+    '''
+    Runs search strategy by name
+    param strategy: name of strategy - anneal, genetic or beam
+    param objective: Objective object
+    param kwargs: parameters of strategy function
+    raises: value error if strategy is unknown
+    returns: list of best tuples (fragment, score, mutations count, list of accuracies)
+    '''
+
+    if strategy == 'anneal':
+        return anneal(objective, **kwargs)
+    elif strategy == 'genetic':
+        return genetic(objective, **kwargs)
+    elif strategy == 'beam':
+        return beam(objective, **kwargs)
+    raise ValueError("Unknown search strategy %s, expected one of %s" % (strategy, STRATEGIES))
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#pylint: disable=
+"""
+File            : sharding.py
+Author          : Aurimas Repecka <aurimas.repecka AT gmail dot com>
+Description     : Deterministic split of candidate index space between machines (--shard i/N) and merge of
+                  per-shard result files into one table identical to single machine run.
+                  Usage: python sharding.py RESULT_FILE [RESULT_FILE ...] merges RESULT.shard-i-of-N files.
+"""
+
+import os
+import re
+import glob
+import argparse
+
+import numpy as np
+
+import results
+
+SHARD_SUFFIX = '.shard-%d-of-%d'
+SHARD_REGEX = r'\.shard-(\d+)-of-(\d+)'
+TEXT_EXTENSIONS = ('.tsv', '.csv', '.txt')
+
+
+def parse_shard(value):
+    '''
+    Parses shard argument, shards are numbered from 0
+    param value: string in form of i/N
+    raises: argument type error if shard is malformed
+    returns: tuple (index, count)
+    '''
+
+    match = re.match(r'^(\d+)/(\d+)$', value.strip())
+    if not match or not 0 <= int(match.group(1)) < int(match.group(2)):
+        raise argparse.ArgumentTypeError("Shard should be i/N with 0 <= i < N, got %s" % value)
+    return int(match.group(1)), int(match.group(2))
+
+
+def shard_range(count, shard=None):
+    '''
+    Continuous range of candidate indexes of shard, shards of all indexes cover range without overlaps
+    param count: count of candidates
+    param shard: tuple (index, count) or None for whole range
+    returns: tuple (start, stop)
+    '''
+
+    if shard is None:
+        return 0, count
+    index, shards = shard
+    return count * index // shards, count * (index + 1) // shards
+
+
+def shard_items(items, shard=None):
+    '''
+    Items of shard
+    param items: list or array of candidates in deterministic order
+    param shard: tuple (index, count) or None for every item
+    returns: slice of items
+    '''
+
+    start, stop = shard_range(len(items), shard)
+    return items[start:stop]
+
+
+def shard_path(file_path, shard=None):
+    '''
+    Path of result file of shard, e.g. table.npy becomes table.shard-0-of-4.npy
+    param file_path: path of result file of whole run
+    param shard: tuple (index, count) or None
+    returns: file path
+    '''
+
+    if shard is None:
+        return file_path
+    base, extension = os.path.splitext(file_path)
+    return base + SHARD_SUFFIX % shard + extension
+
+
+def shard_files(file_path):
+    '''
+    Finds result files of every shard of result file
+    param file_path: path of result file of whole run
+    raises: value error if shard files are missing or were written with different count of shards
+    returns: list of file paths in order of shards
+    '''
+
+    base, extension = os.path.splitext(file_path)
+    found = {}
+    for path in glob.glob(glob.escape(base) + '.shard-*-of-*' + extension):
+        match = re.search(SHARD_REGEX + re.escape(extension) + '$', path)
+        if match:
+            found[(int(match.group(1)), int(match.group(2)))] = path
+    counts = set(shards for _, shards in found)
+    if len(counts) != 1:
+        raise ValueError("Expected shard files of one shard count for %s, found %s" % (file_path, sorted(found)))
+    shards = counts.pop()
+    missing = [index for index in range(shards) if (index, shards) not in found]
+    if missing:
+        raise ValueError("Shards %s of %d are missing for %s" % (missing, shards, file_path))
+    return [found[(index, shards)] for index in range(shards)]
+
+
+def merge(file_path):
+    '''
+    Merges result files of every shard into result file of whole run, rows keep order of candidates
+    param file_path: path of result file of whole run (.npy, .parquet or text table with header line)
+    raises: value error if shards are missing or tables have different columns
+    returns: count of merged rows
+    '''
+
+    paths = shard_files(file_path)
+    if file_path.endswith(TEXT_EXTENSIONS):
+        header, rows = None, []
+        for path in paths:
+            with open(path) as fin:
+                lines = fin.read().splitlines()
+            if header is not None and lines[:1] != [header]:
+                raise ValueError("Header of %s differs from first shard" % path)
+            header = lines[0] if lines else header
+            rows.extend(lines[1:])
+        with open(file_path, 'w') as fout:
+            fout.write('\n'.join([header] + rows) + '\n')
+        return len(rows)
+
+    tables = [results.load_table(path, mmap=False) for path in paths]
+    if any(table.dtype != tables[0].dtype for table in tables):
+        raise ValueError("Shard tables of %s have different columns" % file_path)
+    table = np.concatenate(tables)
+    results.save_table(table, file_path)
+    return len(table)
+
+
+def parse_arguments():
+    '''Parsing given arguments'''
+
+    parser = argparse.ArgumentParser(description='Merges per-shard result files into result file of whole run')
+    parser.add_argument('files', type=str, nargs='+',
+                        help='Result files of whole run, their NAME.shard-i-of-N files are merged')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    for file_path in args.files:
+        print("%s: %d rows from %d shards" % (file_path, merge(file_path), len(shard_files(file_path))))
+
+if __name__ == '__main__':
+    main()
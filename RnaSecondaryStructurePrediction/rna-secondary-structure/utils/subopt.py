@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#pylint: disable=
+"""
+File            : subopt.py
+Author          : Aurimas Repecka <aurimas.repecka AT gmail dot com>
+Description     : Summaries of suboptimal structures which are streamed from ViennaRNA straight into scoring,
+                  memory does not grow with width of energy band.
+Packages        :   https://www.tbi.univie.ac.at/RNA/#download
+"""
+
+import numpy as np
+
+import scoring
+
+SUBOPT_DELTA = 1.0
+# count of streamed structures scored together
+SUBOPT_BUFFER = 1024
+
+
+class SuboptSummary(object):
+    "Count of suboptimal structures, best accuracy against reference and free energy of best structure"
+
+    def __init__(self, reference, buffer_size=SUBOPT_BUFFER):
+        self.reference = reference.strip()
+        self.buffer_size = buffer_size
+        self.structures = []
+        self.energies = []
+        self.count = 0
+        self.best_accuracy = None
+        self.best_energy = None
+
+    def add(self, structure, energy):
+        '''
+        Adds streamed structure, buffer is scored when it is full
+        param structure: dot-bracket structure
+        param energy: free energy of structure
+        '''
+
+        self.structures.append(structure)
+        self.energies.append(energy)
+        if len(self.structures) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        "Scores buffered structures and keeps only the best one"
+        if not self.structures:
+            return
+        accuracies = scoring.accuracy_batch(self.structures, [self.reference])[:, 0]
+        energies = np.asarray(self.energies)
+        # among equally accurate structures the most stable one is kept
+        best = np.lexsort((energies, -accuracies))[0]
+        if (self.best_accuracy is None or accuracies[best] > self.best_accuracy or
+                (accuracies[best] == self.best_accuracy and energies[best] < self.best_energy)):
+            self.best_accuracy, self.best_energy = float(accuracies[best]), float(energies[best])
+        self.count = self.count + len(self.structures)
+        self.structures = []
+        self.energies = []
+
+    def result(self, mfe):
+        '''
+        Returns summary of every added structure
+        param mfe: minimal free energy of sequence
+        returns: tuple (count of structures, best accuracy, energy of best structure above MFE)
+        '''
+
+        self.flush()
+        if not self.count:
+            return 0, float('nan'), float('nan')
+        return self.count, self.best_accuracy, self.best_energy - mfe
+
+
+def summarize(backend, sequence, reference, delta=SUBOPT_DELTA, buffer_size=SUBOPT_BUFFER):
+    '''
+    Streams suboptimal structures of sequence into summary
+    param backend: folder with fold_subopt method (vienna backend)
+    param sequence: string of sequence
+    param reference: target dot-bracket structure
+    param delta: width of energy band in kcal/mol
+    param buffer_size: count of structures scored together
+    returns: tuple of SuboptSummary.result
+    '''
+
+    summary = SuboptSummary(reference, buffer_size)
+    mfe = backend.fold_subopt(sequence, delta, summary.add)
+    return summary.result(mfe)
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#pylint: disable=
+"""
+File            : vienna_backend.py
+Author          : Aurimas Repecka <aurimas.repecka AT gmail dot com>
+Description     : In-process folding with RNA.fold_compound which emulates CoFold distance penalty.
+Packages        :   https://www.tbi.univie.ac.at/RNA/#download
+                    http://www.e-rna.org/cofold/
+"""
+
+import os
+import math
+
+import RNA
+import numpy as np
+
+import instrumentation
+import results
+
+# Penalty modes: 'bp' adds pseudo energy for every base pair, 'loop' adds share of loop energy in callback,
+# both penalties grow with distance between paired nucleotides
+PENALTY_MODE = 'bp'
+# Reference stacking energy (kcal/mol) scaled by CoFold factor in 'bp' mode
+STACK_ENERGY = -2.0
+DANGLES = 1
+# revision of penalty formulas, part of backend version so folds cached with older penalties are not reused
+PENALTY_REVISION = 2
+PROBABILITY_THRESHOLD = results.PROBABILITY_THRESHOLD
+
+LOADED_PARAMETERS = {'path' : None}
+# energy parameters of every loaded file, fold compounds switch between them without parsing file again
+PARAMETER_SETS = {}
+
+
+def load_parameters(parameters_path):
+    '''
+    Loads energy parameters file once per process
+    param parameters_path: file path of parameters file
+    '''
+
+    if parameters_path is None or LOADED_PARAMETERS['path'] == parameters_path:
+        return
+    if hasattr(RNA, 'params_load'):
+        RNA.params_load(parameters_path)
+    else:
+        RNA.read_parameter_file(parameters_path)
+    LOADED_PARAMETERS['path'] = parameters_path
+
+
+def parameter_set(parameters_path, md):
+    '''
+    Returns energy parameters of file, file is parsed once per process and parameters stay resident
+    param parameters_path: file path of parameters file
+    param md: model details of parameters
+    returns: RNA.param object, None if parameters file is not given or ViennaRNA cannot substitute parameters
+    '''
+
+    if parameters_path is None or not hasattr(RNA, 'param'):
+        return None
+    key = (os.path.abspath(parameters_path), md.dangles, md.uniq_ML)
+    if key not in PARAMETER_SETS:
+        load_parameters(parameters_path)
+        PARAMETER_SETS[key] = RNA.param(md)
+    return PARAMETER_SETS[key]
+
+
+def cofold_factor(distance, alpha, tau):
+    '''
+    CoFold scaling factor of base pair energy
+    param distance: distance between paired nucleotides
+    param alpha: alpha parameter of CoFold
+    param tau: tau parameter of CoFold
+    returns: factor in range [1 - alpha, 1]
+    '''
+
+    if tau <= 0:
+        return 1.0 - alpha
+    return alpha * (math.exp(-distance / tau) - 1.0) + 1.0
+
+
+def sparse_probabilities(bpp, threshold=PROBABILITY_THRESHOLD):
+    '''
+    Keeps base pair probabilities above threshold
+    param bpp: 1-based upper triangular matrix of fold_compound.bpp
+    param threshold: minimal kept probability
+    returns: tuple (uint16 array of i, uint16 array of j, float32 array of probabilities), i < j
+    '''
+
+    probabilities = np.triu(np.asarray(bpp, dtype=np.float64), 1)
+    rows, cols = np.nonzero(probabilities >= threshold)
+    return rows.astype(np.uint16), cols.astype(np.uint16), probabilities[rows, cols].astype(np.float32)
+
+
+class ViennaBackend(object):
+    "Folds sequences in-process with ViennaRNA and CoFold like distance penalty"
+
+    name = 'vienna'
+
+    def __init__(self, alpha, tau, parameters_path, penalty_mode=PENALTY_MODE):
+        self.alpha = alpha
+        self.tau = tau
+        self.parameters_path = parameters_path
+        self.penalty_mode = penalty_mode
+        self.version = 'vienna-%s-%s-%d' % (getattr(RNA, '__version__', 'unknown'), penalty_mode, PENALTY_REVISION)
+        self.penalties = {}
+        self.models = {}
+
+    def model_details(self, uniq_ml=False):
+        '''
+        Returns model details equivalent to CoFold -d1 and their resident parameters
+        param uniq_ml: unique multiloop decomposition, needed by suboptimal structures
+        returns: tuple (RNA.md object, RNA.param object or None)
+        '''
+
+        if uniq_ml not in self.models:
+            md = RNA.md()
+            md.dangles = DANGLES
+            md.uniq_ML = int(uniq_ml)
+            self.models[uniq_ml] = (md, parameter_set(self.parameters_path, md))
+        md, params = self.models[uniq_ml]
+        if params is None:
+            # without resident parameters global parameters are switched, which parses file again
+            load_parameters(self.parameters_path)
+        return md, params
+
+    def bp_penalties(self, length):
+        '''
+        Builds matrix of pseudo energies for every base pair, matrices are reused for the same length
+        param length: length of sequence
+        returns: 1-based matrix of pseudo energies in kcal/mol
+        '''
+
+        if length not in self.penalties:
+            factors = np.array([-STACK_ENERGY * (1.0 - cofold_factor(distance, self.alpha, self.tau))
+                                for distance in range(length + 1)])
+            positions = np.arange(length + 1)
+            distances = positions[np.newaxis, :] - positions[:, np.newaxis]
+            # ViennaRNA takes nested lists, matrix is converted once and reused
+            self.penalties[length] = np.where(distances > 0, factors[np.abs(distances)], 0.0).tolist()
+        return self.penalties[length]
+
+    def add_loop_penalty(self, fc, plain):
+        '''
+        Adds soft constraint callback which penalizes hairpin and interior loops by share of their energy,
+        share grows with distance between paired nucleotides like in 'bp' mode
+        param fc: fold_compound object
+        param plain: fold_compound object of the same sequence without soft constraints, loop energies
+                     evaluated on fc would call callback again
+        '''
+
+        alpha, tau = self.alpha, self.tau
+
+        def loop_penalty(i, j, k, l, decomposition, data):
+            if decomposition == RNA.DECOMP_PAIR_HP:
+                energy = plain.eval_hp_loop(i, j)
+            elif decomposition == RNA.DECOMP_PAIR_IL:
+                energy = plain.eval_int_loop(i, j, k, l)
+            else:
+                return 0
+            return int(round((1.0 - cofold_factor(j - i, alpha, tau)) * abs(energy)))
+
+        fc.sc_add_f(loop_penalty)
+
+    def plain_compound(self, sequence, uniq_ml=False):
+        '''
+        Builds fold compound with resident parameters and without CoFold penalty
+        param sequence: RNA sequence string
+        param uniq_ml: unique multiloop decomposition, needed by suboptimal structures
+        returns: fold_compound object
+        '''
+
+        md, params = self.model_details(uniq_ml)
+        fc = RNA.fold_compound(sequence, md)
+        if params is not None:
+            fc.params_subst(params)
+        return fc
+
+    def compound(self, sequence, penalty_mode=None, uniq_ml=False):
+        '''
+        Builds fold compound with resident parameters and CoFold penalty
+        param sequence: RNA sequence string
+        param penalty_mode: penalty mode, defaults to mode of backend
+        param uniq_ml: unique multiloop decomposition, needed by suboptimal structures
+        returns: fold_compound object
+        '''
+
+        fc = self.plain_compound(sequence, uniq_ml)
+        if self.alpha > 0:
+            if (penalty_mode or self.penalty_mode) == 'loop':
+                self.add_loop_penalty(fc, self.plain_compound(sequence, uniq_ml))
+            else:
+                fc.sc_add_bp(self.bp_penalties(len(sequence)))
+        return fc
+
+    def fold(self, sequence, header=None):
+        '''
+        Folds single sequence
+        param sequence: string of sequence
+        param header: FASTA header of sequence, not used
+        returns: tuple of (dot-bracket structure, minimal free energy)
+        '''
+
+        sequence = sequence.strip().upper().replace('T', 'U')
+        with instrumentation.timer('vienna.fold'):
+            structure, mfe = self.compound(sequence).mfe()
+        return structure, mfe
+
+    def fold_ensemble(self, sequence, reference, threshold=PROBABILITY_THRESHOLD):
+        '''
+        Folds sequence and computes partition function, loop callback has no Boltzmann weights so
+        partition function always uses base pair penalty
+        param sequence: string of sequence
+        param reference: target dot-bracket structure of the same length
+        param threshold: minimal stored base pair probability
+        returns: tuple (dot-bracket structure, minimal free energy, probability of reference, ensemble defect of reference,
+                 sparse base pair probabilities of sparse_probabilities)
+        '''
+
+        sequence = sequence.strip().upper().replace('T', 'U')
+        with instrumentation.timer('vienna.pf'):
+            fc = self.compound(sequence, 'bp')
+            structure, mfe = fc.mfe()
+            # scaling by MFE keeps Boltzmann factors of long sequences in floating point range
+            fc.exp_params_rescale(mfe)
+            fc.pf()
+            probability = fc.pr_structure(reference)
+            defect = fc.ensemble_defect(reference)
+            pairs = sparse_probabilities(fc.bpp(), threshold)
+        return structure, mfe, probability, defect, pairs
+
+    def fold_subopt(self, sequence, delta, callback):
+        '''
+        Streams every structure within energy band above minimal free energy to callback, structures are not stored
+        param sequence: string of sequence
+        param delta: width of energy band in kcal/mol
+        param callback: function called with (dot-bracket structure, free energy) of every structure
+        returns: minimal free energy
+        '''
+
+        sequence = sequence.strip().upper().replace('T', 'U')
+
+        def stream(structure, energy, data):
+            # ViennaRNA calls back with None structure once enumeration is finished
+            if structure:
+                callback(structure, energy)
+
+        with instrumentation.timer('vienna.subopt'):
+            fc = self.compound(sequence, uniq_ml=True)
+            _, mfe = fc.mfe()
+            # subopt band is given in dcal/mol
+            fc.subopt_cb(int(round(delta * 100)), stream, None)
+        return mfe
+
+    def fold_many(self, sequences):
+        '''
+        Folds multiple sequences
+        param sequences: iterable of sequence strings
+        returns: list of tuples (dot-bracket structure, minimal free energy) in order of sequences
+        '''
+
+        return [self.fold(sequence) for sequence in sequences]
+
+    def fold_ensemble_many(self, sequences, reference, threshold=PROBABILITY_THRESHOLD):
+        '''
+        Folds multiple sequences with partition function
+        param sequences: iterable of sequence strings
+        param reference: target dot-bracket structure
+        param threshold: minimal stored base pair probability
+        returns: list of tuples of fold_ensemble in order of sequences
+        '''
+
+        return [self.fold_ensemble(sequence, reference, threshold) for sequence in sequences]
+
+    def close(self):
+        "Nothing to release for in-process backend"
+        pass
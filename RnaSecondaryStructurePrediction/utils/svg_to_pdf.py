@@ -1,13 +1,213 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#pylint: disable=
+"""
+File            : svg_to_pdf.py
+Author          : Aurimas Repecka <aurimas.repecka AT gmail dot com>
+Description     : Converts SVG plots of directory tree into PDF files in process pool.
+Packages        :   https://cairosvg.org/
+                    https://pypi.org/project/pypdf/ (optional, --merge only)
+"""
+
 import os
-import cairosvg
-from IPython import embed
+import json
+import hashlib
+import argparse
+import multiprocessing
 
 INPUT_DIR = '/home/aurimas/test/pdf'
+PDF_DIR = 'pdf'
+MANIFEST_FILE = '.svg_hashes.json'
+CHECKS = ['mtime', 'hash', 'none']
+
+
+def svg_hash(svg_path):
+    '''
+    Calculates sha1 hash of SVG file content
+    param svg_path: path of SVG file
+    returns: hex digest string
+    '''
+
+    with open(svg_path, 'rb') as fin:
+        return hashlib.sha1(fin.read()).hexdigest()
+
+
+def read_manifest(pdf_dir):
+    '''
+    Reads hashes of SVG files which were converted into given PDF directory
+    param pdf_dir: path of PDF directory
+    returns: dictionary of SVG file name to hash
+    '''
+
+    manifest_path = os.path.join(pdf_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as fin:
+        return json.load(fin)
+
+
+def write_manifest(pdf_dir, manifest):
+    '''
+    Writes hashes of converted SVG files
+    param pdf_dir: path of PDF directory
+    param manifest: dictionary of SVG file name to hash
+    '''
+
+    manifest_path = os.path.join(pdf_dir, MANIFEST_FILE)
+    with open(manifest_path + '.tmp', 'w') as fout:
+        json.dump(manifest, fout, indent=1, sort_keys=True)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+
+def merged_path(pdf_dir):
+    '''
+    Returns path of multi-page PDF of directory
+    param pdf_dir: path of PDF directory
+    returns: path of PDF file named after directory
+    '''
+
+    return os.path.join(pdf_dir, os.path.basename(os.path.dirname(os.path.abspath(pdf_dir))) + '.pdf')
+
+
+def walk_svgs(input_dir, check, manifests, merge=False):
+    '''
+    Walks directory tree and yields conversion tasks while walk is still running
+    param input_dir: root directory of SVG files
+    param check: how up to date PDF files are detected - mtime, hash or none
+    param manifests: dictionary of PDF directory to manifest, filled while walking
+    param merge: PDF files are merged, previous conversion is known only if merged PDF exists
+    returns: generator of tuples (SVG path, PDF path, hash of previous conversion, check)
+    '''
+
+    for dirpath, dirnames, filenames in os.walk(input_dir):
+        dirnames[:] = [dirname for dirname in dirnames if dirname != PDF_DIR]
+        svg_names = sorted(filename for filename in filenames if filename.endswith('.svg'))
+        if not svg_names:
+            continue
+
+        pdf_dir = os.path.join(dirpath, PDF_DIR)
+        os.makedirs(pdf_dir, exist_ok=True)
+        manifests[pdf_dir] = read_manifest(pdf_dir) if check == 'hash' else {}
+        if merge and not os.path.exists(merged_path(pdf_dir)):
+            manifests[pdf_dir] = {}
+        for filename in svg_names:
+            pdf_path = os.path.join(pdf_dir, filename[:-4] + '.pdf')
+            known_hash = manifests[pdf_dir].get(filename) if merge or os.path.exists(pdf_path) else None
+            yield (os.path.join(dirpath, filename), pdf_path, known_hash, check)
+
+
+def convert(task):
+    '''
+    Converts single SVG file unless its PDF is up to date, runs in pool process
+    param task: tuple (SVG path, PDF path, hash of previous conversion, check)
+    returns: tuple (SVG path, PDF path, SVG hash or None, True if file was converted)
+    '''
+
+    import cairosvg
+
+    svg_path, pdf_path, known_hash, check = task
+    content_hash = None
+    if check == 'hash':
+        content_hash = svg_hash(svg_path)
+        if content_hash == known_hash:
+            return svg_path, pdf_path, content_hash, False
+    elif check == 'mtime':
+        if os.path.exists(pdf_path) and os.path.getmtime(pdf_path) >= os.path.getmtime(svg_path):
+            return svg_path, pdf_path, content_hash, False
+
+    cairosvg.svg2pdf(url=svg_path, write_to=pdf_path)
+    return svg_path, pdf_path, content_hash, True
+
+
+def merge_directory(pdf_dir, pdf_paths, keep_pages=False):
+    '''
+    Merges PDF files of directory into single multi-page PDF named after directory
+    param pdf_dir: path of PDF directory
+    param pdf_paths: list of PDF paths in page order
+    param keep_pages: keep single page PDF files after merge
+    raises: import error if pypdf is not installed
+    returns: path of merged PDF
+    '''
+
+    from pypdf import PdfWriter
+
+    merged_file = merged_path(pdf_dir)
+    writer = PdfWriter()
+    for pdf_path in pdf_paths:
+        writer.append(pdf_path)
+    with open(merged_file, 'wb') as fout:
+        writer.write(fout)
+    if not keep_pages:
+        for pdf_path in pdf_paths:
+            os.remove(pdf_path)
+    return merged_file
+
+
+def convert_tree(input_dir, jobs=os.cpu_count(), check='mtime', merge=False, keep_pages=False):
+    '''
+    Converts every SVG file of directory tree into pdf subdirectory next to it
+    param input_dir: root directory of SVG files
+    param jobs: count of conversion processes
+    param check: how up to date PDF files are detected - mtime, hash or none
+    param merge: merge PDF files of every directory into single multi-page PDF
+    param keep_pages: keep single page PDF files after merge
+    returns: tuple (count of converted files, count of skipped files)
+    '''
+
+    if merge and check != 'hash':
+        # merged pages are removed, so only hashes can tell that directory is up to date
+        check = 'hash'
+    manifests = {}
+    pages = {}
+    changed_dirs = set()
+    converted, skipped = 0, 0
+    tasks = walk_svgs(input_dir, check, manifests, merge)
+
+    with multiprocessing.Pool(jobs) as pool:
+        # imap consumes walk in feeder thread, so conversion starts before walk finishes
+        for svg_path, pdf_path, content_hash, is_converted in pool.imap_unordered(convert, tasks, chunksize=8):
+            pdf_dir = os.path.dirname(pdf_path)
+            if content_hash is not None:
+                manifests[pdf_dir][os.path.basename(svg_path)] = content_hash
+            pages.setdefault(pdf_dir, []).append((pdf_path, svg_path))
+            if is_converted:
+                converted = converted + 1
+                changed_dirs.add(pdf_dir)
+                print("Converted: %s" % svg_path)
+            else:
+                skipped = skipped + 1
+
+    for pdf_dir, manifest in manifests.items():
+        if merge and pdf_dir in changed_dirs:
+            # pages of unchanged files were removed by previous merge
+            for pdf_path, svg_path in pages[pdf_dir]:
+                if not os.path.exists(pdf_path):
+                    convert((svg_path, pdf_path, None, 'none'))
+            print("Merged: %s" % merge_directory(pdf_dir, sorted(pdf_path for pdf_path, _ in pages[pdf_dir]), keep_pages))
+        if check == 'hash':
+            write_manifest(pdf_dir, manifest)
+
+    print("Converted %d files, skipped %d up to date files" % (converted, skipped))
+    return converted, skipped
+
+
+def parse_arguments():
+    '''Parsing given arguments'''
+
+    parser = argparse.ArgumentParser(description='Converting SVG plots of directory tree into PDF files')
+    parser.add_argument('input_dir', nargs='?', default=INPUT_DIR, help='Root directory of SVG files')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='Count of conversion processes')
+    parser.add_argument('--check', type=str, default='mtime', choices=CHECKS,
+                        help='How up to date PDF files are skipped: by modification time, by SVG content hash or never')
+    parser.add_argument('--merge', action='store_true', default=False,
+                        help='Merge converted PDF files of every directory into single multi-page PDF (requires pypdf)')
+    parser.add_argument('--keep-pages', action='store_true', default=False, help='Keep single page PDF files after merge')
+    return parser.parse_args()
+
 
-for (dirpath, dirnames, filenames) in os.walk(INPUT_DIR):
-    for filename in filenames:
-    	if '.svg' in filename:
-	    	if not os.path.exists(dirpath + '/pdf'):
-	        	os.mkdir(dirpath + '/pdf')
+def main():
+    args = parse_arguments()
+    convert_tree(args.input_dir, args.jobs, args.check, args.merge, args.keep_pages)
 
-	    	cairosvg.svg2pdf(url=dirpath+'/'+filename, write_to=dirpath+'/pdf/'+filename[:-3] + '.pdf')
\ No newline at end of file
+if __name__ == '__main__':
+    main()